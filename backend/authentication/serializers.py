@@ -28,6 +28,7 @@ class ProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = '__all__'
+        read_only_fields = ['resource_count','question_count','reply_count']
 
     def create(self, validated_data):
         user_data = validated_data.pop('user')
@@ -0,0 +1,28 @@
+"""
+Test runner of the project, see TEST_RUNNER in settings.py.
+
+Tests run on the test database of the primary: a local PostgreSQL when DATABASE_URL points
+to one, SQLite otherwise. The replicas are test mirrors of the primary, but a replica
+connection can't see the data of a test transaction, so reads are kept on the primary
+while the tests run (the routing tests turn the replicas back on with override_settings).
+The default and throttle caches are the database caches of the test database, whatever
+CACHE_BACKEND and THROTTLE_CACHE_BACKEND say: their entries are rolled back with each test,
+and the file caches of the server are left alone.
+"""
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self,**kwargs):
+        super().setup_test_environment(**kwargs)
+        self.replicas = settings.DATABASE_REPLICAS
+        settings.DATABASE_REPLICAS = []
+        self.caches = override_settings(CACHES={'default':settings.DEFAULT_CACHES['db'],'throttle':settings.THROTTLE_CACHES['db']})
+        self.caches.enable()
+
+    def teardown_test_environment(self,**kwargs):
+        self.caches.disable()
+        settings.DATABASE_REPLICAS = self.replicas
+        super().teardown_test_environment(**kwargs)
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path,include
 from django.conf import settings
-from django.conf.urls.static import static
+from main.media import serve_media
 
 
 
@@ -11,7 +11,8 @@ urlpatterns = [
     path('authentication/',include('authentication.urls')),
     path('users/',include('users.urls')),
     path('resources/',include('resources.urls')),
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>',serve_media,name='media'),
 
    
 
-]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
@@ -0,0 +1,21 @@
+"""
+URL configuration serving the public read endpoints with async views.
+
+ROOT_URLCONF points here when ASYNC_READ_VIEWS is set. The routes below answer the same
+urls as their sync views with the same responses, through the async ORM, so that an ASGI
+server doesn't hand them to its thread adapter. Every other url is served by bac_hub.urls.
+"""
+from django.urls import path,include
+from main import async_views as main_views
+from resources import async_views as resources_views
+from users import async_views as users_views
+
+
+urlpatterns = [
+    path('subjects/',view=main_views.get_all_subjects),
+    path('resources/all/',view=resources_views.get_all_resources),
+    path('resources/question/subject/<int:subject_id>/',view=resources_views.get_question_by_subject),
+    path('resources/reply/question/<int:question_id>/',view=resources_views.get_replies_by_question),
+    path('users/profile/<int:profile_id>/',view=users_views.get_profile),
+    path('',include('bac_hub.urls')),
+]
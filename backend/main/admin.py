@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Resource,Subject, Profile, Question,Reply,ImageQuestion,ImageReply
+from .models import Resource,Subject, Profile, Question,Reply,ImageQuestion,ImageReply,SubjectField,Tag,ResourceFacet
 
 
 
@@ -10,4 +10,7 @@ admin.site.register(Profile)
 admin.site.register(Question)
 admin.site.register(Reply)
 admin.site.register(ImageQuestion)
-admin.site.register(ImageReply)
\ No newline at end of file
+admin.site.register(ImageReply)
+admin.site.register(SubjectField)
+admin.site.register(Tag)
+admin.site.register(ResourceFacet)
\ No newline at end of file
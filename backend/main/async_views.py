@@ -0,0 +1,17 @@
+"""
+Async variants of the public read endpoints of main.views, routed by bac_hub.urls_async.
+"""
+from .asyncapi import async_api_view
+from .catalogue import subject_catalogue
+from .db_routing import replica_reads
+
+
+@replica_reads
+@async_api_view
+async def get_all_subjects(request):
+    """
+    Endpoint: GET /subjects/
+    Description: Async variant of main.views.get_all_subjects, same response
+    Authentication: Not required
+    """
+    return await subject_catalogue.aby_field()
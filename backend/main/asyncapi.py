@@ -0,0 +1,60 @@
+"""
+Async views for the public read endpoints, see bac_hub.urls_async.
+
+DRF's @api_view only runs sync views, which an ASGI server has to push through its
+thread adapter. async_api_view is the small part of it these read-only endpoints need:
+GET and HEAD only, the returned data rendered by DRF's JSONRenderer (the bytes are the
+same as the ones of the sync views) and the DRF exceptions (ValidationError, NotFound...)
+and Http404 answered with their status and detail like DRF's exception handler does.
+OPTIONS is answered with the metadata DRF's SimpleMetadata gives, the name and
+description of the view and the media types of the default renderers and parsers.
+"""
+from functools import wraps
+from django.http import Http404,HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException,NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils import formatting
+
+
+SAFE_METHODS = ('GET','HEAD')
+ALLOWED_METHODS = SAFE_METHODS+('OPTIONS',)
+
+
+def json_response(data,status_code=status.HTTP_200_OK,headers=None):
+    return HttpResponse(JSONRenderer().render(data),status=status_code,content_type='application/json',headers=headers)
+
+
+def view_metadata(view):
+    #what DRF's SimpleMetadata answers for a function view
+    return {
+        'name' : formatting.camelcase_to_spaces(view.__name__),
+        'description' : formatting.dedent(view.__doc__ or ''),
+        'renders' : [renderer.media_type for renderer in api_settings.DEFAULT_RENDERER_CLASSES],
+        'parses' : [parser.media_type for parser in api_settings.DEFAULT_PARSER_CLASSES],
+    }
+
+
+def async_api_view(view):
+    """
+    Turn an async function returning the data of a 200 response into a view
+    """
+    @wraps(view)
+    async def wrapper(request,*args,**kwargs):
+        if request.method == 'OPTIONS':
+            return json_response(view_metadata(view),headers={'Allow':', '.join(ALLOWED_METHODS)})
+        if request.method not in SAFE_METHODS:
+            return json_response(
+                {'detail':f'Method "{request.method}" not allowed.'},status.HTTP_405_METHOD_NOT_ALLOWED,
+                headers={'Allow':', '.join(ALLOWED_METHODS)}
+            )
+        try:
+            data = await view(request,*args,**kwargs)
+        except Http404 as error:
+            return json_response({'detail':NotFound(*error.args).detail},status.HTTP_404_NOT_FOUND)
+        except APIException as error:
+            detail = error.detail if isinstance(error.detail,(list,dict)) else {'detail':error.detail}
+            return json_response(detail,error.status_code)
+        return json_response(data)
+    return wrapper
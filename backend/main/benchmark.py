@@ -0,0 +1,219 @@
+"""
+Benchmark of the main read endpoints, see the benchmark management command.
+
+Each endpoint is requested through Django's test client (the whole middleware and view
+stack, without a network server) on urls spread over the seeded content, optionally
+from several threads at once. Results hold the latency percentiles, the throughput and
+the query count of every endpoint and can be compared with a previous run.
+compare_views() benchmarks the endpoints having an async variant (see bac_hub.urls_async)
+under the sync and the async URLconf, both through Django's ASGI handler with concurrent
+clients on a single event loop, as an ASGI server would run them.
+"""
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.test import AsyncClient,Client,override_settings
+from .models import Resource,ResourceType,Subject,Question,Reply,Profile,Tag
+from .query_metrics import QUERY_COUNT_HEADER
+
+
+#URLconf of each set of views, the endpoints of ASYNC_ENDPOINTS are served by async views in the second
+URLCONFS = {'sync':'bac_hub.urls','async':'bac_hub.urls_async'}
+ASYNC_ENDPOINTS = ['resources_feed','subjects','questions_subject','reply_thread','profile']
+
+
+def sample_ids(queryset,size=200):
+    #evenly spread, so that two runs on the same dataset request the same urls
+    ids = list(queryset.order_by('id').values_list('id',flat=True))
+    return ids[::max(len(ids)//size,1)][:size] or [0]
+
+
+def endpoint_urls():
+    """
+    {endpoint: function(i) returning the url of its i-th request}
+    """
+    subjects = sample_ids(Subject.objects.all())
+    resources = sample_ids(Resource.objects.all())
+    questions = sample_ids(Question.objects.all())
+    replies = sample_ids(Reply.objects.filter(parent=None))
+    profiles = sample_ids(Profile.objects.all())
+    tags = list(Tag.objects.values_list('name',flat=True)[:20]) or ['bac']
+    types = ResourceType.values
+
+    def pick(ids,i):
+        return ids[i%len(ids)]
+
+    return {
+        'resources_feed' : lambda i: f'/resources/all/?type={pick(types,i)}',
+        'resource_detail' : lambda i: f'/resources/{pick(resources,i)}/',
+        'resources_subject' : lambda i: f'/resources/subject/{pick(subjects,i)}/',
+        'resources_tag' : lambda i: f'/resources/tag/?tag={pick(tags,i)}',
+        'resource_facets' : lambda i: '/resources/facets/',
+        'search' : lambda i: f'/resources/search/?q=resource {i%100}',
+        'subjects' : lambda i: '/subjects/',
+        'questions_subject' : lambda i: f'/resources/question/subject/{pick(subjects,i)}/',
+        'question_detail' : lambda i: f'/resources/question/{pick(questions,i)}/',
+        'reply_thread' : lambda i: f'/resources/reply/question/{pick(questions,i)}/',
+        'reply_subtree' : lambda i: f'/resources/reply/{pick(replies,i)}/',
+        'profile' : lambda i: f'/users/profile/{pick(profiles,i)}/',
+    }
+
+
+def percentile(values,fraction:float):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction*len(ordered))-1,0)]
+
+
+def _get(urls):
+    client = Client()
+    samples = []
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter()-start
+        samples.append((elapsed,response.status_code,int(response.get(QUERY_COUNT_HEADER,0))))
+    return samples
+
+
+async def _aget(client,urls):
+    samples = []
+    for url in urls:
+        start = time.perf_counter()
+        response = await client.get(url)
+        elapsed = time.perf_counter()-start
+        samples.append((elapsed,response.status_code,int(response.get(QUERY_COUNT_HEADER,0))))
+    return samples
+
+
+def _worker(urls):
+    #runs in a thread of its own, which opens its own database connection
+    try:
+        return _get(urls)
+    finally:
+        connections.close_all()
+
+
+def measure(url_for,requests:int,concurrency=1,warmup=0):
+    """
+    Send requests GETs built by url_for from concurrency threads
+    returns the statistics of the endpoint
+    """
+    caches['default'].clear()
+    _get([url_for(i) for i in range(warmup)])
+    urls = [url_for(warmup+i) for i in range(requests)]
+    shares = [urls[worker::concurrency] for worker in range(concurrency)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for share in executor.map(_worker,shares) for sample in share]
+    return summarize(samples,time.perf_counter()-start)
+
+
+def measure_asgi(url_for,requests:int,concurrency=1,warmup=0):
+    """
+    Send requests GETs built by url_for through the ASGI handler, from concurrency clients on one event loop
+    returns the statistics of the endpoint
+    """
+    caches['default'].clear()
+
+    async def main():
+        client = AsyncClient()
+        try:
+            await _aget(client,[url_for(i) for i in range(warmup)])
+            urls = [url_for(warmup+i) for i in range(requests)]
+            shares = [urls[worker::concurrency] for worker in range(concurrency)]
+            start = time.perf_counter()
+            shares = await asyncio.gather(*[_aget(client,share) for share in shares])
+            return [sample for share in shares for sample in share],time.perf_counter()-start
+        finally:
+            #the database is reached from the thread of sync_to_async, its connections are closed there
+            await sync_to_async(connections.close_all)()
+
+    return summarize(*asyncio.run(main()))
+
+
+def summarize(samples,duration:float):
+    latencies = [elapsed*1000 for elapsed,status,queries in samples]
+    queries = [queries for elapsed,status,queries in samples]
+    return {
+        'requests' : len(samples),
+        'errors' : sum(1 for elapsed,status,queries in samples if status >= 400),
+        'p50_ms' : round(percentile(latencies,0.50),2),
+        'p95_ms' : round(percentile(latencies,0.95),2),
+        'p99_ms' : round(percentile(latencies,0.99),2),
+        'mean_ms' : round(sum(latencies)/len(latencies),2),
+        'requests_per_second' : round(len(samples)/duration,1),
+        'queries_mean' : round(sum(queries)/len(queries),2),
+        'queries_max' : max(queries),
+    }
+
+
+def run(endpoints=None,requests=200,concurrency=1,warmup=10):
+    """
+    Benchmark the endpoints (all of them by default), returns {endpoint: statistics}
+    """
+    urls = endpoint_urls()
+    unknown = set(endpoints or [])-set(urls)
+    if unknown:
+        raise ValueError(f'unknown endpoints: {", ".join(sorted(unknown))}')
+    results = {}
+    #the test client sends its requests to the host "testserver"
+    with override_settings(QUERY_METRICS_HEADERS=True,ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS,'testserver']):
+        for endpoint in endpoints or urls:
+            results[endpoint] = measure(urls[endpoint],requests,concurrency,warmup)
+    return results
+
+
+def compare_views(endpoints=None,requests=200,concurrency=10,warmup=10):
+    """
+    Benchmark the endpoints of ASYNC_ENDPOINTS (all of them by default) under each URLconf of URLCONFS
+    returns {"sync": {endpoint: statistics}, "async": {endpoint: statistics}}
+    """
+    urls = endpoint_urls()
+    unknown = set(endpoints or [])-set(ASYNC_ENDPOINTS)
+    if unknown:
+        raise ValueError(f'no async variant for: {", ".join(sorted(unknown))}')
+    results = {}
+    for views,urlconf in URLCONFS.items():
+        with override_settings(
+            ROOT_URLCONF=urlconf,QUERY_METRICS_HEADERS=True,ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS,'testserver']
+        ):
+            results[views] = {
+                endpoint:measure_asgi(urls[endpoint],requests,concurrency,warmup) for endpoint in endpoints or ASYNC_ENDPOINTS
+            }
+    return results
+
+
+def compare(results,baseline,latency_tolerance=0.25,query_tolerance=0):
+    """
+    Regressions of results against the results of a previous run
+    latency_tolerance is the allowed relative increase of p95 and decrease of requests/s,
+    query_tolerance the number of extra queries allowed per request
+    returns a list of messages, empty when nothing regressed
+    """
+    regressions = []
+    for endpoint,stats in results.items():
+        previous = baseline.get(endpoint)
+        if previous is None:
+            continue
+        if stats['p95_ms'] > previous['p95_ms']*(1+latency_tolerance):
+            regressions.append(f'{endpoint}: p95 {previous["p95_ms"]}ms -> {stats["p95_ms"]}ms')
+        if stats['requests_per_second'] < previous['requests_per_second']*(1-latency_tolerance):
+            regressions.append(
+                f'{endpoint}: {previous["requests_per_second"]} -> {stats["requests_per_second"]} requests/s'
+            )
+        if stats['queries_max'] > previous['queries_max']+query_tolerance:
+            regressions.append(f'{endpoint}: {previous["queries_max"]} -> {stats["queries_max"]} queries')
+        if stats['errors'] > previous['errors']:
+            regressions.append(f'{endpoint}: {previous["errors"]} -> {stats["errors"]} errors')
+    return regressions
@@ -0,0 +1,150 @@
+"""
+Response caching for the public list endpoints.
+
+A cached response is stored under its namespace (e.g. "resources_subject"), its scope
+(e.g. the subject id) and the query parameters of the request. Each (namespace,scope)
+pair has a version number that is part of the key, invalidating it only bumps that
+version so the old entries are never read again and simply expire.
+async_cached_response does the same for the async views of bac_hub.urls_async, with the
+same keys: a response cached by a sync view is served by its async variant and back.
+The versions live in the cache, on the primary database, so the data of a response is
+always read from the primary too (see main.db_routing), never from a lagging replica.
+The versions are bumped by the signals of main.signals, and by the writes that send none
+(bulk uploads, image processing, reconcile_counters). The number of reports of the listed
+content is the one field left out: a report doesn't clear the lists, it shows up once
+they expire (RESPONSE_CACHE_TIMEOUT), while content removed by its reports leaves them at once.
+"""
+import hashlib
+import os
+import threading
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import status
+from rest_framework.response import Response
+from .db_routing import primary
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record(namespace:str,event:str):
+    with _stats_lock:
+        _stats[(namespace,event)] += 1
+
+
+def get_stats():
+    """
+    Hits and misses of this process per namespace
+    """
+    with _stats_lock:
+        stats = {}
+        for (namespace,event),count in _stats.items():
+            stats.setdefault(namespace,{'hits':0,'misses':0})[event] = count
+    return {'pid':os.getpid(),'namespaces':stats}
+
+
+def _version_key(namespace:str,scope):
+    return f'response_version_{namespace}_{scope}'
+
+
+def get_version(namespace:str,scope=''):
+    key = _version_key(namespace,scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key,1,timeout=None)
+        version = cache.get(key,1)
+    return version
+
+
+async def aget_version(namespace:str,scope=''):
+    key = _version_key(namespace,scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key,1,timeout=None)
+        version = await cache.aget(key,1)
+    return version
+
+
+def response_key(namespace:str,scope,version,query_params):
+    query = sorted(query_params.lists())
+    raw_key = f'{namespace}:{scope}:{version}:{query}'
+    return 'response_' + hashlib.md5(raw_key.encode()).hexdigest()
+
+
+def invalidate(namespace:str,scope=''):
+    """
+    Drop every cached response of a (namespace,scope)
+    """
+    key = _version_key(namespace,scope)
+    if not cache.add(key,2,timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:   #expired in between
+            cache.add(key,2,timeout=None)
+
+
+def cached_response(namespace:str,scope_kwarg=None):
+    """
+    Cache the data of the 200 responses of a GET view, keyed by the url kwarg scope_kwarg
+    and the query parameters. Has to be placed under @api_view
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request,*args,**kwargs):
+            if request.method != 'GET':
+                return view(request,*args,**kwargs)
+            scope = kwargs.get(scope_kwarg,'') if scope_kwarg else ''
+            key = response_key(namespace,scope,get_version(namespace,scope),request.query_params)
+
+            data = cache.get(key)
+            if data is not None:
+                record(namespace,'hits')
+                return Response(data,status=status.HTTP_200_OK)
+            record(namespace,'misses')
+            #the version was read from the primary, the data has to be too
+            with primary():
+                response = view(request,*args,**kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key,response.data,timeout=settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def async_cached_response(namespace:str,scope_kwarg=None):
+    """
+    cached_response for the async views, has to be placed under @async_api_view
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request,*args,**kwargs):
+            if request.method != 'GET':
+                return await view(request,*args,**kwargs)
+            scope = kwargs.get(scope_kwarg,'') if scope_kwarg else ''
+            key = response_key(namespace,scope,await aget_version(namespace,scope),request.GET)
+
+            data = await cache.aget(key)
+            if data is not None:
+                record(namespace,'hits')
+                return data
+            record(namespace,'misses')
+            #errors are raised, only the data of a 200 response gets here
+            with primary():
+                data = await view(request,*args,**kwargs)
+            await cache.aset(key,data,timeout=settings.RESPONSE_CACHE_TIMEOUT)
+            return data
+        return wrapper
+    return decorator
+
+
+def create_cache_tables(using=DEFAULT_DB_ALIAS,**kwargs):
+    """
+    Create the missing tables of the database caches of settings.CACHES, sent by every migrate
+    so that a new database works without running "manage.py createcachetable"
+    """
+    call_command('createcachetable',database=using,verbosity=0)
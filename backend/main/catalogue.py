@@ -0,0 +1,140 @@
+"""
+In-process catalogue of the subjects.
+
+Subjects are seeded once and barely change, so every process keeps them in memory,
+indexed by id and by field, and answers subject lookups without touching the database.
+The catalogue is loaded on first use and carries a version number shared through the
+default cache: editing a subject bumps it (see main.signals) and every process reloads
+its copy the next time it checks the version, at most every SUBJECT_CATALOGUE_CHECK_INTERVAL seconds.
+The async views check and load it through the async cache and ORM (aby_field).
+It is always loaded from the primary database, never from a read replica.
+"""
+import copy
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from .models import Field,Subject,SubjectField
+
+
+VERSION_KEY = 'subject_catalogue_version'
+
+
+class SubjectCatalogue:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.checked_at = 0
+        self.subjects = {}
+        self.data = {}
+        self.ids_by_field = {}
+
+    def _shared_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY,1,timeout=None)
+            version = cache.get(VERSION_KEY,1)
+        return version
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self.version is not None and now-self.checked_at < settings.SUBJECT_CATALOGUE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            version = self._shared_version()
+            if version != self.version:
+                self._load(version)
+            self.checked_at = now
+
+    async def _ashared_version(self):
+        version = await cache.aget(VERSION_KEY)
+        if version is None:
+            await cache.aadd(VERSION_KEY,1,timeout=None)
+            version = await cache.aget(VERSION_KEY,1)
+        return version
+
+    async def _aensure_loaded(self):
+        #no lock, two concurrent loads of the same version build the same copy
+        now = time.monotonic()
+        if self.version is not None and now-self.checked_at < settings.SUBJECT_CATALOGUE_CHECK_INTERVAL:
+            return
+        version = await self._ashared_version()
+        if version != self.version:
+            subjects = [subject async for subject in Subject.objects.using(DEFAULT_DB_ALIAS).order_by('id')]
+            links = [
+                link async for link in
+                SubjectField.objects.using(DEFAULT_DB_ALIAS).order_by('subject_id').values_list('field','subject_id')
+            ]
+            self._build(version,subjects,links)
+        self.checked_at = now
+
+    def _load(self,version):
+        #read from the primary, a lagging replica would tag an outdated copy with the current version
+        subjects = list(Subject.objects.using(DEFAULT_DB_ALIAS).order_by('id'))
+        links = SubjectField.objects.using(DEFAULT_DB_ALIAS).order_by('subject_id').values_list('field','subject_id')
+        self._build(version,subjects,links)
+
+    def _build(self,version,subjects,links):
+        from .serializers import SubjectSerializer
+        ids_by_field = {field:[] for field in Field}
+        for field,subject_id in links:
+            ids_by_field[field].append(subject_id)
+        self.subjects = {subject.id:subject for subject in subjects}
+        self.data = {subject.id:SubjectSerializer(subject).data for subject in subjects}
+        self.ids_by_field = ids_by_field
+        self.version = version
+
+    def invalidate(self):
+        """
+        Mark every copy of the catalogue as outdated, this process reloads it on the next lookup
+        """
+        if not cache.add(VERSION_KEY,2,timeout=None):
+            try:
+                cache.incr(VERSION_KEY)
+            except ValueError:
+                cache.add(VERSION_KEY,2,timeout=None)
+        self.version = None
+
+    def get(self,subject_id:int):
+        """
+        A copy of the Subject with this id, None if it doesn't exist
+        every caller gets its own instance, changing it leaves the catalogue and the other threads alone
+        """
+        self._ensure_loaded()
+        subject = self.subjects.get(subject_id)
+        return copy.deepcopy(subject) if subject is not None else None
+
+    def get_data(self,subject_id:int):
+        """
+        The serialized subject with this id, None if it doesn't exist
+        """
+        self._ensure_loaded()
+        return self.data.get(subject_id)
+
+    def for_field(self,field:str):
+        """
+        The serialized subjects of a field
+        """
+        self._ensure_loaded()
+        return [self.data[subject_id] for subject_id in self.ids_by_field.get(field,[])]
+
+    def by_field(self):
+        """
+        The serialized subjects grouped by field
+        """
+        self._ensure_loaded()
+        return self._group()
+
+    async def aby_field(self):
+        """
+        by_field for the async views
+        """
+        await self._aensure_loaded()
+        return self._group()
+
+    def _group(self):
+        return {field:[self.data[subject_id] for subject_id in ids] for field,ids in self.ids_by_field.items()}
+
+
+subject_catalogue = SubjectCatalogue()
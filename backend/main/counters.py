@@ -0,0 +1,209 @@
+"""
+Activity counters stored on the rows they describe.
+
+Question.reply_count / last_reply_at, Subject.resource_count / question_count and the
+contribution counts of Profile are incremented and decremented by the signals of
+main.signals, with F() expressions so that concurrent writes are never lost. Reading
+them costs nothing more than reading the row. The rows deleted in cascade are counted
+once per deletion, inside deferred() (see Subject, Question and Reply.delete).
+reconcile() recomputes every counter from the content and fixes the ones that drifted.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime,time
+from django.db import transaction
+from django.db.models import Case,Count,DateTimeField,F,Max,OuterRef,Subquery,Value,When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+_deferred = ContextVar('deferred_counts',default=None)
+
+
+@contextmanager
+def deferred():
+    """
+    Count the deletions of the block once at its end, with one UPDATE per changed row instead of
+    one per deleted row: the replies deleted along with their question or parent reply, the content
+    deleted along with its subject... The counters of rows deleted in the block are left alone.
+    """
+    if _deferred.get() is not None:
+        yield   #counted by the enclosing block
+        return
+    pending = Counter()
+    token = _deferred.set(pending)
+    try:
+        with transaction.atomic(savepoint=False):
+            yield
+            _apply(pending)
+    finally:
+        _deferred.reset(token)
+
+
+def _defer(model:str,field:str,key,removed:int):
+    """
+    Keep a removal for the end of the deferred block, returns False outside of one
+    """
+    pending = _deferred.get()
+    if pending is None:
+        return False
+    if key:
+        pending[(model,field,key)] += removed
+    return True
+
+
+def _apply(pending:Counter):
+    from .models import Subject,Profile
+    rows = {'subject':(Subject,'id'),'profile':(Profile,'user_id')}
+    by_count = {}
+    for (model,field,key),removed in pending.items():
+        if model == 'question':
+            remove_replies(key,removed)
+        else:
+            by_count.setdefault((model,field,removed),[]).append(key)
+    for (model,field,removed),keys in by_count.items():
+        model_class,key_field = rows[model]
+        model_class.objects.filter(**{f'{key_field}__in':keys}).update(**{field:F(field)-removed})
+
+
+def start_of_day(day):
+    #only the date of a reply is known, it stands for the start of that day
+    return timezone.make_aware(datetime.combine(day,time.min))
+
+
+def count_resource(subject_id:int,author_id,delta:int):
+    from .models import Subject,Profile
+    if delta < 0 and _defer('subject','resource_count',subject_id,-delta):
+        _defer('profile','resource_count',author_id,-delta)
+        return
+    with transaction.atomic(savepoint=False):
+        Subject.objects.filter(id=subject_id).update(resource_count=F('resource_count')+delta)
+        if author_id:
+            Profile.objects.filter(user_id=author_id).update(resource_count=F('resource_count')+delta)
+
+
+def count_question(subject_id:int,author_id,delta:int):
+    from .models import Subject,Profile
+    if delta < 0 and _defer('subject','question_count',subject_id,-delta):
+        _defer('profile','question_count',author_id,-delta)
+        return
+    with transaction.atomic(savepoint=False):
+        Subject.objects.filter(id=subject_id).update(question_count=F('question_count')+delta)
+        if author_id:
+            Profile.objects.filter(user_id=author_id).update(question_count=F('question_count')+delta)
+
+
+def count_reply(question_id:int,author_id,delta:int):
+    """
+    a new reply is the latest activity of its question, see remove_replies for the removed ones
+    """
+    from .models import Question,Profile
+    if delta < 0 and _defer('question','reply_count',question_id,-delta):
+        _defer('profile','reply_count',author_id,-delta)
+        return
+    with transaction.atomic(savepoint=False):
+        if delta > 0:
+            Question.objects.filter(id=question_id).update(reply_count=F('reply_count')+delta,last_reply_at=timezone.now())
+        else:
+            remove_replies(question_id,-delta)
+        if author_id:
+            Profile.objects.filter(user_id=author_id).update(reply_count=F('reply_count')+delta)
+
+
+def remove_replies(question_id:int,removed:int):
+    """
+    Count the replies removed from a question, once they are deleted
+    last_reply_at goes back to the latest reply left: it keeps its time if a reply of its day is left,
+    otherwise it becomes the start of the day of the latest reply, and None once no reply is left
+    """
+    from .models import Question,Reply
+    latest = Reply.objects.filter(question=OuterRef('pk')).order_by('-date_posted').values('date_posted')[:1]
+    row = Question.objects.filter(id=question_id).annotate(latest=Subquery(latest)).values_list('last_reply_at','latest').first()
+    if row is None:
+        return   #deleted along with its replies
+    stored,latest = row
+    if latest is None:
+        last_reply_at = None
+    elif stored is not None and timezone.localdate(stored) == latest:
+        last_reply_at = stored
+    else:
+        last_reply_at = start_of_day(latest)
+    Question.objects.filter(id=question_id).update(
+        reply_count=F('reply_count')-removed,
+        #unless a reply was added meanwhile
+        last_reply_at=Case(
+            When(last_reply_at=stored,then=Value(last_reply_at,output_field=DateTimeField())),
+            default=F('last_reply_at'),
+        ),
+    )
+
+
+def child_count(model,foreign_key:str,outer='pk'):
+    """
+    Subquery counting the rows of model whose foreign_key is the outer field of the outer row
+    """
+    rows = model.objects.filter(**{foreign_key:OuterRef(outer)}).order_by().values(foreign_key)
+    return Coalesce(Subquery(rows.annotate(count=Count('id')).values('count')),0)
+
+
+def _fix(queryset,counters:dict,drift:dict,label:str):
+    """
+    Store the actual value of the counters that drifted, counters maps a field to its actual value expression
+    """
+    rows = queryset.annotate(**{f'actual_{field}':value for field,value in counters.items()})
+    stale = []
+    for row in rows.iterator():
+        changed = False
+        for field in counters:
+            stored,actual = getattr(row,field),getattr(row,f'actual_{field}')
+            if stored != actual:
+                drift[(label,row.pk,field)] = (stored,actual)
+                setattr(row,field,actual)
+                changed = True
+        if changed:
+            stale.append(row)
+    queryset.model.objects.bulk_update(stale,list(counters),batch_size=1000)
+
+
+def reconcile(Subject,Question,Reply,Resource,Profile,dry_run=False):
+    """
+    Recompute every counter from the content, see "manage.py reconcile_counters"
+    returns the counters that were wrong, {(model,id,field): (stored,actual)}
+    """
+    drift = {}
+    with transaction.atomic():
+        _fix(Subject.objects.all(),{
+            'resource_count' : child_count(Resource,'subject'),
+            'question_count' : child_count(Question,'subject'),
+        },drift,'subject')
+        _fix(Profile.objects.all(),{
+            'resource_count' : child_count(Resource,'author','user_id'),
+            'question_count' : child_count(Question,'author','user_id'),
+            'reply_count' : child_count(Reply,'author','user_id'),
+        },drift,'profile')
+        _fix(Question.objects.all(),{'reply_count':child_count(Reply,'question')},drift,'question')
+
+        #only the date of a reply is known, a missing or outdated time is set to the start of that day
+        last_dates = dict(
+            Reply.objects.order_by().values('question').annotate(last=Max('date_posted')).values_list('question','last')
+        )
+        stale = []
+        for question in Question.objects.only('id','last_reply_at').iterator():
+            last_date = last_dates.get(question.id)
+            stored = question.last_reply_at
+            if last_date is None and stored is None:
+                continue
+            if last_date is not None and stored is not None and timezone.localdate(stored) == last_date:
+                continue
+            actual = None
+            if last_date is not None:
+                actual = start_of_day(last_date)
+            drift[('question',question.id,'last_reply_at')] = (stored,actual)
+            question.last_reply_at = actual
+            stale.append(question)
+        Question.objects.bulk_update(stale,['last_reply_at'],batch_size=1000)
+
+        if dry_run:
+            transaction.set_rollback(True)
+    return drift
@@ -0,0 +1,102 @@
+"""
+Read replica routing.
+
+Views opt in with @replica_reads: their GET and HEAD requests read from one of the
+DATABASE_REPLICAS aliases, picked at random for the request and kept in a context variable,
+that the threads of sync_to_async copy along. ReplicaRouter sends the reads of the request to
+that replica, all of them, so that a query and its prefetches read the same snapshot. Only
+views that never write are decorated: a GET view that writes, e.g. /initialize_subjects/,
+would compute its writes from rows a lagging replica may not have yet. Every other read, and
+every write, goes to the primary ("default"): other views, management commands and worker
+threads never read from a replica.
+Reads made inside a transaction of the primary, inside a primary() block and reads of the
+database cache tables stay on the primary too. The cached responses and the subject
+catalogue are stored under a version read from the primary: the data they hold is read
+there as well, a lagging replica would store outdated rows under the current version.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS,connections
+
+
+SAFE_METHODS = ('GET','HEAD')
+CACHE_APP_LABEL = 'django_cache'   #app label of the models of the database cache backend
+
+_replica = ContextVar('replica',default=None)
+
+
+@contextmanager
+def read_only():
+    """
+    Let the reads of the block go to one of the replicas, the same one for the whole block
+    """
+    replicas = settings.DATABASE_REPLICAS
+    token = _replica.set(random.choice(replicas) if replicas else None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+@contextmanager
+def primary():
+    """
+    Keep the reads of the block on the primary, e.g. the data of a cached response
+    """
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self,model,**hints):
+        replica = _replica.get()
+        if replica is None:
+            return None
+        if model._meta.app_label == CACHE_APP_LABEL or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica
+
+    def db_for_write(self,model,**hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self,obj1,obj2,**hints):
+        #the replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS,*settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self,db,app_label,model_name=None,**hints):
+        #the replicas get the schema through the replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def replica_reads(view):
+    """
+    Let the GET and HEAD requests of a view that never writes read from a replica
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request,*args,**kwargs):
+            if request.method not in SAFE_METHODS:
+                return await view(request,*args,**kwargs)
+            with read_only():
+                return await view(request,*args,**kwargs)
+        return wrapper
+
+    @wraps(view)
+    def wrapper(request,*args,**kwargs):
+        if request.method not in SAFE_METHODS:
+            return view(request,*args,**kwargs)
+        with read_only():
+            return view(request,*args,**kwargs)
+    return wrapper
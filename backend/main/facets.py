@@ -0,0 +1,107 @@
+"""
+Resource counts per type, subject and field.
+
+The counts live in the ResourceFacet summary table, incremented and decremented by the
+Resource signals of main.signals, so reading them costs one query whatever the size of
+the catalogue. The fields of a resource are read from the database along with the resource,
+not from the subject catalogue, which can lag behind a change of the subject's fields. A subject whose fields change moves its resources between the field counts
+(move_field_facets). rebuild_facets recomputes the whole table from the resources.
+"""
+from django.db.models import Count,F,Q
+
+
+def facet_keys(subject_id:int,resource_type:str,fields):
+    from .models import ResourceFacet
+    keys = [(ResourceFacet.Dimension.TYPE,resource_type),(ResourceFacet.Dimension.SUBJECT,str(subject_id))]
+    keys += [(ResourceFacet.Dimension.FIELD,field) for field in fields]
+    return keys
+
+
+def resource_fields(resource_id:int):
+    """
+    The fields of the subject of a resource, read along with the resource row
+    """
+    from .models import Resource
+    resource = Resource.objects.select_related('subject').only('subject__field').filter(pk=resource_id).first()
+    return list(resource.subject.field) if resource else []
+
+
+def update_facets(subject_id:int,resource_type:str,fields,delta:int):
+    """
+    Add delta to the counts of the type, subject and fields of a resource in one UPDATE
+    """
+    from .models import ResourceFacet
+    keys = facet_keys(subject_id,resource_type,fields)
+    if delta > 0:
+        ResourceFacet.objects.bulk_create(
+            [ResourceFacet(dimension=dimension,key=key) for dimension,key in keys],
+            ignore_conflicts=True
+        )
+    condition = Q()
+    for dimension,key in keys:
+        condition |= Q(dimension=dimension,key=key)
+    ResourceFacet.objects.filter(condition).update(count=F('count')+delta)
+
+
+def move_field_facets(subject_id:int,removed,added):
+    """
+    Move the resources of a subject from the counts of its removed fields to the ones of its added fields
+    """
+    from .models import Resource,ResourceFacet
+    if not (removed or added):
+        return
+    count = Resource.objects.filter(subject_id=subject_id).count()
+    if not count:
+        return
+    ResourceFacet.objects.bulk_create(
+        [ResourceFacet(dimension=ResourceFacet.Dimension.FIELD,key=field) for field in added],
+        ignore_conflicts=True
+    )
+    fields = ResourceFacet.objects.filter(dimension=ResourceFacet.Dimension.FIELD)
+    if added:
+        fields.filter(key__in=added).update(count=F('count')+count)
+    if removed:
+        fields.filter(key__in=removed).update(count=F('count')-count)
+
+
+def count_facets(resources,SubjectField):
+    """
+    Aggregate the counts of a queryset of resources
+    returns {dimension: {key: count}}
+    """
+    subject_counts = {
+        str(row['subject']):row['count']
+        for row in resources.values('subject').annotate(count=Count('id')).order_by()
+    }
+    type_counts = {
+        row['type']:row['count']
+        for row in resources.values('type').annotate(count=Count('id')).order_by()
+    }
+    field_counts = {
+        row['field']:row['count']
+        for row in SubjectField.objects.filter(subject__resources__in=resources)
+        .values('field').annotate(count=Count('subject__resources')).order_by()
+    }
+    return {'type':type_counts,'subject':subject_counts,'field':field_counts}
+
+
+def rebuild_facets(Resource,ResourceFacet,SubjectField):
+    """
+    Recompute the summary table from the resources, see "manage.py rebuild_resource_facets"
+    returns the facets whose count was wrong, {(dimension,key): (stored,actual)}
+    """
+    actual = {
+        (dimension,key):count
+        for dimension,counts in count_facets(Resource.objects.all(),SubjectField).items()
+        for key,count in counts.items()
+    }
+    stored = {(facet.dimension,facet.key):facet.count for facet in ResourceFacet.objects.all()}
+    drift = {
+        facet:(stored.get(facet,0),actual.get(facet,0))
+        for facet in set(actual)|set(stored) if stored.get(facet,0) != actual.get(facet,0)
+    }
+    ResourceFacet.objects.all().delete()
+    ResourceFacet.objects.bulk_create([
+        ResourceFacet(dimension=dimension,key=key,count=count) for (dimension,key),count in actual.items()
+    ])
+    return drift
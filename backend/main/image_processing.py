@@ -0,0 +1,202 @@
+"""
+Background processing of the uploaded question and reply images.
+
+An upload is stored as sent and its row saved with the "pending" status, then the image
+is queued to a pool of IMAGE_WORKERS threads once the transaction commits. A worker
+applies the EXIF orientation, drops every metadata (location, camera...), downscales
+the image to IMAGE_MAX_DIMENSION, stores it in place of the upload, and writes WebP and
+JPEG thumbnails for each of IMAGE_VARIANT_WIDTHS narrower than the image. The dimensions
+and the variant names are then recorded on the row, which becomes "ready". The row is
+written with update(), which sends no signal: the cached lists showing the image are
+cleared here, once it is ready or has failed.
+With IMAGE_PROCESSING_MODE = "sync" the same work is done inline, before the response.
+Images left pending (e.g. by a restart) are processed by "manage.py process_images".
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections,transaction
+from PIL import Image,ImageOps
+from .models import ImageQuestion,ImageStatus
+from .signals import question_images_changed,reply_images_changed
+from .storage import release
+
+
+logger = logging.getLogger(__name__)
+
+ASYNC = 'async'
+SYNC = 'sync'
+VARIANT_FORMATS = {'webp':'WEBP','jpeg':'JPEG'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,thread_name_prefix='images')
+    return _executor
+
+
+#encoding
+def flatten(picture):
+    """
+    RGB copy of a picture, transparent areas on a white background (JPEG has no alpha channel)
+    """
+    if picture.mode == 'RGB':
+        return picture
+    picture = picture.convert('RGBA')
+    background = Image.new('RGB',picture.size,(255,255,255))
+    background.paste(picture,mask=picture.getchannel('A'))
+    return background
+
+
+def encode(picture,image_format:str):
+    """
+    The picture as bytes in image_format, no metadata is written
+    """
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        flatten(picture).save(buffer,'JPEG',quality=settings.IMAGE_JPEG_QUALITY,optimize=True,progressive=True)
+    elif image_format == 'WEBP':
+        picture.save(buffer,'WEBP',quality=settings.IMAGE_WEBP_QUALITY,method=4)
+    else:
+        picture.save(buffer,'PNG',optimize=True)
+    return buffer.getvalue()
+
+
+def has_alpha(picture):
+    return picture.mode in ('RGBA','LA','PA') or (picture.mode == 'P' and 'transparency' in picture.info)
+
+
+def prepare(file):
+    """
+    Read an uploaded image, upright, without metadata and at most IMAGE_MAX_DIMENSION wide or high
+    """
+    with Image.open(file) as source:
+        picture = ImageOps.exif_transpose(source)
+        picture.load()
+    if picture.mode not in ('RGB','RGBA'):
+        picture = picture.convert('RGBA' if has_alpha(picture) else 'RGB')
+    #a copy of the pixels only, the EXIF, ICC and text chunks stay behind
+    picture = Image.frombytes(picture.mode,picture.size,picture.tobytes())
+    picture.thumbnail((settings.IMAGE_MAX_DIMENSION,settings.IMAGE_MAX_DIMENSION),Image.Resampling.LANCZOS)
+    return picture
+
+
+def variant_name(name:str,width:int,extension:str):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'images/variants/{stem}_{width}.{extension}'
+
+
+#processing
+def images_changed(image):
+    #the question lists and reply threads show the status and urls of the images
+    if isinstance(image,ImageQuestion):
+        question_images_changed(image.question_id)
+    else:
+        reply_images_changed(image.reply_id)
+
+
+def process_image(model,image_id:int):
+    """
+    Process one image, see the module docstring
+    returns the new status, None if the image doesn't exist anymore
+    """
+    image = model.objects.filter(id=image_id).first()
+    if image is None:
+        return None
+    storage = image.img.storage
+    written = []
+    try:
+        with image.img.open('rb') as file:
+            picture = prepare(file)
+
+        #the upload is replaced by its cleaned copy, PNG keeps transparency, anything else becomes a JPEG
+        image_format,extension = ('PNG','png') if picture.mode == 'RGBA' else ('JPEG','jpg')
+        stem = os.path.splitext(os.path.basename(image.img.name))[0]
+        name = storage.save(f'images/{stem}.{extension}',ContentFile(encode(picture,image_format)))
+        written.append(name)
+
+        variants = {}
+        for width in sorted(settings.IMAGE_VARIANT_WIDTHS):
+            if width >= picture.width:
+                break
+            resized = picture.resize((width,max(round(picture.height*width/picture.width),1)),Image.Resampling.LANCZOS)
+            for extension,variant_format in VARIANT_FORMATS.items():
+                variant = storage.save(variant_name(name,width,extension),ContentFile(encode(resized,variant_format)))
+                written.append(variant)
+                variants.setdefault(extension,{})[str(width)] = variant
+    except Exception:
+        #storing the files took their references, the ones no other image uses are removed
+        logger.exception('could not process %s %s',model.__name__,image_id)
+        release(written,storage)
+        model.objects.filter(id=image_id).update(status=ImageStatus.FAILED)
+        images_changed(image)
+        return ImageStatus.FAILED
+
+    with transaction.atomic():
+        updated = model.objects.filter(id=image_id,img=image.img.name).update(
+            img=name,width=picture.width,height=picture.height,variants=variants,status=ImageStatus.READY
+        )
+        if not updated:
+            #deleted or replaced while it was being processed
+            release(written,storage)
+            return None
+        release(image.file_names(),storage)
+        images_changed(image)
+    return ImageStatus.READY
+
+
+def _run(model,image_id:int):
+    #runs in a worker thread, which has its own database connection
+    close_old_connections()
+    try:
+        process_image(model,image_id)
+    finally:
+        close_old_connections()
+
+
+def queue_images(model,image_ids):
+    """
+    Process the images once the current transaction commits
+    """
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+    if settings.IMAGE_PROCESSING_MODE == SYNC:
+        transaction.on_commit(lambda: [process_image(model,image_id) for image_id in image_ids])
+        return
+
+    def submit():
+        executor = get_executor()
+        for image_id in image_ids:
+            executor.submit(_run,model,image_id)
+    transaction.on_commit(submit)
+
+
+def variant_urls(image):
+    """
+    {format: {width: url}} of the variants of an image
+    """
+    storage = image.img.storage
+    return {
+        extension:{width:storage.url(name) for width,name in widths.items()}
+        for extension,widths in image.variants.items()
+    }
+
+
+def thumbnail_url(image):
+    """
+    Url of the smallest WebP variant, of the image itself while it has none
+    """
+    widths = image.variants.get('webp') or {}
+    if widths:
+        return image.img.storage.url(widths[min(widths,key=int)])
+    return image.img.url if image.img else None
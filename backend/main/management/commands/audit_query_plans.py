@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand,CommandError
+from main.query_plans import audit
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queryset of every list endpoint and fail if one reads a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans',action='store_true',help='print every plan')
+
+    def handle(self, *args, **options):
+        failures = []
+        for endpoint,plan,scans in audit():
+            if scans:
+                failures.append(endpoint)
+                self.stdout.write(self.style.ERROR(f'{endpoint}: full scan of {", ".join(scans)}'))
+            else:
+                self.stdout.write(f'{endpoint}: ok')
+            if scans or options['verbose_plans']:
+                self.stdout.write(plan)
+        if failures:
+            raise CommandError(f'{len(failures)} endpoints read a whole table')
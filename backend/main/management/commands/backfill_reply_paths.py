@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import Reply
+from main.reply_paths import backfill_paths
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized path and depth of every reply'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size',type=int,default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = backfill_paths(Reply,batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{updated} replies updated'))
@@ -0,0 +1,123 @@
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand,CommandError
+from django.db import connection
+from django.test.utils import setup_databases,teardown_databases
+from main import benchmark
+from main.seed import seed
+
+
+class Command(BaseCommand):
+    help = 'Seed a test database with synthetic content and benchmark the main read endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users',type=int,default=500)
+        parser.add_argument('--subjects',type=int,default=30)
+        parser.add_argument('--resources',type=int,default=20000)
+        parser.add_argument('--questions',type=int,default=2000)
+        parser.add_argument('--replies',type=int,default=15,help='replies per question')
+        parser.add_argument('--reply-depth',type=int,default=8)
+        parser.add_argument('--requests',type=int,default=200,help='requests per endpoint')
+        parser.add_argument('--concurrency',type=int,default=1,help='threads sending the requests')
+        parser.add_argument('--warmup',type=int,default=10,help='requests per endpoint sent before measuring')
+        parser.add_argument('--endpoint',action='append',dest='endpoints',help='only benchmark this endpoint, can be repeated')
+        parser.add_argument('--output',help='where to save the results, benchmarks/<timestamp>.json by default')
+        parser.add_argument('--baseline',help='results of a previous run, the command fails if this run regressed')
+        parser.add_argument('--latency-tolerance',type=float,default=0.25,
+                            help='allowed relative increase of p95 latency and decrease of requests/s')
+        parser.add_argument('--query-tolerance',type=int,default=0,help='allowed extra queries per request')
+        parser.add_argument('--compare-async',action='store_true',
+                            help='benchmark the endpoints having an async variant under the sync and the async views, '
+                                 'through the ASGI handler with --concurrency clients')
+
+    def handle(self, *args, **options):
+        if options['compare_async'] and options['baseline']:
+            raise CommandError('--baseline compares regular runs, it can\'t be used with --compare-async')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        #never seed the real databases, the replicas read the test database of the primary
+        directory = tempfile.mkdtemp()
+        if connection.vendor == 'sqlite':
+            #the in-memory test database locks whole tables, a file lets concurrent clients read while one writes
+            connection.settings_dict['TEST']['NAME'] = str(Path(directory)/'benchmark.sqlite3')
+        old_config = setup_databases(verbosity=0,interactive=False,serialized_aliases=set())
+        try:
+            dataset = {
+                'users' : options['users'],
+                'subjects' : options['subjects'],
+                'resources' : options['resources'],
+                'questions' : options['questions'],
+                'replies_per_question' : options['replies'],
+                'reply_depth' : options['reply_depth'],
+            }
+            start = time.perf_counter()
+            seed(**dataset)
+            self.stdout.write(f'seeded in {time.perf_counter()-start:.1f}s')
+            try:
+                if options['compare_async']:
+                    results = benchmark.compare_views(
+                        options['endpoints'],options['requests'],options['concurrency'],options['warmup']
+                    )
+                else:
+                    results = benchmark.run(
+                        options['endpoints'],options['requests'],options['concurrency'],options['warmup']
+                    )
+            except ValueError as error:
+                raise CommandError(error)
+        finally:
+            teardown_databases(old_config,verbosity=0)
+            shutil.rmtree(directory,ignore_errors=True)
+
+        if options['compare_async']:
+            self.write_comparison(results)
+        else:
+            self.write_table(results)
+
+        output = Path(options['output'] or settings.BASE_DIR/'benchmarks'/f'{time.strftime("%Y%m%d-%H%M%S")}.json')
+        output.parent.mkdir(parents=True,exist_ok=True)
+        with open(output,'w') as file:
+            json.dump({
+                'dataset' : dataset,
+                'requests' : options['requests'],
+                'concurrency' : options['concurrency'],
+                ('views' if options['compare_async'] else 'endpoints') : results,
+            },file,indent=2)
+        self.stdout.write(f'results saved to {output}')
+
+        if baseline is not None:
+            regressions = benchmark.compare(
+                results,baseline['endpoints'],options['latency_tolerance'],options['query_tolerance']
+            )
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'no regression against {options["baseline"]}'))
+
+    def write_table(self,results):
+        self.stdout.write(f'{"endpoint":<20}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>9}{"queries":>9}{"errors":>8}')
+        for endpoint,stats in results.items():
+            self.stdout.write(
+                f'{endpoint:<20}{stats["p50_ms"]:>9}{stats["p95_ms"]:>9}{stats["p99_ms"]:>9}'
+                f'{stats["requests_per_second"]:>9}{stats["queries_max"]:>9}{stats["errors"]:>8}'
+            )
+
+    def write_comparison(self,results):
+        #the sync and async views of each endpoint side by side, then the throughput gained by the async one
+        self.stdout.write(f'{"endpoint":<20}{"views":>6}{"p50":>9}{"p95":>9}{"p99":>9}{"req/s":>9}{"queries":>9}{"errors":>8}')
+        for endpoint in results['sync']:
+            for views in ('sync','async'):
+                stats = results[views][endpoint]
+                self.stdout.write(
+                    f'{endpoint if views == "sync" else "":<20}{views:>6}{stats["p50_ms"]:>9}{stats["p95_ms"]:>9}'
+                    f'{stats["p99_ms"]:>9}{stats["requests_per_second"]:>9}{stats["queries_max"]:>9}{stats["errors"]:>8}'
+                )
+            speedup = results['async'][endpoint]['requests_per_second']/results['sync'][endpoint]['requests_per_second']
+            self.stdout.write(f'{"":<20}{"":>6}  async throughput x{speedup:.2f}')
@@ -0,0 +1,30 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from main.models import ImageQuestion,ImageReply
+from main.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Recount the references of the stored image files and delete the ones no image uses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run',action='store_true',help='only report what would be deleted')
+        parser.add_argument('--min-age',type=int,default=60,
+                            help='minutes, younger files are kept as they may belong to an upload in progress')
+
+    def handle(self, *args, **options):
+        report = collect_garbage(
+            [ImageQuestion,ImageReply],min_age=timedelta(minutes=options['min_age']),dry_run=options['dry_run']
+        )
+        for name,(stored,actual) in sorted(report['recounted'].items()):
+            self.stdout.write(self.style.WARNING(f'{name}: {stored} -> {actual} references'))
+        for name in report['orphaned_blobs']+report['orphaned_files']:
+            self.stdout.write(f'orphaned: {name}')
+        for name in report['missing']:
+            self.stdout.write(self.style.ERROR(f'missing: {name}'))
+        action = 'to free' if options['dry_run'] else 'freed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(report["recounted"])} references recounted, '
+            f'{len(report["orphaned_blobs"])+len(report["orphaned_files"])} orphaned files, '
+            f'{report["freed_bytes"]} bytes {action}'
+        ))
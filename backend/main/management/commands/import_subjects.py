@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from main.subject_import import import_subjects
+
+
+class Command(BaseCommand):
+    help = 'Create and update the subjects from the curriculum CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file',default=None,help='CSV file, main/bac_fields_subjects.csv by default')
+        parser.add_argument('--dry-run',action='store_true',help='only report what would change')
+
+    def handle(self, *args, **options):
+        report = import_subjects(options['file'],dry_run=options['dry_run'])
+        for name in report['created']:
+            self.stdout.write(f'created {name}')
+        for name in report['updated']:
+            self.stdout.write(f'updated {name}')
+        for name in report['missing']:
+            self.stdout.write(self.style.WARNING(f'not in the CSV anymore: {name}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(report["created"])} created, {len(report["updated"])} updated, {report["unchanged"]} unchanged'
+        ))
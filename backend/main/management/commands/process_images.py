@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from main.models import ImageQuestion,ImageReply,ImageStatus
+from main.image_processing import process_image
+
+
+class Command(BaseCommand):
+    help = 'Resize the pending question and reply images and write their thumbnails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed',action='store_true',help='process the images that failed as well')
+
+    def handle(self, *args, **options):
+        statuses = [ImageStatus.PENDING]
+        if options['retry_failed']:
+            statuses.append(ImageStatus.FAILED)
+        for model in (ImageQuestion,ImageReply):
+            results = {}
+            for image_id in list(model.objects.filter(status__in=statuses).values_list('id',flat=True)):
+                status = process_image(model,image_id)
+                results[status] = results.get(status,0)+1
+            ready,failed = results.get(ImageStatus.READY,0),results.get(ImageStatus.FAILED,0)
+            self.stdout.write(f'{model.__name__}: {ready} processed, {failed} failed')
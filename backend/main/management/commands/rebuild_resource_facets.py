@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import Resource,ResourceFacet,SubjectField
+from main.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recompute the resource counts per type, subject and field'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = rebuild_facets(Resource,ResourceFacet,SubjectField)
+        for (dimension,key),(stored,actual) in sorted(drift.items()):
+            self.stdout.write(self.style.WARNING(f'{dimension} {key}: {stored} -> {actual}'))
+        self.stdout.write(self.style.SUCCESS(f'{len(drift)} counts fixed'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from main.models import Subject,Question,Reply,Resource,Profile
+from main.cache import invalidate
+from main.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recompute the activity counters of the subjects, questions and profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run',action='store_true',help='only report the counters that drifted')
+
+    def handle(self, *args, **options):
+        drift = reconcile(Subject,Question,Reply,Resource,Profile,dry_run=options['dry_run'])
+        if not options['dry_run']:
+            #the counters are fixed with bulk_update, which sends no signal, the question lists show them
+            questions = {obj_id for model,obj_id,field in drift if model == 'question'}
+            for subject_id in set(Question.objects.filter(id__in=questions).values_list('subject_id',flat=True)):
+                invalidate('questions_subject',subject_id)
+        for (model,obj_id,field),(stored,actual) in sorted(drift.items(),key=str):
+            self.stdout.write(self.style.WARNING(f'{model} {obj_id} {field}: {stored} -> {actual}'))
+        action = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(f'{len(drift)} counters {action}'))
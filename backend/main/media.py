@@ -0,0 +1,145 @@
+"""
+Serving of the uploaded files under MEDIA_URL.
+
+Files of the content-addressed image storage (see main.storage) are named after the
+SHA-256 of their content: their ETag is the digest, read from the name, and they are
+cached for a year as "immutable". A request whose If-None-Match holds that ETag is
+answered 304 without opening or even looking up the file. Other files get an ETag built
+from their modification time and size and must be revalidated by the client.
+Single byte ranges are supported (206, 416 when outside the file), so browsers can resume
+large downloads. With MEDIA_SERVE_MODE = "x-accel-redirect" (nginx) or "x-sendfile"
+(Apache, lighttpd) the headers are computed here and the front-end server sends the body.
+"""
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse,Http404,HttpResponse,HttpResponseNotModified,StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import parse_etags,quote_etag
+from django.views.decorators.http import require_safe
+from .storage import BLOB_DIRECTORY
+
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+HASHED_NAME = re.compile(rf'^{re.escape(BLOB_DIRECTORY)}/[0-9a-f]{{2}}/(?P<digest>[0-9a-f]{{64}})\.\w+$')
+RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+CHUNK_SIZE = 64*1024
+
+
+def etag_matches(header:str,etag:str):
+    #If-None-Match uses the weak comparison, W/"x" matches "x"
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag in etags or etag in [tag.removeprefix('W/') for tag in etags]
+
+
+def parse_range(header:str,size:int):
+    """
+    (start,end) of a single byte range, both included
+    None when the header should be ignored (absent, malformed, several ranges),
+    False when the range is outside the file
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    if not size:
+        return False
+    start,end = match['start'],match['end']
+    if not start:
+        if not end or int(end) == 0:
+            return False if end else None
+        #the last bytes of the file
+        return max(size-int(end),0),size-1
+    start = int(start)
+    end = min(int(end),size-1) if end else size-1
+    if start >= size or start > end:
+        return False
+    return start,end
+
+
+def read_range(path:str,start:int,length:int):
+    with open(path,'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE,length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def cache_headers(response,etag:str,immutable:bool):
+    response['ETag'] = etag
+    if immutable:
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+@require_safe
+def serve_media(request,path):
+    """
+    Endpoint: GET /media/{path}
+    Description: An uploaded file, see the module docstring for the caching and range headers
+    Authentication: Not required
+    Parameters: path (string) - name of the file in the media storage
+    Response: the file (200), a part of it (206), 304 when the client's copy is current, 416, 404
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT,path)
+    except SuspiciousFileOperation:
+        raise Http404('file not found')
+
+    hashed = HASHED_NAME.match(path)
+    if hashed:
+        #the name is the content, no need to look at the file
+        etag = quote_etag(hashed['digest'])
+        if etag_matches(request.headers.get('If-None-Match'),etag):
+            return cache_headers(HttpResponseNotModified(),etag,immutable=True)
+
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError,NotADirectoryError):
+        raise Http404('file not found')
+    if not os.path.isfile(full_path):
+        raise Http404('file not found')
+    if not hashed:
+        etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        if etag_matches(request.headers.get('If-None-Match'),etag):
+            return cache_headers(HttpResponseNotModified(),etag,immutable=False)
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    mode = settings.MEDIA_SERVE_MODE
+    if mode in (X_ACCEL_REDIRECT,X_SENDFILE):
+        #the front-end server sends the file, ranges included
+        response = HttpResponse(content_type=content_type)
+        if mode == X_ACCEL_REDIRECT:
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX+path
+        else:
+            response['X-Sendfile'] = full_path
+        return cache_headers(response,etag,bool(hashed))
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'),size)
+    #a range is only applied to the version of the file the client has part of
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range != etag:
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is not None:
+        start,end = byte_range
+        response = StreamingHttpResponse(read_range(full_path,start,end-start+1),status=206,content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end-start+1
+    else:
+        response = FileResponse(open(full_path,'rb'),content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    return cache_headers(response,etag,bool(hashed))
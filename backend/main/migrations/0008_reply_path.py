@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:55
+
+from django.db import migrations, models
+
+
+#frozen copy of main.reply_paths as of this migration
+SEGMENT_WIDTH = 10
+
+
+def backfill_reply_paths(apps, schema_editor):
+    Reply = apps.get_model('main', 'Reply')
+    #a parent is always created before its replies, ordering by id computes it first
+    paths = {}
+    stale = []
+    for reply_id, parent_id in Reply.objects.order_by('id').values_list('id', 'parent_id').iterator():
+        parent_path = paths.get(parent_id, '') if parent_id else ''
+        paths[reply_id] = parent_path + str(reply_id).zfill(SEGMENT_WIDTH)
+        depth = len(paths[reply_id])//SEGMENT_WIDTH - 1
+        stale.append(Reply(id=reply_id, path=paths[reply_id], depth=depth))
+    Reply.objects.bulk_update(stale, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_alter_imagequestion_question_alter_imagereply_reply'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_reply_paths, migrations.RunPython.noop),
+    ]
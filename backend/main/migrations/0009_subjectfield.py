@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_subject_fields(apps, schema_editor):
+    Subject = apps.get_model('main', 'Subject')
+    SubjectField = apps.get_model('main', 'SubjectField')
+    links = []
+    for subject in Subject.objects.all():
+        for field in set(subject.field):
+            links.append(SubjectField(subject_id=subject.id, field=field))
+    SubjectField.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_reply_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectField',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('علوم تجريبية', 'علوم تجريبية'), ('رياضيات', 'رياضيات'), ('تقني رياضي', 'تقني رياضي'), ('تسيير و اقتصاد', 'تسيير و اقتصاد'), ('آداب و فلسفة', 'آداب و فلسفة'), ('لغات أجنبية', 'لغات أجنبية')], max_length=21)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='field_links', to='main.subject')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('field', 'subject'), name='unique_subject_field')],
+            },
+        ),
+        migrations.RunPython(copy_subject_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+import re
+
+from django.db import migrations, models
+
+
+def parse_labels(labels):
+    #frozen copy of main.models.parse_labels as of this migration
+    names = [' '.join(label.split()) for label in re.split(r'[,،#\n]', labels or '')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def split_labels(apps, schema_editor):
+    Resource = apps.get_model('main', 'Resource')
+    Tag = apps.get_model('main', 'Tag')
+    names_by_resource = {
+        resource_id: parse_labels(labels)
+        for resource_id, labels in Resource.objects.values_list('id', 'labels')
+    }
+    names = {name for names in names_by_resource.values() for name in names}
+    Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.values_list('name', 'id'))
+    Through = Resource.tags.through
+    Through.objects.bulk_create([
+        Through(resource_id=resource_id, tag_id=tag_ids[name])
+        for resource_id, names in names_by_resource.items() for name in names
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_subjectfield'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='resources', to='main.tag'),
+        ),
+        migrations.RunPython(split_labels, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_resources(apps, schema_editor):
+    #frozen copy of main.facets.rebuild_facets as of this migration
+    Resource = apps.get_model('main', 'Resource')
+    ResourceFacet = apps.get_model('main', 'ResourceFacet')
+    SubjectField = apps.get_model('main', 'SubjectField')
+    counts = [
+        ('type', row['type'], row['count'])
+        for row in Resource.objects.values('type').annotate(count=Count('id')).order_by()
+    ]
+    counts += [
+        ('subject', str(row['subject']), row['count'])
+        for row in Resource.objects.values('subject').annotate(count=Count('id')).order_by()
+    ]
+    counts += [
+        ('field', row['field'], row['count'])
+        for row in SubjectField.objects.filter(subject__resources__isnull=False)
+        .values('field').annotate(count=Count('subject__resources')).order_by()
+    ]
+    ResourceFacet.objects.bulk_create([
+        ResourceFacet(dimension=dimension, key=key, count=count) for dimension, key, count in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_resource_tags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('type', 'type'), ('subject', 'subject'), ('field', 'field')], max_length=10)),
+                ('key', models.CharField(max_length=30)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='unique_resource_facet')],
+            },
+        ),
+        migrations.RunPython(count_resources, migrations.RunPython.noop),
+    ]
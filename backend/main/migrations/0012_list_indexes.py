@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_resourcefacet'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['subject', '-date_posted', '-id'], name='question_subject_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['author', '-date_posted', '-id'], name='question_author_posted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(fields=['question', 'parent'], name='reply_question_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['type', '-created_at', '-id'], name='resource_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['subject', '-created_at', '-id'], name='resource_subject_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='resource_author_created_idx'),
+        ),
+        #login looks users up by email, auth.User can't declare the index itself
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auth_user_email_idx ON auth_user (email)',
+            'DROP INDEX IF EXISTS auth_user_email_idx',
+        ),
+    ]
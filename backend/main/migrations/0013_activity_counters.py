@@ -0,0 +1,84 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:16
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def child_count(model, foreign_key, outer='pk'):
+    rows = model.objects.filter(**{foreign_key: OuterRef(outer)}).order_by().values(foreign_key)
+    return Coalesce(Subquery(rows.annotate(count=Count('id')).values('count')), 0)
+
+
+def count_activity(apps, schema_editor):
+    #frozen copy of main.counters.reconcile as of this migration, every counter starts at 0
+    Subject = apps.get_model('main', 'Subject')
+    Question = apps.get_model('main', 'Question')
+    Reply = apps.get_model('main', 'Reply')
+    Resource = apps.get_model('main', 'Resource')
+    Profile = apps.get_model('main', 'Profile')
+    Subject.objects.update(
+        resource_count=child_count(Resource, 'subject'),
+        question_count=child_count(Question, 'subject'),
+    )
+    Profile.objects.update(
+        resource_count=child_count(Resource, 'author', 'user_id'),
+        question_count=child_count(Question, 'author', 'user_id'),
+        reply_count=child_count(Reply, 'author', 'user_id'),
+    )
+    Question.objects.update(reply_count=child_count(Reply, 'question'))
+    #only the date of a reply is known, it stands for the start of that day
+    last_dates = Reply.objects.order_by().values('question').annotate(last=Max('date_posted')).values_list('question', 'last')
+    Question.objects.bulk_update([
+        Question(id=question_id, last_reply_at=timezone.make_aware(datetime.combine(last_date, time.min)))
+        for question_id, last_date in last_dates
+    ], ['last_reply_at'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='resource_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='last_reply_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='question_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='resource_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_activity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagequestion',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagequestion',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='imagequestion',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='imagequestion',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagereply',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagereply',
+            name='status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='imagereply',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='imagereply',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
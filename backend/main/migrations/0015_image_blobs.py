@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:22
+
+import main.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_image_processing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='imagequestion',
+            name='img',
+            field=models.ImageField(storage=main.storage.image_storage, upload_to='images/'),
+        ),
+        migrations.AlterField(
+            model_name='imagereply',
+            name='img',
+            field=models.ImageField(storage=main.storage.image_storage, upload_to='images/'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_image_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppliedReportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=32, unique=True)),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_applied_report_batches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='referenced_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
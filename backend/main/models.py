@@ -1,6 +1,13 @@
-from django.db import models
+import re
+from django.db import models,transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 from multiselectfield import MultiSelectField
+from .reply_paths import build_path,path_depth,PATH_END,MAX_PATH_LENGTH
+from . import counters
+from .facets import move_field_facets
+from .storage import image_storage
 
 #fields enum
 class Field(models.TextChoices):
@@ -13,6 +20,38 @@ class Field(models.TextChoices):
 
 
 
+#reports
+REPORTS_THRESHOLD = 5   #content is removed once it gets more reports than this
+
+def apply_report(model,obj_id:int):
+    """
+    Add a report to a Resource, Question or Reply without loading it
+    the increment is done by the database so concurrent reports are never lost,
+    and the threshold is checked in the same transaction while the row is still locked
+    returns the new number of reports, 0 if the content got removed, None if it doesn't exist
+    """
+    with transaction.atomic():
+        updated = model.objects.filter(id=obj_id).update(reports=F('reports')+1)
+        if not updated:
+            return None
+        reports = model.objects.filter(id=obj_id).values_list('reports',flat=True).get()
+        if reports > REPORTS_THRESHOLD:
+            with counters.deferred():
+                model.objects.filter(id=obj_id).delete()
+            return 0
+    return reports
+
+
+#a batch of buffered reports already applied, recorded in the transaction applying it, see resources.reporting
+class AppliedReportBatch(models.Model):
+    batch_id = models.CharField(max_length=32,unique=True)
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'reports batch {self.batch_id}'
+
+
+
 #profile
 class Profile(models.Model):
     user = models.OneToOneField(User,on_delete=models.CASCADE)
@@ -20,6 +59,10 @@ class Profile(models.Model):
     city = models.CharField(max_length=30,null=True,blank=True)
     school_name = models.CharField(max_length=30,null=True,blank=True)
     xp = models.IntegerField(default=0)
+    #contributions, maintained by main.counters
+    resource_count = models.IntegerField(default=0)
+    question_count = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0)
 
 
     def __str__(self):
@@ -32,9 +75,54 @@ class Subject(models.Model):
     name = models.CharField(max_length=30)
     field = MultiSelectField(max_length=100,choices=Field.choices)
     coefficient = models.IntegerField()
+    #maintained by main.counters
+    resource_count = models.IntegerField(default=0)
+    question_count = models.IntegerField(default=0)
+
+    def save(self,*args,**kwargs):
+        created = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        super().save(*args,**kwargs)
+        #saving the name or the counters leaves the links alone
+        if created or update_fields is None or 'field' in update_fields:
+            self.sync_field_links(created)
+
+    def delete(self,*args,**kwargs):
+        #its resources and questions are counted once per author, see main.counters.deferred
+        with counters.deferred():
+            return super().delete(*args,**kwargs)
+
+    def sync_field_links(self,created=False):
+        """
+        Keep the indexed SubjectField rows in line with the fields of the subject
+        a subject being created has no links yet, they are not read
+        """
+        fields = set(self.field)
+        links = SubjectField.objects.filter(subject=self)
+        existing = set() if created else set(links.values_list('field',flat=True))
+        removed,added = existing-fields,fields-existing
+        if removed:
+            links.filter(field__in=removed).delete()
+        if added:
+            SubjectField.objects.bulk_create([SubjectField(subject=self,field=field) for field in added])
+        move_field_facets(self.id,removed,added)
 
     def __str__(self):
         return f'{self.name} - {self.field}'
+
+
+#subject - field link, indexed copy of Subject.field used to filter by field
+class SubjectField(models.Model):
+    subject = models.ForeignKey(Subject,on_delete=models.CASCADE,related_name='field_links')
+    field = models.CharField(max_length=21,choices=Field.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['field','subject'],name='unique_subject_field'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject.name} - {self.field}'
     
 
 #resource type enum
@@ -46,6 +134,22 @@ class ResourceType(models.TextChoices):
     EXAM = 'EXAM','EXAM'
 
 
+#tag of a resource, indexed copy of the comma separated Resource.labels
+class Tag(models.Model):
+    name = models.CharField(max_length=100,unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+def parse_labels(labels:str):
+    """
+    Helper function to split the free text labels of a resource into tag names
+    """
+    names = [' '.join(label.split()) for label in re.split(r'[,،#\n]',labels or '')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
 #resources model
 class Resource(models.Model):
     author = models.ForeignKey(User,on_delete=models.SET_NULL,null=True,blank=True,related_name='resources')
@@ -58,20 +162,61 @@ class Resource(models.Model):
     additional_link = models.URLField(null=True,blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     reports = models.IntegerField(default=0)
+    tags = models.ManyToManyField(Tag,blank=True,related_name='resources')
 
+    def save(self,*args,**kwargs):
+        super().save(*args,**kwargs)
+        self.sync_tags()
 
-    def add_report(self):   #reporting an unwanted content
-        self.reports+=1
-        if self.reports > 5:
-            self.delete()
-            return 0
-        return self.reports
+    def sync_tags(self):
+        """
+        Link the resource to the tags of its labels, creating the missing ones
+        """
+        names = parse_labels(self.labels)
+        if set(self.tags.values_list('name',flat=True)) == set(names):
+            return
+        Tag.objects.bulk_create([Tag(name=name) for name in names],ignore_conflicts=True)
+        self.tags.set(Tag.objects.filter(name__in=names))
+
+
+    @classmethod
+    def add_report(cls,obj_id:int):   #reporting an unwanted content
+        return apply_report(cls,obj_id)
 
     def __str__(self):
         return f'{self.name} - {self.subject} - {self.created_at}'
+
+    class Meta:
+        #matched to the filters and ordering of the resource list endpoints
+        indexes = [
+            models.Index(fields=['type','-created_at','-id'],name='resource_type_created_idx'),
+            models.Index(fields=['subject','-created_at','-id'],name='resource_subject_created_idx'),
+            models.Index(fields=['author','-created_at','-id'],name='resource_author_created_idx'),
+        ]
+    
     
+
+#number of resources per type, subject and field, maintained by main.facets
+class ResourceFacet(models.Model):
+    class Dimension(models.TextChoices):
+        TYPE = 'type','type'
+        SUBJECT = 'subject','subject'
+        FIELD = 'field','field'
+
+    dimension = models.CharField(max_length=10,choices=Dimension.choices)
+    key = models.CharField(max_length=30)   #resource type, subject id or field
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension','key'],name='unique_resource_facet'),
+        ]
+
+    def __str__(self):
+        return f'{self.dimension} {self.key}: {self.count}'
     
 
+
 #question model
 class Question(models.Model):
     author = models.ForeignKey(User,on_delete=models.SET_NULL,null=True,blank=True,related_name='questions')
@@ -79,22 +224,70 @@ class Question(models.Model):
     content = models.TextField()
     date_posted = models.DateField(auto_now_add=True)
     reports = models.IntegerField(default=0)
+    #replies at any depth and time of the latest one, maintained by main.counters
+    reply_count = models.IntegerField(default=0)
+    last_reply_at = models.DateTimeField(null=True,blank=True)
 
+    def delete(self,*args,**kwargs):
+        #its replies are counted once per author, see main.counters.deferred
+        with counters.deferred():
+            return super().delete(*args,**kwargs)
 
-    def add_report(self):   #reporting an unwanted content
-        self.reports+=1
-        if self.reports > 5:
-            self.delete()
-            return 0
-        return self.reports
+    @classmethod
+    def add_report(cls,obj_id:int):   #reporting an unwanted content
+        return apply_report(cls,obj_id)
 
     def __str__(self):
         return f'question by : {self.author} - {self.subject} - {self.date_posted}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject','-date_posted','-id'],name='question_subject_posted_idx'),
+            models.Index(fields=['author','-date_posted','-id'],name='question_author_posted_idx'),
+        ]
     
 
+#uploaded images, resized and stripped of their metadata in the background by main.image_processing
+class ImageStatus(models.TextChoices):
+    PENDING = 'pending','pending'
+    READY = 'ready','ready'
+    FAILED = 'failed','failed'
+
+
+class ProcessedImage(models.Model):
+    width = models.PositiveIntegerField(null=True,blank=True)
+    height = models.PositiveIntegerField(null=True,blank=True)
+    variants = models.JSONField(default=dict,blank=True)   #{format: {width: file name}}
+    status = models.CharField(max_length=10,choices=ImageStatus.choices,default=ImageStatus.PENDING)
+
+    def file_names(self):
+        """
+        Every file of the image, the upload and its variants
+        """
+        names = [self.img.name] if self.img else []
+        names += [name for widths in self.variants.values() for name in widths.values()]
+        return names
+
+    class Meta:
+        abstract = True
+
+
+#a file of the image storage, stored once whatever the number of images using it, see main.storage
+class ImageBlob(models.Model):
+    digest = models.CharField(max_length=64,unique=True)   #SHA-256 of the content
+    name = models.CharField(max_length=255,unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)   #images using it as their upload or as a variant
+    created_at = models.DateTimeField(auto_now_add=True)
+    referenced_at = models.DateTimeField(default=timezone.now)   #last time it was stored for a row
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount} references)'
+
+
 #images of a question
-class ImageQuestion(models.Model):
-    img = models.ImageField(upload_to='images/')
+class ImageQuestion(ProcessedImage):
+    img = models.ImageField(upload_to='images/',storage=image_storage)
     question = models.ForeignKey(Question,on_delete=models.CASCADE,related_name='images')
 
 
@@ -107,25 +300,65 @@ class Reply(models.Model):
     content = models.TextField()
     date_posted = models.DateField(auto_now_add=True)
     reports = models.IntegerField(default=0)
+    path = models.CharField(max_length=MAX_PATH_LENGTH,db_index=True,editable=False,default='')   #materialized path, see main.reply_paths
+    depth = models.PositiveIntegerField(default=0,editable=False)
 
-    def add_report(self):   #reporting an unwanted content
-        self.reports+=1
-        if self.reports > 5:
-            self.delete()
-            return 0
-        return self.reports
+    def save(self,*args,**kwargs):
+        creating = self._state.adding
+        #the path needs the id, so it's set right after the insert, in the same transaction:
+        #no reply is ever committed without its path
+        with transaction.atomic(savepoint=False):
+            super().save(*args,**kwargs)
+            if creating and self.parent_id and not self.parent.path:
+                #the parent is waiting for "manage.py backfill_reply_paths", so does its reply,
+                #a path made without the parent's would put the reply at the root
+                return
+            if creating:
+                parent_path = self.parent.path if self.parent_id else ''
+                self.path = build_path(parent_path,self.id)
+                self.depth = path_depth(self.path)
+                Reply.objects.filter(id=self.id).update(path=self.path,depth=self.depth)
+
+    def get_subtree(self,max_depth=None,include_self=True):
+        """
+        All the replies under this one with a single range query on the path index
+        max_depth limits how many levels below this reply are returned
+        """
+        if not self.path:
+            raise ValueError('reply paths are missing, run "manage.py backfill_reply_paths"')
+        subtree = Reply.objects.filter(path__gte=self.path,path__lt=self.path+PATH_END)
+        if max_depth is not None:
+            subtree = subtree.filter(depth__lte=self.depth+max_depth)
+        if not include_self:
+            subtree = subtree.exclude(id=self.id)
+        return subtree
+
+    def delete(self,*args,**kwargs):
+        #remove the whole subtree at once instead of walking the parent FK level by level,
+        #and count it once, see main.counters.deferred
+        with counters.deferred():
+            if self.path:
+                return self.get_subtree().delete()
+            return super().delete(*args,**kwargs)
+
+    @classmethod
+    def add_report(cls,obj_id:int):   #reporting an unwanted content
+        return apply_report(cls,obj_id)
     
     def __str__(self):
         return f'Reply by {self.author} - {self.date_posted}'
     
     class Meta:
         verbose_name_plural = 'Replies'
+        indexes = [
+            models.Index(fields=['question','parent'],name='reply_question_parent_idx'),
+        ]
 
 
 
 #images of a reply
-class ImageReply(models.Model):
-    img = models.ImageField(upload_to='images/')
+class ImageReply(ProcessedImage):
+    img = models.ImageField(upload_to='images/',storage=image_storage)
     reply = models.ForeignKey(Reply,on_delete=models.CASCADE,related_name='images')
     
 
@@ -0,0 +1,143 @@
+"""
+SQL query count and database time of every request.
+
+QueryMetricsMiddleware counts the queries a request runs along with the time spent
+waiting on them. The counter of the request lives in a context variable read by an
+execute wrapper installed on every connection when it opens: async views reach the
+database from the threads of sync_to_async, which copy the context of the request and
+use connections of their own, their queries are counted all the same. With
+QUERY_METRICS_HEADERS (on in DEBUG) the numbers are sent back in the X-DB-Query-Count
+and X-DB-Time-Ms response headers, otherwise they are aggregated per route in this
+process, along with the queries sent to each database alias (primary and replicas), and
+served by the admin endpoint metrics/queries/.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction,markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+QUERY_COUNT_HEADER = 'X-DB-Query-Count'
+DB_TIME_HEADER = 'X-DB-Time-Ms'
+
+_stats = {}
+_stats_lock = threading.Lock()
+_counter = ContextVar('query_counter',default=None)
+
+
+class QueryCounter:
+    """
+    Execute wrapper counting the queries run through a connection, in total and per database alias
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.by_alias = Counter()
+
+    def __call__(self,execute,sql,params,many,context):
+        start = time.perf_counter()
+        try:
+            return execute(sql,params,many,context)
+        finally:
+            self.duration += time.perf_counter()-start
+            self.count += 1
+            self.by_alias[context['connection'].alias] += 1
+
+
+def count_query(execute,sql,params,many,context):
+    #installed on every connection, counts for the request being served if any
+    counter = _counter.get()
+    if counter is None:
+        return execute(sql,params,many,context)
+    return counter(execute,sql,params,many,context)
+
+
+def install_counter(sender,connection,**kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+connection_created.connect(install_counter)
+for connection in connections.all(initialized_only=True):
+    install_counter(None,connection)
+
+
+def record(route:str,count:int,duration:float,by_alias=None):
+    with _stats_lock:
+        stats = _stats.setdefault(route,{'requests':0,'queries':0,'max_queries':0,'db_time_ms':0.0,'databases':Counter()})
+        stats['requests'] += 1
+        stats['queries'] += count
+        stats['databases'].update(by_alias or {})
+        stats['max_queries'] = max(stats['max_queries'],count)
+        stats['db_time_ms'] += duration*1000
+
+
+def get_stats():
+    """
+    Requests, queries and database time of this process per route
+    """
+    with _stats_lock:
+        routes = {
+            route:{
+                **stats,
+                'databases' : dict(stats['databases']),
+                'db_time_ms' : round(stats['db_time_ms'],2),
+                'avg_queries' : round(stats['queries']/stats['requests'],2),
+            }
+            for route,stats in _stats.items()
+        }
+    return {'pid':os.getpid(),'routes':routes}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def route_of(request):
+    match = getattr(request,'resolver_match',None)
+    route = match.route if match else request.path
+    return f'{request.method} /{route.lstrip("/")}'
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self,get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self,request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self.report(request,response,counter)
+
+    async def __acall__(self,request):
+        counter = QueryCounter()
+        token = _counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _counter.reset(token)
+        return self.report(request,response,counter)
+
+    def report(self,request,response,counter):
+        if settings.QUERY_METRICS_HEADERS:
+            response[QUERY_COUNT_HEADER] = str(counter.count)
+            response[DB_TIME_HEADER] = f'{counter.duration*1000:.2f}'
+        else:
+            record(route_of(request),counter.count,counter.duration,counter.by_alias)
+        return response
@@ -0,0 +1,86 @@
+"""
+Query plan audit of the list endpoints.
+
+Each entry is the queryset an endpoint runs for its filter and ordering, built with the
+helpers of the views themselves (read_feed_parameters, cursor_queryset, question_list,
+thread_queryset...) so that the audit follows the views when they change. audit() asks
+the database for the plan of each one and flags the plans that read a whole table
+instead of going through an index. Listings that are unfiltered by design (all
+profiles, tag counts, the facets summary table) are not part of it.
+"""
+import re
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+from resources.pagination import DEFAULT_PAGE_SIZE,cursor_queryset,encode_cursor
+from resources.threads import thread_queryset
+from resources.views import NEWEST_FIRST,question_list,read_feed_parameters,tagged_resources
+from .reply_paths import path_segment
+from .models import Profile,Resource,Question,Reply,ImageQuestion,ImageReply,SubjectField,Field,ResourceType
+
+
+def feed_page(**params):
+    #the query of GET /resources/all/ for these query parameters
+    queryset,resource_type,cursor,limit = read_feed_parameters(RequestFactory().get('/resources/all/',params))
+    return cursor_queryset(queryset.filter(type=resource_type),cursor,limit)
+
+
+def endpoint_querysets():
+    """
+    (endpoint,queryset) pairs, filtered on the first row found for each parameter
+    """
+    resource = Resource.objects.order_by('id').first()
+    question = Question.objects.order_by('id').first()
+    reply = Reply.objects.order_by('id').first()
+    subject_id = resource.subject_id if resource else 1
+    author_id = resource.author_id if resource and resource.author_id else 1
+    question_id = question.id if question else 1
+    reply_id = reply.id if reply else 1
+    subtree = (reply or Reply(id=1,path=path_segment(1))).get_subtree()
+    cursor = encode_cursor(resource.created_at if resource else timezone.now(),resource.id if resource else 1)
+    question_cursor = encode_cursor(question.date_posted if question else timezone.localdate(),question_id)
+
+    return [
+        ('GET /resources/all/?type=',feed_page(type=ResourceType.EXAM)),
+        ('GET /resources/all/?type=&cursor=',feed_page(type=ResourceType.EXAM,cursor=cursor)),
+        ('GET /resources/all/?type=&field=',feed_page(type=ResourceType.EXAM,field=Field.MATHEMATICS)),
+        ('GET /resources/<id>/',Resource.objects.filter(id=resource.id if resource else 1)),
+        ('GET /resources/author/<id>/',Resource.objects.filter(author=author_id).order_by(*NEWEST_FIRST)),
+        ('GET /resources/subject/<id>/',Resource.objects.filter(subject=subject_id).order_by(*NEWEST_FIRST)),
+        ('GET /resources/tag/?tag=',cursor_queryset(tagged_resources(['tag']),None,DEFAULT_PAGE_SIZE)),
+        ('GET /resources/question/subject/<id>/',
+            cursor_queryset(question_list(Question.objects.filter(subject=subject_id)),None,DEFAULT_PAGE_SIZE,'date_posted')),
+        ('GET /resources/question/subject/<id>/?cursor=',
+            cursor_queryset(question_list(Question.objects.filter(subject=subject_id)),question_cursor,DEFAULT_PAGE_SIZE,'date_posted')),
+        ('GET /resources/question/author/<id>/',
+            cursor_queryset(question_list(Question.objects.filter(author=author_id)),None,DEFAULT_PAGE_SIZE,'date_posted')),
+        ('GET /resources/reply/question/<id>/',thread_queryset(question_id)),
+        ('GET /resources/reply/<id>/',subtree.order_by('path')),
+        ('GET /resources/question/images/<id>/view/',ImageQuestion.objects.filter(question=question_id)),
+        ('GET /resources/reply/images/<id>/view/',ImageReply.objects.filter(reply=reply_id)),
+        ('GET /subjects/field/?field=',SubjectField.objects.filter(field=Field.MATHEMATICS)),
+        ('GET /users/profile/<id>/',Profile.objects.filter(id=1)),
+        ('POST /authentication/login/',User.objects.filter(email='user@example.com')),
+    ]
+
+
+def full_scans(plan:str):
+    """
+    Tables read in full according to a SQLite or PostgreSQL plan
+    """
+    if connection.vendor == 'postgresql':
+        return re.findall(r'Seq Scan on (\w+)',plan)
+    #sqlite: "SCAN table" reads every row, "SEARCH table USING INDEX" doesn't
+    return [table for table,using in re.findall(r'\bSCAN (\w+)( USING (?:COVERING )?INDEX)?',plan) if not using]
+
+
+def audit():
+    """
+    returns [(endpoint,plan,[tables read in full])]
+    """
+    results = []
+    for endpoint,queryset in endpoint_querysets():
+        plan = queryset.explain()
+        results.append((endpoint,plan,full_scans(plan)))
+    return results
@@ -0,0 +1,55 @@
+"""
+Materialized path helpers for threaded replies.
+
+Each reply stores the zero padded ids of its ancestors followed by its own id,
+so a whole subtree is a contiguous range of the indexed path column:
+    path >= reply.path and path < reply.path + PATH_END
+"""
+
+#number of digits of each path segment
+SEGMENT_WIDTH = 10
+#length of the path column, a reply can be nested MAX_DEPTH levels below a reply to the question
+MAX_PATH_LENGTH = 500
+MAX_DEPTH = MAX_PATH_LENGTH//SEGMENT_WIDTH - 1
+#greater than any digit, closes the range of a subtree
+PATH_END = ':'
+
+
+def path_segment(reply_id:int):
+    return str(reply_id).zfill(SEGMENT_WIDTH)
+
+
+def build_path(parent_path:str,reply_id:int):
+    return parent_path + path_segment(reply_id)
+
+
+def path_depth(path:str):
+    return len(path)//SEGMENT_WIDTH - 1
+
+
+def compute_paths(rows):
+    """
+    Helper function to compute the path of every reply from (id,parent_id) pairs
+    rows have to be ordered by id, a parent is always created before its replies
+    returns a dict {id: path}
+    """
+    paths = {}
+    for reply_id,parent_id in rows:
+        parent_path = paths.get(parent_id,'') if parent_id else ''
+        paths[reply_id] = build_path(parent_path,reply_id)
+    return paths
+
+
+def backfill_paths(Reply,batch_size=1000):
+    """
+    Recompute and store the path and depth of every reply, see "manage.py backfill_reply_paths"
+    returns the number of replies whose path changed
+    """
+    rows = Reply.objects.order_by('id').values_list('id','parent_id')
+    paths = compute_paths(rows.iterator())
+    stale = []
+    for reply_id,path in Reply.objects.values_list('id','path').iterator():
+        if paths[reply_id] != path:
+            stale.append(Reply(id=reply_id,path=paths[reply_id],depth=path_depth(paths[reply_id])))
+    Reply.objects.bulk_update(stale,['path','depth'],batch_size=batch_size)
+    return len(stale)
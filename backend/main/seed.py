@@ -0,0 +1,134 @@
+"""
+Synthetic content for the query budget tests and the benchmarks.
+
+seed() fills the database with users of every field, subjects, resources, questions,
+reply threads several levels deep and image rows, in realistic proportions. The image
+rows point to file names only, nothing is written to MEDIA_ROOT. The content is
+generated from a fixed random seed so two runs with the same arguments produce the same
+data.
+Rows are inserted with bulk_create, which sends no signal: the tags, reply paths,
+resource facets, activity counters and search index are rebuilt at the end, and the
+response cache has to be cleared by the caller.
+"""
+import random
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from .catalogue import subject_catalogue
+from .counters import reconcile
+from .facets import rebuild_facets
+from .models import (User,Profile,Subject,SubjectField,Field,Tag,Resource,ResourceFacet,ResourceType,
+                     Question,Reply,ImageQuestion,ImageReply,parse_labels)
+from .reply_paths import backfill_paths
+
+
+SEED_PASSWORD = 'seed-password'
+LABELS = ['bac','exam','summary','lesson','exercise','solution','chapter 1','chapter 2','تمارين','ملخص']
+BATCH_SIZE = 1000
+
+
+def reply_tree(rng,size:int,max_depth:int):
+    """
+    Shape of a thread, the (parent index or None, depth) of each of its replies
+    most replies answer one of the latest ones, which builds long chains
+    """
+    nodes = []
+    for j in range(size):
+        candidates = [index for index,(parent,depth) in enumerate(nodes) if depth < max_depth]
+        if candidates and rng.random() < 0.7:
+            parent = rng.choice(candidates[-3:])
+            nodes.append((parent,nodes[parent][1]+1))
+        else:
+            nodes.append((None,0))
+    return nodes
+
+
+@transaction.atomic
+def seed(users=10,subjects=5,resources=100,questions=20,replies_per_question=6,reply_depth=4,
+         images_per_post=2,random_seed=0):
+    """
+    Create the content, returns {"users": [...], "subjects": [...], "resources": [...], "questions": [...], "replies": [...]}
+    replies are listed thread by thread, every user's password is SEED_PASSWORD
+    """
+    rng = random.Random(random_seed)
+    password = make_password(SEED_PASSWORD)   #hashed once, hashing is slow on purpose
+    fields = list(Field.values)
+
+    created_users = User.objects.bulk_create([
+        User(username=f'seed_{random_seed}_{i}',email=f'seed_{random_seed}_{i}@example.com',password=password,
+             first_name='seed',last_name=str(i))
+        for i in range(users)
+    ],batch_size=BATCH_SIZE)
+    Profile.objects.bulk_create([
+        Profile(user=user,field=fields[i%len(fields)],city='Alger',school_name='lycee')
+        for i,user in enumerate(created_users)
+    ],batch_size=BATCH_SIZE)
+
+    #few rows, saved one by one so that their field links are written
+    created_subjects = [
+        Subject.objects.create(name=f'subject {i}:{i%7+1}',field=rng.sample(fields,2),coefficient=i%7+1)
+        for i in range(subjects)
+    ]
+
+    created_resources = Resource.objects.bulk_create([
+        Resource(
+            author=rng.choice(created_users),
+            name=f'resource {i}',
+            description=f'description of resource {i}',
+            subject=rng.choice(created_subjects),
+            type=rng.choice(ResourceType.values),
+            labels=','.join(rng.sample(LABELS,3)),
+            link=f'https://example.com/resources/{random_seed}/{i}',
+        )
+        for i in range(resources)
+    ],batch_size=BATCH_SIZE)
+    Tag.objects.bulk_create([Tag(name=name) for name in parse_labels(','.join(LABELS))],ignore_conflicts=True)
+    tag_ids = dict(Tag.objects.values_list('name','id'))
+    Resource.tags.through.objects.bulk_create([
+        Resource.tags.through(resource_id=resource.id,tag_id=tag_ids[name])
+        for resource in created_resources for name in parse_labels(resource.labels)
+    ],batch_size=BATCH_SIZE)
+
+    created_questions = Question.objects.bulk_create([
+        Question(author=rng.choice(created_users),subject=rng.choice(created_subjects),content=f'question {i}')
+        for i in range(questions)
+    ],batch_size=BATCH_SIZE)
+    ImageQuestion.objects.bulk_create([
+        ImageQuestion(question=question,img=f'images/seed_question_{question.id}_{j}.jpg')
+        for question in created_questions for j in range(images_per_post)
+    ],batch_size=BATCH_SIZE)
+
+    #replies are inserted level by level, a reply needs the id of its parent
+    threads = [(question,reply_tree(rng,replies_per_question,reply_depth)) for question in created_questions]
+    replies = {}
+    for level in range(reply_depth+1):
+        batch = []
+        for i,(question,nodes) in enumerate(threads):
+            for j,(parent,depth) in enumerate(nodes):
+                if depth == level:
+                    replies[(i,j)] = Reply(
+                        question=question,parent=replies[(i,parent)] if parent is not None else None,
+                        author=rng.choice(created_users),content=f'reply {j} to question {question.id}'
+                    )
+                    batch.append(replies[(i,j)])
+        Reply.objects.bulk_create(batch,batch_size=BATCH_SIZE)
+    created_replies = [replies[(i,j)] for i,(question,nodes) in enumerate(threads) for j in range(len(nodes))]
+    ImageReply.objects.bulk_create([
+        ImageReply(reply=replies[(i,j)],img=f'images/seed_reply_{replies[(i,j)].id}.jpg')
+        for i,(question,nodes) in enumerate(threads) for j in range(min(images_per_post,len(nodes)))
+    ],batch_size=BATCH_SIZE)
+
+    #derived data kept up to date by save() and the signals
+    backfill_paths(Reply,batch_size=BATCH_SIZE)
+    rebuild_facets(Resource,ResourceFacet,SubjectField)
+    reconcile(Subject,Question,Reply,Resource,Profile)
+    from resources.search import rebuild_index
+    rebuild_index()
+    transaction.on_commit(subject_catalogue.invalidate)
+
+    return {
+        'users' : created_users,
+        'subjects' : created_subjects,
+        'resources' : created_resources,
+        'questions' : created_questions,
+        'replies' : created_replies,
+    }
@@ -1,14 +1,76 @@
+from django.db import IntegrityError,transaction
 from rest_framework import serializers
 from .models import Subject
 
 
+class UpdatedFieldsMixin:
+    """
+    Save only the fields set by an update, so that the counters the database keeps up to date
+    (reply_count, reports...) are never written back from the copy of the row the view loaded
+    """
+    def update(self, instance, validated_data):
+        for attr,value in validated_data.items():
+            setattr(instance,attr,value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+
 class SubjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subject
-        fields = '__all__'
+        #the activity counters change all the time, they are left out of the cached catalogue data
+        fields = ['id','name','field','coefficient']
 
     def update(self, instance, validated_data):   #prevent the user to change the field
         instance.name = validated_data.get('name', instance.name)
         instance.coef = validated_data.get('coef', instance.coef)
-        instance.save()
-        return instance
\ No newline at end of file
+        instance.save(update_fields=['name'])   #leaves the counters alone
+        return instance
+
+
+class CatalogueSubjectField(serializers.PrimaryKeyRelatedField):
+    """
+    Subject foreign key validated against the in-process catalogue instead of the database
+    """
+    def to_internal_value(self, data):
+        from .catalogue import subject_catalogue
+        if isinstance(data,bool):
+            self.fail('incorrect_type',data_type=type(data).__name__)
+        try:
+            subject_id = int(data)
+        except (TypeError,ValueError):
+            self.fail('incorrect_type',data_type=type(data).__name__)
+        subject = subject_catalogue.get(subject_id)
+        if subject is None:
+            self.fail('does_not_exist',pk_value=data)
+        return subject
+
+
+class CatalogueSubjectMixin:
+    """
+    The subject of a write is only validated against the catalogue, without a query. The catalogue
+    may still hold a subject deleted since it was loaded: the foreign key constraint refuses the
+    write then, and the refusal is answered like an unknown subject
+    """
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except IntegrityError:
+            self.check_subject(validated_data)
+            raise
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except IntegrityError:
+            self.check_subject(validated_data)
+            raise
+
+    def check_subject(self, validated_data):
+        #inside a transaction the constraint is only checked on commit, and nothing can be read after an error
+        subject = validated_data.get('subject')
+        if subject is None or transaction.get_connection().in_atomic_block:
+            return
+        if not Subject.objects.filter(id=subject.id).exists():
+            message = self.fields['subject'].error_messages['does_not_exist'].format(pk_value=subject.id)
+            raise serializers.ValidationError({'subject':[message]})
@@ -0,0 +1,160 @@
+from django.db.models.signals import pre_save,post_save,pre_delete,post_delete
+from django.dispatch import receiver
+from django.db.models import QuerySet
+from .models import Subject,SubjectField,Resource,Question,Reply,ImageQuestion,ImageReply
+from .cache import invalidate
+from .catalogue import subject_catalogue
+from .facets import resource_fields,update_facets
+from . import counters
+from .storage import release
+
+
+#subjects
+@receiver([post_save,post_delete],sender=Subject)
+@receiver([post_save,post_delete],sender=SubjectField)
+def invalidate_subjects(sender,instance,**kwargs):
+    subject_catalogue.invalidate()
+
+
+#resources
+@receiver(pre_save,sender=Resource)
+def remember_resource_subject(sender,instance,**kwargs):
+    #the subject and type of a resource can be changed, the old subject's list and counts have to be updated too
+    previous = None
+    if instance.pk:
+        previous = Resource.objects.select_related('subject').only('subject','type','subject__field').filter(pk=instance.pk).first()
+    instance._previous_subject_id,instance._previous_type = (previous.subject_id,previous.type) if previous else (None,None)
+    instance._previous_fields = list(previous.subject.field) if previous else []
+
+
+@receiver([post_save,post_delete],sender=Resource)
+def invalidate_resources(sender,instance,**kwargs):
+    invalidate('resources_all')
+    invalidate('resources_subject',instance.subject_id)
+    previous_subject_id = getattr(instance,'_previous_subject_id',None)
+    if previous_subject_id and previous_subject_id != instance.subject_id:
+        invalidate('resources_subject',previous_subject_id)
+
+
+#questions
+@receiver([post_save,post_delete],sender=Question)
+def invalidate_questions(sender,instance,**kwargs):
+    invalidate('questions_subject',instance.subject_id)
+
+
+def question_images_changed(question_id:int):
+    #also called by the bulk uploads, which send no signal
+    subject_id = Question.objects.filter(pk=question_id).values_list('subject_id',flat=True).first()
+    if subject_id:
+        invalidate('questions_subject',subject_id)
+
+
+def deleted_with_parent(sender,origin):
+    #images deleted along with their question or reply, whose own signals clear the lists
+    origin_model = origin.model if isinstance(origin,QuerySet) else type(origin)
+    return origin is not None and origin_model is not sender
+
+
+@receiver([post_save,post_delete],sender=ImageQuestion)
+def invalidate_question_images(sender,instance,origin=None,**kwargs):
+    if not deleted_with_parent(sender,origin):
+        question_images_changed(instance.question_id)
+
+
+#image files, shared by every image with the same content, storing them took their references
+@receiver(post_delete,sender=ImageQuestion)
+@receiver(post_delete,sender=ImageReply)
+def release_image_files(sender,instance,**kwargs):
+    #also the images deleted with their question or reply, the files are removed after the commit
+    release(instance.file_names(),instance.img.storage)
+
+
+#replies
+@receiver([post_save,post_delete],sender=Reply)
+def invalidate_replies(sender,instance,**kwargs):
+    invalidate('replies_question',instance.question_id)
+
+
+@receiver([post_save,post_delete],sender=Reply)
+def invalidate_question_activity(sender,instance,created=True,**kwargs):
+    #the question lists show the reply count and latest activity, editing a reply changes neither
+    if not created:
+        return
+    subject_id = Question.objects.filter(pk=instance.question_id).values_list('subject_id',flat=True).first()
+    if subject_id:
+        invalidate('questions_subject',subject_id)
+
+
+def reply_images_changed(reply_id:int):
+    #also called by the bulk uploads, which send no signal
+    question_id = Reply.objects.filter(pk=reply_id).values_list('question_id',flat=True).first()
+    if question_id:
+        invalidate('replies_question',question_id)
+
+
+@receiver([post_save,post_delete],sender=ImageReply)
+def invalidate_reply_images(sender,instance,origin=None,**kwargs):
+    if not deleted_with_parent(sender,origin):
+        reply_images_changed(instance.reply_id)
+
+
+#resource facets
+@receiver(post_save,sender=Resource)
+def count_resource(sender,instance,created,**kwargs):
+    #the fields come from the subject row in the database, the subject catalogue can be stale
+    previous = (getattr(instance,'_previous_subject_id',None),getattr(instance,'_previous_type',None))
+    if created or previous[0] is None:
+        update_facets(instance.subject_id,instance.type,resource_fields(instance.pk),1)
+    elif previous != (instance.subject_id,instance.type):
+        previous_fields = instance._previous_fields
+        update_facets(previous[0],previous[1],previous_fields,-1)
+        fields = previous_fields if previous[0] == instance.subject_id else resource_fields(instance.pk)
+        update_facets(instance.subject_id,instance.type,fields,1)
+
+
+@receiver(pre_delete,sender=Resource)
+def remember_resource_fields(sender,instance,**kwargs):
+    instance._fields = resource_fields(instance.pk)
+
+
+@receiver(post_delete,sender=Resource)
+def uncount_resource(sender,instance,**kwargs):
+    update_facets(instance.subject_id,instance.type,getattr(instance,'_fields',[]),-1)
+
+
+#activity counters
+@receiver(post_save,sender=Resource)
+def count_subject_resource(sender,instance,created,**kwargs):
+    previous_subject_id = getattr(instance,'_previous_subject_id',None)
+    if created:
+        counters.count_resource(instance.subject_id,instance.author_id,1)
+    elif previous_subject_id and previous_subject_id != instance.subject_id:
+        counters.count_resource(previous_subject_id,None,-1)
+        counters.count_resource(instance.subject_id,None,1)
+
+
+@receiver(post_delete,sender=Resource)
+def uncount_subject_resource(sender,instance,**kwargs):
+    counters.count_resource(instance.subject_id,instance.author_id,-1)
+
+
+@receiver(post_save,sender=Question)
+def count_subject_question(sender,instance,created,**kwargs):
+    if created:
+        counters.count_question(instance.subject_id,instance.author_id,1)
+
+
+@receiver(post_delete,sender=Question)
+def uncount_subject_question(sender,instance,**kwargs):
+    counters.count_question(instance.subject_id,instance.author_id,-1)
+
+
+@receiver(post_save,sender=Reply)
+def count_question_reply(sender,instance,created,**kwargs):
+    if created:
+        counters.count_reply(instance.question_id,instance.author_id,1)
+
+
+@receiver(post_delete,sender=Reply)
+def uncount_question_reply(sender,instance,**kwargs):
+    counters.count_reply(instance.question_id,instance.author_id,-1)
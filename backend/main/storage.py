@@ -0,0 +1,223 @@
+"""
+Content-addressed storage of the question and reply images.
+
+The same screenshot is often uploaded by many students. ContentAddressedStorage hashes
+each file it is given (SHA-256, read chunk by chunk) and stores it once, as
+images/blobs/<2 first digits>/<digest>.<extension>: saving a file whose content is
+already stored writes nothing and returns the existing name. Each stored file has an
+ImageBlob row counting the image rows that use it, as their upload or as one of their
+variants. Storing a file takes the reference of the row about to use it, release() is
+called when a row stops using files (and when the row storing them is never saved).
+Releases wait for the transaction to commit and are then applied by a worker thread, off
+the request path (MEDIA_CLEANUP_MODE = "sync" applies them on commit instead): a file is
+deleted when the last row using it is.
+Files no row uses anymore (an upload whose row was never saved, a processing that
+failed halfway...) are left behind, "manage.py gc_images" reports and removes them.
+"""
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage,storages
+from django.db import close_old_connections,transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+BLOB_DIRECTORY = 'images/blobs'
+IMAGE_DIRECTORY = 'images'
+ASYNC = 'async'
+SYNC = 'sync'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def image_storage():
+    #referenced by the image fields, the backend is set by STORAGES["images"]
+    return storages['images']
+
+
+def file_digest(content):
+    """
+    SHA-256 of a file and its size, the file is read in chunks and never loaded whole
+    """
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in content.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    return digest.hexdigest(),size
+
+
+def blob_name(digest:str,extension:str):
+    return f'{BLOB_DIRECTORY}/{digest[:2]}/{digest}{extension}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self,name,max_length=None):
+        #the name only gives the extension, _save names the file after its content
+        return name
+
+    def _save(self,name,content):
+        """
+        Store the file once per content and take a reference to it for the row about to use it,
+        in the same transaction as the blob is looked up: a release can't delete it in between
+        """
+        from .models import ImageBlob
+        digest,size = file_digest(content)
+        with transaction.atomic(savepoint=False):
+            #locked, a release of the same blob waits for this reference, or deleted it along with its file
+            blob = ImageBlob.objects.select_for_update().filter(digest=digest).first()
+            if blob is not None and self.exists(blob.name):
+                name = blob.name
+            else:
+                name = blob.name if blob is not None else blob_name(digest,os.path.splitext(name)[1].lower())
+                #written under a unique name then renamed, a concurrent upload of the same file never sees it half written
+                temporary = super()._save(f'{BLOB_DIRECTORY}/tmp/{uuid.uuid4().hex}',content)
+                os.makedirs(os.path.dirname(self.path(name)),exist_ok=True)
+                os.replace(self.path(temporary),self.path(name))
+                #a concurrent upload of the same file may have created it already, its reference is added to the same row
+                ImageBlob.objects.bulk_create([ImageBlob(digest=digest,name=name,size=size)],ignore_conflicts=True)
+            ImageBlob.objects.filter(digest=digest).update(refcount=F('refcount')+1,referenced_at=timezone.now())
+        return name
+
+
+#references
+def release(names,storage=None):
+    """
+    Count one reference less to each of the files once the current transaction commits,
+    the ones no row uses anymore are then deleted, see the cleanup queue below
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    storage = storage or image_storage()
+
+    def submit():
+        if settings.MEDIA_CLEANUP_MODE == SYNC:
+            release_now(names,storage)
+        else:
+            get_executor().submit(_run,names,storage)
+    transaction.on_commit(submit)
+
+
+def release_now(names,storage):
+    """
+    Count one reference less to each of the files and delete the ones no row uses anymore
+    files stored before the content-addressed storage have no ImageBlob, they belonged to a single row
+    and are deleted with it
+    """
+    from .models import ImageBlob
+    with transaction.atomic():
+        by_count = {}
+        for name,count in Counter(names).items():
+            by_count.setdefault(count,[]).append(name)
+        for count,grouped in by_count.items():
+            ImageBlob.objects.filter(name__in=grouped).update(refcount=F('refcount')-count)
+        refcounts = dict(ImageBlob.objects.filter(name__in=set(names)).values_list('name','refcount'))
+        unused = [name for name,refcount in refcounts.items() if refcount <= 0]
+        if unused:
+            ImageBlob.objects.filter(name__in=unused,refcount__lte=0).delete()
+        unused += [name for name in set(names) if name not in refcounts and not name.startswith(BLOB_DIRECTORY+'/')]
+        #deleted before the commit, while the blobs are locked: an upload of the same content waiting
+        #for them stores the file again instead of reusing one about to be deleted
+        for name in unused:
+            storage.delete(name)
+
+
+#cleanup queue, the files of deleted images are removed by a worker thread after the response
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1,thread_name_prefix='media-cleanup')
+    return _executor
+
+
+def _run(names,storage):
+    #runs in the worker thread, which has its own database connection
+    close_old_connections()
+    try:
+        release_now(names,storage)
+    except Exception:
+        #the references are recounted by "manage.py gc_images"
+        logger.exception('could not release %s',', '.join(names))
+    finally:
+        close_old_connections()
+
+
+#garbage collection
+def walk(storage,directory:str):
+    """
+    Names of every file under a directory of the storage
+    """
+    if not storage.exists(directory):
+        return
+    directories,files = storage.listdir(directory)
+    for file in files:
+        yield f'{directory}/{file}'
+    for subdirectory in directories:
+        yield from walk(storage,f'{directory}/{subdirectory}')
+
+
+def collect_garbage(image_models,min_age=timedelta(hours=1),dry_run=False):
+    """
+    Recount the references of every blob from the image rows, then delete the blobs and files
+    no row uses that were stored more than min_age ago (younger ones may belong to an upload in progress)
+    returns {"recounted": {name: (stored,actual)}, "orphaned_blobs": [...], "orphaned_files": [...],
+             "missing": [...], "freed_bytes": int}
+    """
+    from .models import ImageBlob
+    storage = image_storage()
+    deadline = timezone.now()-min_age
+    report = {'recounted':{},'orphaned_blobs':[],'orphaned_files':[],'missing':[],'freed_bytes':0}
+    with transaction.atomic():
+        #the blobs are locked before the rows are counted, an upload storing one waits for the recount
+        blobs = {blob.name:blob for blob in ImageBlob.objects.select_for_update().iterator()}
+        referenced = Counter()
+        for model in image_models:
+            for name,variants in model.objects.values_list('img','variants').iterator():
+                if name:
+                    referenced[name] += 1
+                for widths in (variants or {}).values():
+                    referenced.update(widths.values())
+
+        stale = []
+        for name,blob in blobs.items():
+            #a blob stored lately may hold the reference of a row not saved yet
+            recent = blob.referenced_at >= deadline
+            if blob.refcount != referenced[name] and not (recent and blob.refcount > referenced[name]):
+                report['recounted'][name] = (blob.refcount,referenced[name])
+                blob.refcount = referenced[name]
+                stale.append(blob)
+            if not blob.refcount and not recent:
+                report['orphaned_blobs'].append(name)
+                report['freed_bytes'] += blob.size
+        if not dry_run:
+            ImageBlob.objects.bulk_update(stale,['refcount'],batch_size=1000)
+            ImageBlob.objects.filter(name__in=report['orphaned_blobs']).delete()
+
+    orphaned_blobs = set(report['orphaned_blobs'])
+    for name in walk(storage,IMAGE_DIRECTORY):
+        if name in orphaned_blobs:
+            orphan = True
+        elif name in referenced or name in blobs:
+            orphan = False
+        elif storage.get_modified_time(name) < deadline:
+            orphan = True
+            report['orphaned_files'].append(name)
+            report['freed_bytes'] += storage.size(name)
+        else:
+            orphan = False
+        if orphan and not dry_run:
+            storage.delete(name)
+    report['missing'] = sorted(name for name in referenced if not storage.exists(name))
+    return report
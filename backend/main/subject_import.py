@@ -0,0 +1,102 @@
+"""
+Subjects import from the curriculum CSV (main/bac_fields_subjects.csv).
+
+The CSV has one row per subject and one column per field holding the coefficient of the
+subject in that field. Fields sharing a coefficient become a single Subject named
+"<subject>:<coefficient>". The import diffs the CSV against the existing subjects and
+applies the changes in bulk within the transaction that read them, so running it again is a no-op.
+"""
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from .db_routing import primary
+from .facets import move_field_facets
+from .models import Field,Subject,SubjectField
+
+
+SUBJECT_COLUMN = 'المادة'
+FIELD_ORDER = {field:index for index,field in enumerate(Field.values)}
+
+
+def default_csv_path():
+    return settings.BASE_DIR/'main/bac_fields_subjects.csv'
+
+
+def subject_name(name:str,coefficient:int):
+    return f'{name}:{coefficient}'
+
+
+def read_curriculum(file_path):
+    """
+    Parse the CSV into {(subject,coefficient): [fields]}
+    """
+    df = pd.read_csv(file_path,encoding='utf-8-sig')
+    field_columns = [field for field in Field.values if field in df.columns]
+    rows = df.melt(id_vars=SUBJECT_COLUMN,value_vars=field_columns,var_name='field',value_name='coefficient')
+    rows = rows.dropna(subset=['coefficient'])
+    rows['coefficient'] = rows['coefficient'].astype(int)
+    rows[SUBJECT_COLUMN] = rows[SUBJECT_COLUMN].str.strip()
+    grouped = rows.groupby([SUBJECT_COLUMN,'coefficient'])['field'].agg(
+        lambda fields: sorted(fields,key=FIELD_ORDER.get)
+    )
+    return grouped.to_dict()
+
+
+def existing_key(subject:Subject):
+    #names are "<subject>:<coefficient>", older imports may have stored the coefficient as a float
+    name = subject.name.rsplit(':',1)[0]
+    return name,subject.coefficient
+
+
+def import_subjects(file_path=None,dry_run=False):
+    """
+    Create and update the subjects so that they match the CSV
+    subjects that are not in the CSV anymore are only reported, deleting them would delete their content
+    returns {"created": [...], "updated": [...], "unchanged": n, "missing": [...]}
+    """
+    curriculum = read_curriculum(file_path or default_csv_path())
+    #the subjects are read in the transaction that writes the diff, on the primary: read from a lagging
+    #replica, the subjects of a previous import would be missing and created again
+    with primary(),transaction.atomic():
+        existing = {existing_key(subject):subject for subject in Subject.objects.all()}
+
+        to_create,to_update = [],[]
+        previous_fields = {}
+        unchanged = 0
+        for (name,coefficient),fields in curriculum.items():
+            subject = existing.get((name,coefficient))
+            if subject is None:
+                to_create.append(Subject(name=subject_name(name,coefficient),field=fields,coefficient=coefficient))
+            elif list(subject.field) != fields or subject.name != subject_name(name,coefficient):
+                previous_fields[subject.id] = set(subject.field)
+                subject.name = subject_name(name,coefficient)
+                subject.field = fields
+                to_update.append(subject)
+            else:
+                unchanged += 1
+        missing = [subject.name for key,subject in existing.items() if key not in curriculum]
+
+        report = {
+            'created' : [subject.name for subject in to_create],
+            'updated' : [subject.name for subject in to_update],
+            'unchanged' : unchanged,
+            'missing' : missing,
+        }
+        if dry_run or not (to_create or to_update):
+            return report
+
+        #bulk operations skip Subject.save, the field links are written here as well
+        Subject.objects.bulk_create(to_create)
+        Subject.objects.bulk_update(to_update,['name','field'])
+        SubjectField.objects.filter(subject__in=to_update).delete()
+        SubjectField.objects.bulk_create([
+            SubjectField(subject=subject,field=field)
+            for subject in to_create+to_update for field in subject.field
+        ])
+        for subject in to_update:
+            fields = set(subject.field)
+            move_field_facets(subject.id,previous_fields[subject.id]-fields,fields-previous_fields[subject.id])
+        #no signal is sent either
+        from .catalogue import subject_catalogue
+        transaction.on_commit(subject_catalogue.invalidate)
+    return report
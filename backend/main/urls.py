@@ -10,4 +10,6 @@ urlpatterns = [
     path('subjects/<int:sub_id>/',view=views.update_subject),
     path('subjects/<int:sub_id>/',view=views.delete_subject),
     path('subjects/field/',view=views.get_subjects_by_field),
+    path('cache/stats/',view=views.get_cache_stats),
+    path('metrics/queries/',view=views.get_query_stats),
 ]
@@ -1,46 +1,18 @@
 from django.shortcuts import render
 from rest_framework.response import Response
 from rest_framework.decorators import api_view,permission_classes
-import pandas as pd
-from django.conf import settings
 from main.models import Field,Subject
 from .serializers import SubjectSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAdminUser
-
-
-def matching_fields(row):
-    """
-    Helper function to match fields with their coefficients from a CSV row
-    """
-    counter = {}
-    for field in Field:
-        coef = row[field]    #get the coef of the current field
-        if pd.isna(coef):
-            continue   #skip in nan
-        if coef in counter:
-            counter[coef].append(field)
-        else:
-            counter[coef] = [field]
-    return counter
-
-
-def create_subjects(name:str,counter:dict):
-    """
-    Helper function to create subjects based on field coefficients
-    """
-    for coef,fields in counter.items():
-        try:
-            subject = Subject.objects.create(
-                name = name+':'+ str(coef),
-                field = fields,
-                coefficient = coef
-            )
-            subject.save()
-        except:
-            print("error occured with "+name)
+from .cache import get_stats
+from . import query_metrics
+from .catalogue import subject_catalogue
+from .db_routing import replica_reads
+from .subject_import import import_subjects
+from django.http import Http404
 
 
 @api_view(['GET'])
@@ -48,26 +20,18 @@ def create_subjects(name:str,counter:dict):
 def init_subjects(request):
     """
     Endpoint: GET /initialize_subjects/
-    Description: Initialize subjects and their coefficients from CSV file
-    Authentication: Not required
-    Response: {"details": "success"}
-    Notes: This endpoint should only be run once to populate the database
-    """
-    file_path = settings.BASE_DIR/'main/bac_fields_subjects.csv'
-   
-    df = pd.read_csv(file_path)
-    for index,row in df.iterrows():
-        #get matching coefs for eaxh field
-        counter = matching_fields(row)
-        #create the subjects
-        create_subjects(row['المادة'],counter)
-        
-    
+    Description: Create and update subjects and their coefficients from the CSV file
+    Authentication: Admin only
+    Response: {"details": "success", "report": {"created": [...], "updated": [...], "unchanged": 0, "missing": [...]}}
+    Notes: Running it again only applies what changed in the CSV
+    """
+    report = import_subjects()
     return Response(
-        {'details':'success'}
+        {'details':'success','report':report}
     )
 
 
+@replica_reads
 @api_view(['GET'])
 def get_all_subjects(request):
     """
@@ -77,18 +41,7 @@ def get_all_subjects(request):
     Response: Dictionary with subjects grouped by field
     Example: {"علوم تجريبية": [...], "رياضيات": [...], ...}
     """
-    subjects = Subject.objects.all()
-    subjects_by_field = {
-        Field.EXPERIMENTAL_SCIENCES : [],
-        Field.MATHEMATICS : [],
-        Field.TECHNICAL_MATHEMATICS : [],
-        Field.MANAGEMENT_ECONOMICS : [],
-        Field.LITERATURE_PHILOSOPHY : [],
-        Field.FOREIGN_LANGUAGES : []
-    }
-    for subject in subjects:
-        serializer = SubjectSerializer(subject)
-        subjects_by_field[subject.field].append(serializer.data)
+    subjects_by_field = subject_catalogue.by_field()
     return Response(subjects_by_field,status=status.HTTP_200_OK)
 
 
@@ -110,6 +63,7 @@ def add_subject(request,sub_id:int):
         return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
 
 
+@replica_reads
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
 def get_subject(request,sub_id:int):
@@ -118,11 +72,14 @@ def get_subject(request,sub_id:int):
     Description: Get a specific subject by ID
     Authentication: Not required
     Parameters: sub_id (integer) - Subject ID
-    Response: Subject object with id, name, field, coefficient
+    Response: Subject object with id, name, field, coefficient, resource_count, question_count
     """
-    subject = get_object_or_404(Subject,id=sub_id)
-    serializer = SubjectSerializer(subject)
-    return Response(serializer.data,status=status.HTTP_200_OK)
+    subject = subject_catalogue.get_data(sub_id)
+    if subject is None:
+        raise Http404
+    #the counters are not part of the catalogue, they change with every resource and question
+    counts = Subject.objects.filter(id=sub_id).values('resource_count','question_count').first() or {}
+    return Response({**subject,**counts},status=status.HTTP_200_OK)
 
 
 @api_view(['PUT'])
@@ -160,6 +117,7 @@ def delete_subject(request,sub_id:int):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@replica_reads
 @api_view(['GET'])
 def get_subjects_by_field(request):
     """
@@ -173,7 +131,30 @@ def get_subjects_by_field(request):
     field = request.GET.get('field',None)
     if not field:
         raise ValidationError(detail='this field is notregistered within our system',code=400)
-    else:
-        subjects = Subject.objects.filter(field__contains=field)
-    serializer = SubjectSerializer(subjects,many=True)
-    return Response(serializer.data,status=status.HTTP_200_OK)
\ No newline at end of file
+    subjects = subject_catalogue.for_field(field)
+    return Response(subjects,status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_cache_stats(request):
+    """
+    Endpoint: GET /cache/stats/
+    Description: Response cache hits and misses of the worker process answering the request
+    Authentication: Admin only
+    Response: {"pid": 1234, "namespaces": {"resources_all": {"hits": 10, "misses": 2}, ...}}
+    """
+    return Response(get_stats(),status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def get_query_stats(request):
+    """
+    Endpoint: GET /metrics/queries/
+    Description: SQL queries and database time per route of the worker process answering the request
+    Authentication: Admin only
+    Response: {"pid": 1234, "routes": {"GET /resources/all/": {"requests": 10, "queries": 40, "max_queries": 4, "avg_queries": 4.0, "db_time_ms": 12.5}, ...}}
+    Notes: Only collected when QUERY_METRICS_HEADERS is off, otherwise the numbers are sent in the X-DB-Query-Count and X-DB-Time-Ms headers
+    """
+    return Response(query_metrics.get_stats(),status=status.HTTP_200_OK)
@@ -5,4 +5,7 @@ class ResourcesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'resources'
 
+    def ready(self):
+        from . import signals
+
    
\ No newline at end of file
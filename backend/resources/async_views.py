@@ -0,0 +1,63 @@
+"""
+Async variants of the public read endpoints of resources.views, routed by bac_hub.urls_async.
+They answer the same urls with the same data and share the cached responses of the sync views.
+"""
+from main.asyncapi import async_api_view
+from main.cache import async_cached_response
+from main.db_routing import replica_reads
+from main.models import Question
+from .pagination import apaginate_by_cursor,get_page_size
+from .serializers import ResourceSerializer,QuestionListSerializer,ReplySerializer
+from .threads import aload_thread
+from .views import FEED_TYPES,read_feed_parameters,question_list
+
+
+@replica_reads
+@async_api_view
+@async_cached_response('resources_all')
+async def get_all_resources(request):
+    """
+    Endpoint: GET /resources/all/?type={type}&field={field}&cursor={cursor}&limit={limit}
+    Description: Async variant of resources.views.get_all_resources, same parameters and response
+    Authentication: Not required
+    """
+    queryset,resource_type,cursor,limit = read_feed_parameters(request)
+    if resource_type is not None:
+        resources,next_cursor = await apaginate_by_cursor(queryset.filter(type=resource_type),cursor,limit)
+        return {'results':ResourceSerializer(resources,many=True).data,'next_cursor':next_cursor}
+
+    #first page of each type
+    resources_by_type = {}
+    for resource_type in FEED_TYPES:
+        resources,next_cursor = await apaginate_by_cursor(queryset.filter(type=resource_type),None,limit)
+        resources_by_type[resource_type] = {'results':ResourceSerializer(resources,many=True).data,'next_cursor':next_cursor}
+    return resources_by_type
+
+
+@replica_reads
+@async_api_view
+@async_cached_response('questions_subject',scope_kwarg='subject_id')
+async def get_question_by_subject(request,subject_id:int):
+    """
+    Endpoint: GET /resources/question/subject/{subject_id}/?cursor={cursor}&limit={limit}
+    Description: Async variant of resources.views.get_question_by_subject, same parameters and response
+    Authentication: Not required
+    """
+    questions,next_cursor = await apaginate_by_cursor(
+        question_list(Question.objects.filter(subject=subject_id)),
+        request.GET.get('cursor',None),get_page_size(request),'date_posted'
+    )
+    return {'results':QuestionListSerializer(questions,many=True).data,'next_cursor':next_cursor}
+
+
+@replica_reads
+@async_api_view
+@async_cached_response('replies_question',scope_kwarg='question_id')
+async def get_replies_by_question(request,question_id:int):
+    """
+    Endpoint: GET /resources/reply/question/{question_id}/
+    Description: Async variant of resources.views.get_replies_by_question, same parameters and response
+    Authentication: Not required
+    """
+    roots,children = await aload_thread(question_id)
+    return ReplySerializer(roots,many=True,context={'reply_children':children}).data
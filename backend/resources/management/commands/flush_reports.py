@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from resources.reporting import flush_reports
+
+
+class Command(BaseCommand):
+    help = 'Apply the reports buffered while REPORTS_MODE is "buffered"'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval',type=int,default=None,
+                            help='keep running and flush every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            summary = flush_reports()
+            for kind,counts in summary.items():
+                self.stdout.write(f'{kind}: {counts["reported"]} reported, {counts["deleted"]} deleted')
+            if interval is None:
+                break
+            time.sleep(interval)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from resources.search import rebuild_index,is_available
+
+
+class Command(BaseCommand):
+    help = 'Index every resource, question and reply again for the search endpoint'
+
+    def handle(self, *args, **options):
+        if not is_available():
+            self.stdout.write(self.style.WARNING('the database has no search index, the search endpoint scans the tables instead'))
+            return
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'{count} documents indexed'))
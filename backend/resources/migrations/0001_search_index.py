@@ -0,0 +1,78 @@
+import re
+from django.db import migrations
+
+
+#frozen copy of resources.search.normalize
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({
+    '\u0623':'\u0627','\u0625':'\u0627','\u0622':'\u0627','\u0671':'\u0627',   #hamza and madda on alef
+    '\u0624':'\u0648','\u0626':'\u064a',                                     #hamza on waw and ya
+    '\u0649':'\u064a','\u0629':'\u0647',                                     #alef maqsura, ta marbuta
+})
+ARABIC_ARTICLE = re.compile(r'\b(?:[وفبك]?ال|لل)(?=\w{2})')
+
+
+def normalize(text):
+    text = ARABIC_DIACRITICS.sub('',text or '')
+    text = ARABIC_ARTICLE.sub('',text.translate(ARABIC_LETTERS))
+    return text.lower()
+
+
+#frozen copy of resources.search.document_rowid
+KINDS = ['resource','question','reply']
+
+
+def document_rowid(kind,obj_id):
+    return obj_id*len(KINDS)+KINDS.index(kind)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE search_index USING fts5("
+        "title, body, kind UNINDEXED, obj_id UNINDEXED, subject_id UNINDEXED, type UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    index_documents(apps, schema_editor)
+
+
+def index_documents(apps, schema_editor):
+    #the content that already exists, the signals only index what is written from now on
+    Resource = apps.get_model('main','Resource')
+    Question = apps.get_model('main','Question')
+    Reply = apps.get_model('main','Reply')
+    subject_by_question = dict(Question.objects.values_list('id','subject_id'))
+    rows = []
+    for obj_id,name,labels,description,subject_id,resource_type in Resource.objects.values_list(
+        'id','name','labels','description','subject_id','type').iterator():
+        rows.append((f'{name} {labels}',description,'resource',obj_id,subject_id,resource_type))
+    for obj_id,content,subject_id in Question.objects.values_list('id','content','subject_id').iterator():
+        rows.append(('',content,'question',obj_id,subject_id,''))
+    for obj_id,content,question_id in Reply.objects.values_list('id','content','question_id').iterator():
+        rows.append(('',content,'reply',obj_id,subject_by_question.get(question_id),''))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            'INSERT INTO search_index (rowid, title, body, kind, obj_id, subject_id, type) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            [
+                (document_rowid(kind,obj_id),normalize(title),normalize(body),kind,obj_id,subject_id,resource_type)
+                for title,body,kind,obj_id,subject_id,resource_type in rows
+            ]
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_subjectfield'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+#frozen copy of resources.search.document_rowid: obj_id*3 + the position of the kind in (resource, question, reply)
+ROWID = "obj_id*3 + CASE kind WHEN 'resource' THEN 0 WHEN 'question' THEN 1 ELSE 2 END"
+COLUMNS = "title, body, kind, obj_id, subject_id, type"
+
+
+def set_rowids(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    #the rowid of an FTS5 row can't be changed in place, the index is copied to a new table
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE search_index_new USING fts5("
+        "title, body, kind UNINDEXED, obj_id UNINDEXED, subject_id UNINDEXED, type UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    #the latest row of a document, in case a race indexed it twice
+    schema_editor.execute(
+        f"INSERT INTO search_index_new (rowid, {COLUMNS}) SELECT {ROWID}, {COLUMNS} FROM search_index "
+        "WHERE rowid IN (SELECT MAX(rowid) FROM search_index GROUP BY kind, obj_id)"
+    )
+    schema_editor.execute("DROP TABLE search_index")
+    schema_editor.execute("ALTER TABLE search_index_new RENAME TO search_index")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0001_search_index'),
+    ]
+
+    operations = [
+        #the rowids of the old rows are meaningless, they work as they are once migrated back
+        migrations.RunPython(set_rowids, migrations.RunPython.noop),
+    ]
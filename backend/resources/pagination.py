@@ -0,0 +1,83 @@
+import base64
+from datetime import date,datetime
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at:datetime|date,obj_id:int):
+    """
+    Helper function to build an opaque cursor from the (created_at,id) of the last row of a page
+    """
+    raw = f'{created_at.isoformat()}|{obj_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor:str):
+    """
+    Helper function to read back the (created_at,id) pair stored in a cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at,obj_id = raw.rsplit('|',1)
+        return datetime.fromisoformat(created_at),int(obj_id)
+    except (ValueError,UnicodeDecodeError):
+        raise ValidationError({'cursor':'invalid cursor'})
+
+
+def get_page_size(request):
+    """
+    Helper function to read the ?limit= query parameter, bounded by MAX_PAGE_SIZE
+    """
+    limit = request.GET.get('limit',DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except (TypeError,ValueError):
+        raise ValidationError({'limit':'limit must be an integer'})
+    if limit < 1:
+        raise ValidationError({'limit':'limit must be a positive integer'})
+    return min(limit,MAX_PAGE_SIZE)
+
+
+def cursor_queryset(queryset,cursor,limit:int,field='created_at'):
+    """
+    Helper function to build the query of a page, see paginate_by_cursor
+    """
+    queryset = queryset.order_by(f'-{field}','-id')
+    if cursor:
+        created_at,obj_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt':created_at}) | Q(**{field:created_at,'id__lt':obj_id})
+        )
+    return queryset[:limit+1]
+
+
+def cut_page(rows,limit:int,field='created_at'):
+    """
+    Helper function to drop the extra row of a page and build the cursor of the next one
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last,field),last.id)
+    return rows,next_cursor
+
+
+def paginate_by_cursor(queryset,cursor,limit:int,field='created_at'):
+    """
+    Keyset pagination over (-field,-id), field being the creation date or time of the rows
+    fetches limit+1 rows in a single bounded query, the extra row only tells us whether a next page exists
+    returns (rows,next_cursor)
+    """
+    return cut_page(list(cursor_queryset(queryset,cursor,limit,field)),limit,field)
+
+
+async def apaginate_by_cursor(queryset,cursor,limit:int,field='created_at'):
+    """
+    paginate_by_cursor through the async ORM
+    """
+    return cut_page([row async for row in cursor_queryset(queryset,cursor,limit,field)],limit,field)
@@ -0,0 +1,171 @@
+"""
+Report ingestion.
+
+In the default "immediate" mode every report is applied to the database right away.
+In "buffered" mode (settings.REPORTS_MODE) reports are appended to a local file without
+touching the database, and applied later in bulk by "manage.py flush_reports", which
+coalesces them per (model,id) and drops the ones of content that doesn't exist anymore.
+
+A flush first claims the buffer: under the lock the reporters append with, the file is
+renamed to a batch file of its own ("<buffer>.<batch id>.batch") that nobody writes to
+anymore. Each batch is applied in a transaction that also records its id in the
+AppliedReportBatch journal, and its file is removed once that transaction committed.
+A flush interrupted before the commit leaves its batch to the next flush, one interrupted
+after it leaves a batch the journal already holds, which is then only removed: every
+report is applied once. Flushes are serialized by a lock of their own, and the unique
+batch id keeps two of them from applying the same batch where files can't be locked.
+"""
+import os
+import uuid
+from contextlib import suppress
+from collections import Counter,defaultdict
+from datetime import timedelta
+from glob import escape,glob
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F,Case,When,Value
+from django.utils import timezone
+from main import counters
+from main.models import Resource,Question,Reply,AppliedReportBatch,REPORTS_THRESHOLD
+
+try:
+    import fcntl
+except ImportError:   #windows, appends are not locked
+    fcntl = None
+
+
+IMMEDIATE = 'immediate'
+BUFFERED = 'buffered'
+
+REPORTABLE_MODELS = {
+    'resource' : Resource,
+    'question' : Question,
+    'reply' : Reply,
+}
+
+BATCH_SUFFIX = '.batch'
+#a batch file only outlives its transaction until the next flush, the journal doesn't need to go further back
+BATCH_RETENTION = timedelta(days=7)
+
+
+def buffer_path():
+    return str(settings.REPORTS_BUFFER_PATH)
+
+
+class _BufferLock:
+    """
+    Exclusive lock shared by the processes appending to and flushing the buffer
+    suffix names the lock file, ".flush.lock" is the lock taken for a whole flush
+    """
+    def __init__(self,suffix='.lock'):
+        self.suffix = suffix
+
+    def __enter__(self):
+        self.file = open(buffer_path()+self.suffix,'a')
+        if fcntl:
+            fcntl.flock(self.file,fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self,*exc):
+        if fcntl:
+            fcntl.flock(self.file,fcntl.LOCK_UN)
+        self.file.close()
+
+
+def report(kind:str,obj_id:int):
+    """
+    Report a resource, question or reply according to settings.REPORTS_MODE
+    immediate mode: returns None if the content doesn't exist, otherwise its new number of reports
+    buffered mode: returns True once the report is queued, without a query, a report of content
+    that doesn't exist is dropped when the batch is applied
+    """
+    model = REPORTABLE_MODELS[kind]
+    if settings.REPORTS_MODE != BUFFERED:
+        return model.add_report(obj_id)
+
+    with _BufferLock():
+        with open(buffer_path(),'a') as buffer:
+            buffer.write(f'{kind} {obj_id}\n')
+    return True
+
+
+def claim_buffer():
+    """
+    Move the pending reports to a new batch file, reporters then start a new buffer
+    returns the paths of the batches waiting to be applied, the ones left by an interrupted flush included
+    """
+    path = buffer_path()
+    with _BufferLock():
+        #"<buffer>.flushing" is the file a flush interrupted before batches existed leaves behind
+        for pending in (path+'.flushing',path):
+            with suppress(FileNotFoundError):
+                os.replace(pending,f'{path}.{uuid.uuid4().hex}{BATCH_SUFFIX}')
+    return sorted(glob(f'{escape(path)}.*{BATCH_SUFFIX}'))
+
+
+def batch_id(batch_path:str):
+    return batch_path[len(buffer_path())+1:-len(BATCH_SUFFIX)]
+
+
+def read_batch(batch_path:str):
+    """
+    Coalesce the reports of a batch file per (kind,id)
+    """
+    counter = Counter()
+    with open(batch_path) as batch:
+        for line in batch:
+            try:
+                kind,obj_id = line.split()
+                counter[(kind,int(obj_id))] += 1
+            except ValueError:
+                continue   #skip a truncated line
+    return counter
+
+
+def apply_reports(counter:Counter,batch=None):
+    """
+    Apply coalesced reports with one UPDATE per model, then remove every row over the threshold in one pass
+    batch, the id of the batch the reports come from, is recorded in the same transaction
+    returns {kind: {"reported": n, "deleted": n}}, None if the batch was already applied
+    """
+    by_kind = defaultdict(dict)
+    for (kind,obj_id),count in counter.items():
+        if kind in REPORTABLE_MODELS:
+            by_kind[kind][obj_id] = count
+
+    summary = {}
+    with transaction.atomic():
+        if batch is not None and not AppliedReportBatch.objects.get_or_create(batch_id=batch)[1]:
+            return None
+        for kind,counts in by_kind.items():
+            model = REPORTABLE_MODELS[kind]
+            increment = Case(*[When(id=obj_id,then=Value(count)) for obj_id,count in counts.items()],default=Value(0))
+            reported = model.objects.filter(id__in=counts).update(reports=F('reports')+increment)
+            over_threshold = model.objects.filter(id__in=counts,reports__gt=REPORTS_THRESHOLD)
+            deleted = len(over_threshold.values_list('id',flat=True))
+            with counters.deferred():
+                over_threshold.delete()
+            summary[kind] = {'reported':reported,'deleted':deleted}
+    return summary
+
+
+def flush_reports():
+    """
+    Apply every buffered report, see claim_buffer and apply_reports
+    returns the summary of apply_reports for all the batches applied
+    """
+    summary = defaultdict(lambda:{'reported':0,'deleted':0})
+    with _BufferLock('.flush.lock'):
+        for batch_path in claim_buffer():
+            try:
+                counter = read_batch(batch_path)
+            except FileNotFoundError:
+                continue   #removed by another flush, without file locks
+            applied = apply_reports(counter,batch_id(batch_path))
+            for kind,counts in (applied or {}).items():
+                summary[kind]['reported'] += counts['reported']
+                summary[kind]['deleted'] += counts['deleted']
+            with suppress(FileNotFoundError):
+                os.remove(batch_path)
+        AppliedReportBatch.objects.filter(applied_at__lt=timezone.now()-BATCH_RETENTION).delete()
+    return dict(summary)
@@ -0,0 +1,205 @@
+"""
+Full-text search over resources, questions and replies.
+
+On SQLite the searchable text lives in the FTS5 table search_index (created by
+resources/migrations/0001_search_index.py) and is kept in sync by the signals of
+resources.signals. Each document has a fixed rowid computed from its kind and id
+(document_rowid), so that updating or removing it is a lookup by rowid: the kind and
+obj_id columns are UNINDEXED, filtering on them scans the whole index.
+Text is normalized before being indexed and before being searched,
+so that spelling variants of the same Arabic word match: diacritics and tatweel are
+dropped, hamza forms are folded, ta marbuta / alef maqsura are unified and the definite
+article is stripped.
+Other databases fall back to a plain icontains scan of the models: the text is neither
+normalized nor ranked there, a word only matches its exact spelling (case aside) and the
+results come grouped by kind, in id order.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+from main.models import Resource,Question,Reply,SubjectField
+
+
+RESOURCE = 'resource'
+QUESTION = 'question'
+REPLY = 'reply'
+KINDS = [RESOURCE,QUESTION,REPLY]
+
+#bm25 weights of the title and body columns, a match in a resource name or label ranks higher
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTERS = str.maketrans({
+    '\u0623':'\u0627','\u0625':'\u0627','\u0622':'\u0627','\u0671':'\u0627',   #hamza and madda on alef
+    '\u0624':'\u0648','\u0626':'\u064a',                                     #hamza on waw and ya
+    '\u0649':'\u064a','\u0629':'\u0647',                                     #alef maqsura, ta marbuta
+})
+#definite article, alone or after a preposition/conjunction, only stripped from words of 2 letters or more
+ARABIC_ARTICLE = re.compile(r'\b(?:[وفبك]?ال|لل)(?=\w{2})')
+TOKEN = re.compile(r'\w+')
+
+
+def normalize(text:str):
+    """
+    Helper function to fold the spelling variants of a text, see the module docstring
+    """
+    text = ARABIC_DIACRITICS.sub('',text or '')
+    text = ARABIC_ARTICLE.sub('',text.translate(ARABIC_LETTERS))
+    return text.lower()
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+#indexing
+def document_rowid(kind:str,obj_id:int):
+    return obj_id*len(KINDS)+KINDS.index(kind)
+
+
+def document(kind:str,obj):
+    """
+    (title,body,subject_id,type) indexed for a resource, question or reply
+    """
+    if kind == RESOURCE:
+        return f'{obj.name} {obj.labels}',obj.description,obj.subject_id,obj.type
+    if kind == QUESTION:
+        return '',obj.content,obj.subject_id,''
+    subject_id = Question.objects.filter(id=obj.question_id).values_list('subject_id',flat=True).first()
+    return '',obj.content,subject_id,''
+
+
+def index_object(kind:str,obj):
+    if not is_available():
+        return
+    title,body,subject_id,resource_type = document(kind,obj)
+    rowid = document_rowid(kind,obj.id)
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM search_index WHERE rowid = %s',[rowid])
+        cursor.execute(
+            'INSERT INTO search_index (rowid, title, body, kind, obj_id, subject_id, type) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            [rowid,normalize(title),normalize(body),kind,obj.id,subject_id,resource_type]
+        )
+
+
+def remove_object(kind:str,obj_id:int):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM search_index WHERE rowid = %s',[document_rowid(kind,obj_id)])
+
+
+def rebuild_index():
+    """
+    Index every resource, question and reply again
+    returns the number of indexed documents
+    """
+    if not is_available():
+        return 0
+    subject_by_question = dict(Question.objects.values_list('id','subject_id'))
+    rows = []
+    for resource in Resource.objects.iterator():
+        rows.append((f'{resource.name} {resource.labels}',resource.description,RESOURCE,resource.id,resource.subject_id,resource.type))
+    for question in Question.objects.iterator():
+        rows.append(('',question.content,QUESTION,question.id,question.subject_id,''))
+    for reply in Reply.objects.iterator():
+        rows.append(('',reply.content,REPLY,reply.id,subject_by_question.get(reply.question_id),''))
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM search_index')
+        cursor.executemany(
+            'INSERT INTO search_index (rowid, title, body, kind, obj_id, subject_id, type) VALUES (%s, %s, %s, %s, %s, %s, %s)',
+            [
+                (document_rowid(kind,obj_id),normalize(title),normalize(body),kind,obj_id,subject_id,resource_type)
+                for title,body,kind,obj_id,subject_id,resource_type in rows
+            ]
+        )
+    return len(rows)
+
+
+#searching
+def match_expression(query:str):
+    """
+    FTS5 query matching every word of the user's query, the last one as a prefix
+    """
+    tokens = TOKEN.findall(normalize(query))
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search(query:str,kinds=None,subject_id=None,resource_type=None,field=None,offset=0,limit=20):
+    """
+    Ranked search, returns (total,[(kind,obj_id),...]) for the requested page
+    """
+    kinds = kinds or KINDS
+    if not is_available():
+        return fallback_search(query,kinds,subject_id,resource_type,field,offset,limit)
+    expression = match_expression(query)
+    if expression is None:
+        return 0,[]
+
+    conditions = ['search_index MATCH %s',f'kind IN ({", ".join(["%s"]*len(kinds))})']
+    params = [expression,*kinds]
+    if subject_id is not None:
+        conditions.append('subject_id = %s')
+        params.append(subject_id)
+    if resource_type is not None:
+        conditions.append('type = %s')
+        params.append(resource_type)
+    if field is not None:
+        subject_ids = SubjectField.objects.filter(field=field).values('subject_id')
+        sql,subject_params = subject_ids.query.sql_with_params()
+        conditions.append(f'subject_id IN ({sql})')
+        params.extend(subject_params)
+    where = ' AND '.join(conditions)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM search_index WHERE {where}',params)
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f'SELECT kind, obj_id FROM search_index WHERE {where} '
+            f'ORDER BY bm25(search_index, {TITLE_WEIGHT}, {BODY_WEIGHT}) LIMIT %s OFFSET %s',
+            [*params,limit,offset]
+        )
+        hits = [(kind,int(obj_id)) for kind,obj_id in cursor.fetchall()]
+    return total,hits
+
+
+def fallback_search(query,kinds,subject_id,resource_type,field,offset,limit):
+    """
+    Unranked search for databases without FTS5
+    """
+    words = query.split()
+    if not words:
+        return 0,[]
+    querysets = {
+        RESOURCE : (Resource.objects.all(),['name','description','labels'],'subject_id'),
+        QUESTION : (Question.objects.all(),['content'],'subject_id'),
+        REPLY : (Reply.objects.all(),['content'],'question__subject_id'),
+    }
+    total,hits = 0,[]
+    for kind in kinds:
+        if resource_type is not None and kind != RESOURCE:
+            continue
+        queryset,text_fields,subject_lookup = querysets[kind]
+        for word in words:
+            condition = Q()
+            for text_field in text_fields:
+                condition |= Q(**{f'{text_field}__icontains':word})
+            queryset = queryset.filter(condition)
+        if subject_id is not None:
+            queryset = queryset.filter(**{subject_lookup:subject_id})
+        if field is not None:
+            queryset = queryset.filter(**{subject_lookup.replace('subject_id','subject__field_links__field'):field})
+        if resource_type is not None:
+            queryset = queryset.filter(type=resource_type)
+        #only the ids of the page are fetched, the kinds before it are only counted
+        count = queryset.count()
+        start,stop = max(offset-total,0),min(offset+limit-total,count)
+        if start < stop:
+            hits.extend((kind,obj_id) for obj_id in queryset.order_by('id').values_list('id',flat=True)[start:stop])
+        total += count
+    return total,hits
@@ -1,31 +1,53 @@
+from django.utils import timezone
 from rest_framework import serializers
-from main.models import Resource,Question,Reply,ImageQuestion,ImageReply
+from main.models import Resource,Question,Reply,ImageQuestion,ImageReply,Subject
+from main.serializers import CatalogueSubjectField,CatalogueSubjectMixin,UpdatedFieldsMixin
+from main.image_processing import thumbnail_url,variant_urls
+from main.reply_paths import MAX_DEPTH
 
-class ResourceSerializer(serializers.ModelSerializer):
+class ResourceSerializer(CatalogueSubjectMixin,UpdatedFieldsMixin,serializers.ModelSerializer):
+    subject = CatalogueSubjectField(queryset=Subject.objects.all())
     class Meta:
         model = Resource
-        fields = '__all__'
+        exclude = ['tags']   #tags are derived from labels
+
+class ProcessedImageSerializer(serializers.ModelSerializer):
+    #thumbnail is the smallest variant, the full image is only worth fetching when zoomed in
+    thumbnail = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
+    def get_thumbnail(self,obj):
+        return thumbnail_url(obj)
+
+    def get_variants(self,obj):
+        return variant_urls(obj)
 
-class ImageQuestionSerializer(serializers.ModelSerializer):
+
+class ImageQuestionSerializer(ProcessedImageSerializer):
     class Meta:
         model = ImageQuestion
         fields = '__all__'
+        read_only_fields = ['width','height','status']
 
 
-class ImageReplySerializer(serializers.ModelSerializer):
+class ImageReplySerializer(ProcessedImageSerializer):
     class Meta:
         model = ImageReply
         fields = '__all__'
+        read_only_fields = ['width','height','status']
 
 
-class QuestionSerializer(serializers.ModelSerializer):
+class QuestionSerializer(CatalogueSubjectMixin,UpdatedFieldsMixin,serializers.ModelSerializer):
+    subject = CatalogueSubjectField(queryset=Subject.objects.all())
     images = ImageQuestionSerializer(many=True,read_only=True)
     class Meta:
         model = Question
-        fields = ["id","content","date_posted","reports","author","subject","images"]
+        fields = ["id","content","date_posted","reports","author","subject","images","reply_count","last_reply_at"]
         extra_kwargs = {
             'date_posted': {'read_only': True},
             'reports': {'read_only': True},
+            'reply_count': {'read_only': True},
+            'last_reply_at': {'read_only': True},
             'images' : {'read_only':True}
         }
 
@@ -33,7 +55,19 @@ class QuestionSerializer(serializers.ModelSerializer):
         subject = validated_data.pop('subject',None)   #the subject can't be changed
         return super().update(instance, validated_data)
 
-class ReplySerializer(serializers.ModelSerializer):
+class QuestionListSerializer(QuestionSerializer):
+    author_username = serializers.CharField(read_only=True)   #annotated by resources.views.question_page
+    last_activity = serializers.SerializerMethodField()
+    class Meta(QuestionSerializer.Meta):
+        fields = QuestionSerializer.Meta.fields+['author_username','last_activity']
+
+    def get_last_activity(self,obj):
+        #date of the latest reply, or of the question itself
+        if obj.last_reply_at is None:
+            return obj.date_posted.isoformat()
+        return timezone.localdate(obj.last_reply_at).isoformat()
+
+class ReplySerializer(UpdatedFieldsMixin,serializers.ModelSerializer):
     replies = serializers.SerializerMethodField()
     images = ImageReplySerializer(many=True,read_only=True)
     class Meta:
@@ -46,9 +80,20 @@ class ReplySerializer(serializers.ModelSerializer):
             'images' : {'read_only':True}
         }
 
+    def validate_parent(self,parent):
+        #the path of a reply holds the ids of its ancestors, its column fits MAX_DEPTH levels
+        if parent is not None and parent.depth >= MAX_DEPTH:
+            raise serializers.ValidationError(f'replies can only be nested {MAX_DEPTH} levels deep')
+        return parent
+
     def get_replies(self,obj):
-        replies = Reply.objects.filter(parent=obj)
-        return ReplySerializer(replies,many=True).data
+        #use the tree loaded by resources.threads when available instead of querying each level
+        children = self.context.get('reply_children')
+        if children is None:
+            replies = Reply.objects.filter(parent=obj)
+        else:
+            replies = children.get(obj.id,[])
+        return ReplySerializer(replies,many=True,context=self.context).data
     
     def update(self, instance, validated_data):
         #pop parent and question if existing
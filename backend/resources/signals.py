@@ -0,0 +1,35 @@
+from django.db.models.signals import post_save,post_delete
+from django.dispatch import receiver
+from main.models import Resource,Question,Reply
+from . import search
+
+
+#keep the search index in sync
+@receiver(post_save,sender=Resource)
+def index_resource(sender,instance,**kwargs):
+    search.index_object(search.RESOURCE,instance)
+
+
+@receiver(post_save,sender=Question)
+def index_question(sender,instance,**kwargs):
+    search.index_object(search.QUESTION,instance)
+
+
+@receiver(post_save,sender=Reply)
+def index_reply(sender,instance,**kwargs):
+    search.index_object(search.REPLY,instance)
+
+
+@receiver(post_delete,sender=Resource)
+def unindex_resource(sender,instance,**kwargs):
+    search.remove_object(search.RESOURCE,instance.id)
+
+
+@receiver(post_delete,sender=Question)
+def unindex_question(sender,instance,**kwargs):
+    search.remove_object(search.QUESTION,instance.id)
+
+
+@receiver(post_delete,sender=Reply)
+def unindex_reply(sender,instance,**kwargs):
+    search.remove_object(search.REPLY,instance.id)
@@ -1,3 +1,814 @@
-from django.test import TestCase
+import base64
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from unittest import mock,skipUnless
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile,TemporaryUploadedFile
+from django.apps import apps as django_apps
+from django.core.cache import cache,caches
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.core.management import call_command
+from django.test import AsyncRequestFactory,TestCase,TransactionTestCase,override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from resources import pagination,reporting,search,uploads
+from resources.threads import build_reply_tree
+from resources.throttling import parse_rate
+from main.cache import create_cache_tables,invalidate
+from main.tests import QueryBudgetMixin,LOCMEM_CACHES,temporary_media
+from main.models import (Subject,Resource,Tag,Question,Reply,ImageQuestion,ImageReply,ImageBlob,ImageStatus,AppliedReportBatch,
+                         REPORTS_THRESHOLD,parse_labels)
+from django.contrib.auth.models import User
 
 # Create your tests here.
+
+
+def image_file(name='image.png',size=(8,8),image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB',size).save(buffer,format=image_format)
+    return SimpleUploadedFile(name,buffer.getvalue(),content_type=f'image/{image_format.lower()}')
+
+
+class ResourcesQueryBudgetTests(QueryBudgetMixin,TestCase):
+    urls_module = 'resources.urls'
+
+    def budget_requests(self):
+        resources,questions,replies = self.data['resources'],self.data['questions'],self.data['replies']
+        resource,question,reply = resources[0],questions[0],replies[0]
+        subject = resource.subject
+        user = resource.author
+        question_author = {'user':question.author}
+        reply_author = {'user':reply.author}
+        question_image = ImageQuestion.objects.filter(question=question).first()
+        reply_image = ImageReply.objects.filter(reply=reply).first()
+        new_resource = {
+            'name':'new resource','description':'description','subject':subject.id,'type':'EXAM',
+            'labels':'bac,exam','link':'https://example.com/new',
+        }
+        return [
+            ('GET','all/','/resources/all/',5,{}),
+            ('GET','<int:resource_id>/',f'/resources/{resource.id}/',1,{}),
+            ('GET','author/<int:author_id>/',f'/resources/author/{user.id}/',1,{}),
+            ('GET','subject/<int:subject_id>/',f'/resources/subject/{subject.id}/',1,{}),
+            ('GET','tag/','/resources/tag/?tag=bac',1,{}),
+            ('GET','tags/','/resources/tags/',1,{}),
+            ('GET','facets/','/resources/facets/',2,{}),
+            ('POST','add/','/resources/add/',16,{'user':user,'data':new_resource}),
+            ('PUT','update/<int:resource_id>/',f'/resources/update/{resource.id}/',13,{'user':user,'data':{'labels':'bac,new'}}),
+            ('POST','report/<int:resource_id>/',f'/resources/report/{resources[1].id}/',4,{}),
+            ('GET','search/','/resources/search/?q=resource',3,{}),
+            #question
+            ('GET','question/<int:question_id>/',f'/resources/question/{question.id}/',2,{}),
+            ('POST','question/add/','/resources/question/add/',8,{'user':user,'data':{'subject':subject.id,'content':'new question'}}),
+            ('PUT','question/update/<int:question_id>/',f'/resources/question/update/{question.id}/',7,{**question_author,'data':{'content':'edited'}}),
+            ('POST','question/report/<int:question_id>/',f'/resources/question/report/{questions[1].id}/',5,{'user':user}),
+            ('GET','question/subject/<int:subject_id>/',f'/resources/question/subject/{subject.id}/',2,{}),
+            ('GET','question/author/<int:author_id>/',f'/resources/question/author/{user.id}/',2,{}),
+            #reply
+            ('GET','reply/<int:reply_id>/',f'/resources/reply/{reply.id}/',3,{}),
+            ('POST','reply/add/','/resources/reply/add/',14,{'user':user,'data':{'question':question.id,'parent':reply.id,'content':'new reply'}}),
+            ('PUT','reply/update/<int:reply_id>/',f'/resources/reply/update/{reply.id}/',10,{**reply_author,'data':{'content':'edited'}}),
+            ('POST','reply/report/<int:reply_id>/',f'/resources/reply/report/{replies[1].id}/',4,{}),
+            ('GET','reply/question/<int:question_id>/',f'/resources/reply/question/{question.id}/',2,{}),
+            #image
+            ('GET','question/images/<int:qst_id>/view/',f'/resources/question/images/{question.id}/view/',1,{}),
+            ('GET','reply/images/<int:reply_id>/view/',f'/resources/reply/images/{reply.id}/view/',1,{}),
+            #each stored file takes its reference with its own UPDATE
+            ('POST','question/images/<int:qst_id>/upload/',f'/resources/question/images/{question.id}/upload/',10,
+                {**question_author,'data':{'images':[image_file(),image_file()]},'format':'multipart'}),
+            ('POST','reply/images/<int:reply_id>/upload/',f'/resources/reply/images/{reply.id}/upload/',7,
+                {**reply_author,'data':{'images':[image_file()]},'format':'multipart'}),
+            #the rows are locked, then read again by the public delete()
+            ('DELETE','question/images/<int:qst_id>/delete/',f'/resources/question/images/{question.id}/delete/',7,
+                {**question_author,'data':{'images_ids':[question_image.id]}}),
+            ('DELETE','reply/images/<int:reply_id>/delete/',f'/resources/reply/images/{reply.id}/delete/',7,
+                {**reply_author,'data':{'images_ids':[reply_image.id]}}),
+            #deletions last, they remove content used above
+            ('DELETE','delete/<int:resource_id>/',f'/resources/delete/{resources[2].id}/',10,{'user':resources[2].author}),
+            ('DELETE','reply/delete/<int:reply_id>/',f'/resources/reply/delete/{replies[2].id}/',15,{'user':replies[2].author}),
+            ('DELETE','question/delete/<int:question_id>/',f'/resources/question/delete/{questions[2].id}/',38,{'user':questions[2].author}),
+        ]
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='author',email='author@example.com')
+        self.subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.resources = [
+            Resource.objects.create(
+                name=f'resource {i}',description='description',subject=self.subject,author=self.user,
+                type='EXAM',labels='tag',link=f'https://example.com/{i}'
+            )
+            for i in range(5)
+        ]
+
+    def pages(self,limit):
+        pages,cursor = [],None
+        while True:
+            params = {'type':'EXAM','limit':limit,**({'cursor':cursor} if cursor else {})}
+            response = self.client.get('/resources/all/',params)
+            self.assertEqual(response.status_code,200)
+            page = response.json()
+            pages.append([resource['id'] for resource in page['results']])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    def test_newest_first(self):
+        ids = [resource.id for resource in reversed(self.resources)]
+        self.assertEqual(self.pages(2),[ids[:2],ids[2:4],ids[4:]])
+        self.assertEqual(self.pages(5),[ids])
+
+    def test_timestamp_ties(self):
+        #rows created at the same time are ordered by id, none of them is skipped or repeated
+        Resource.objects.update(created_at=self.resources[0].created_at)
+        cache.clear()
+        ids = sorted((resource.id for resource in self.resources),reverse=True)
+        self.assertEqual(self.pages(2),[ids[:2],ids[2:4],ids[4:]])
+        self.assertEqual(sum(self.pages(1),[]),ids)
+
+    def test_stale_cursor(self):
+        #the row a cursor points to may be deleted before the next page is read
+        first = self.client.get('/resources/all/',{'type':'EXAM','limit':2}).json()
+        Resource.objects.get(id=first['results'][-1]['id']).delete()
+        second = self.client.get('/resources/all/',{'type':'EXAM','limit':2,'cursor':first['next_cursor']}).json()
+        self.assertEqual([resource['id'] for resource in second['results']],[self.resources[2].id,self.resources[1].id])
+
+        #questions page by date, the cursor holds a date
+        question = Question.objects.create(subject=self.subject,content='question')
+        cursor = pagination.encode_cursor(question.date_posted,question.id+1)
+        self.assertEqual(pagination.decode_cursor(cursor)[0].date(),question.date_posted)
+        page = self.client.get(f'/resources/question/subject/{self.subject.id}/',{'cursor':cursor}).json()
+        self.assertEqual([question['id'] for question in page['results']],[question.id])
+
+    def test_invalid_parameters(self):
+        invalid = [
+            {'type':'EXAM','cursor':'abc'},
+            {'type':'EXAM','cursor':base64.urlsafe_b64encode(b'yesterday|1').decode()},
+            {'type':'EXAM','cursor':base64.urlsafe_b64encode(b'2024-01-01T00:00:00|last').decode()},
+            {'type':'EXAM','cursor':base64.urlsafe_b64encode(b'\xff\xfe').decode()},
+            {'cursor':pagination.encode_cursor(self.resources[0].created_at,self.resources[0].id)},
+            {'type':'EXAM','limit':0},
+            {'type':'EXAM','limit':'all'},
+        ]
+        for params in invalid:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get('/resources/all/',params).status_code,400)
+        page = self.client.get('/resources/all/',{'type':'EXAM','limit':1000}).json()
+        self.assertEqual(len(page['results']),5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TagTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='author',email='author@example.com')
+        self.math = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.physics = Subject.objects.create(name='physics',field=['رياضيات'],coefficient=4)
+        self.exam = self.resource('exam',self.math,'EXAM','bac, 2024 #algebra')
+        self.summary = self.resource('summary',self.math,'SUMMARY','bac،algebra')
+        self.video = self.resource('video',self.physics,'VIDEO','bac\n  waves   lesson ,bac')
+
+    def resource(self,name,subject,resource_type,labels):
+        return Resource.objects.create(
+            name=name,description='description',subject=subject,author=self.user,
+            type=resource_type,labels=labels,link=f'https://example.com/{name}'
+        )
+
+    def tags(self,resource):
+        return set(resource.tags.values_list('name',flat=True))
+
+    def test_parse_labels(self):
+        self.assertEqual(parse_labels('bac, 2024 #algebra'),['bac','2024','algebra'])
+        self.assertEqual(parse_labels('bac\n  waves   lesson ,bac'),['bac','waves lesson'])
+        self.assertEqual(parse_labels(' , #'),[])
+        self.assertEqual(parse_labels(None),[])
+
+    def test_tags_follow_the_labels(self):
+        self.assertEqual(self.tags(self.video),{'bac','waves lesson'})
+        self.assertEqual(Tag.objects.filter(name='bac').count(),1)
+        self.video.labels = 'waves lesson, physics'
+        self.video.save()
+        self.assertEqual(self.tags(self.video),{'waves lesson','physics'})
+        self.assertEqual(self.tags(self.exam),{'bac','2024','algebra'})
+
+    def test_resources_by_tag(self):
+        def names(*tags):
+            response = self.client.get('/resources/tag/',{'tag':tags})
+            self.assertEqual(response.status_code,200)
+            return [resource['name'] for resource in response.json()['results']]
+        self.assertEqual(names('bac'),['video','summary','exam'])
+        self.assertEqual(names('bac',' algebra '),['summary','exam'])
+        self.assertEqual(names('waves  lesson'),['video'])
+        self.assertEqual(names('bac','unknown'),[])
+        page = self.client.get('/resources/tag/',{'tag':'bac','limit':2}).json()
+        self.assertIsNotNone(page['next_cursor'])
+        for params in ({},{'tag':' '}):
+            self.assertEqual(self.client.get('/resources/tag/',params).status_code,400)
+
+    def test_tag_counts(self):
+        def counts(**params):
+            response = self.client.get('/resources/tags/',params)
+            self.assertEqual(response.status_code,200)
+            return [(tag['name'],tag['count']) for tag in response.json()]
+        self.assertEqual(counts(),[('bac',3),('algebra',2),('2024',1),('waves lesson',1)])
+        self.assertEqual(counts(subject=self.physics.id),[('bac',1),('waves lesson',1)])
+        self.assertEqual(counts(type='SUMMARY'),[('algebra',1),('bac',1)])
+        self.assertEqual(counts(limit=1),[('bac',3)])
+        for params in ({'subject':'math'},{'type':'BOOK'}):
+            self.assertEqual(self.client.get('/resources/tags/',params).status_code,400)
+
+    def test_migration_splits_the_labels(self):
+        migration = import_module('main.migrations.0010_resource_tags')
+        for labels in (self.exam.labels,self.video.labels,'a،b#c\nd , a',''):
+            self.assertEqual(migration.parse_labels(labels),parse_labels(labels))
+        Resource.tags.through.objects.all().delete()
+        Tag.objects.all().delete()
+        migration.split_labels(django_apps,None)
+        self.assertEqual(self.tags(self.exam),{'bac','2024','algebra'})
+        self.assertEqual(self.tags(self.video),{'bac','waves lesson'})
+        self.assertEqual(Tag.objects.count(),4)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QuestionListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.questions = [Question.objects.create(subject=self.subject,content=f'question {i}') for i in range(3)]
+        reply = Reply.objects.create(question=self.questions[0],content='reply')
+        Reply.objects.create(question=self.questions[0],parent=reply,content='child')
+
+    def test_reply_counts_and_pages(self):
+        url = f'/resources/question/subject/{self.subject.id}/'
+        first = self.client.get(url,{'limit':2}).json()
+        self.assertEqual([question['id'] for question in first['results']],[self.questions[2].id,self.questions[1].id])
+        self.assertEqual([question['reply_count'] for question in first['results']],[0,0])
+        second = self.client.get(url,{'limit':2,'cursor':first['next_cursor']}).json()
+        self.assertEqual(second['next_cursor'],None)
+        [question] = second['results']
+        self.assertEqual(question['reply_count'],2)
+        self.assertEqual(question['last_activity'],question['date_posted'])
+
+    def test_constant_queries(self):
+        for i in range(10):
+            question = Question.objects.create(subject=self.subject,content=f'more {i}')
+            ImageQuestion.objects.create(question=question,img=f'images/{i}.jpg')
+        with self.assertNumQueries(2):
+            self.client.get(f'/resources/question/subject/{self.subject.id}/',{'limit':100})
+
+
+
+class StaleCatalogueTests(TransactionTestCase):
+    """
+    Out of a test transaction, where the foreign key constraints are checked by each statement
+    """
+    def setUp(self):
+        self.user = User.objects.create(username='author',email='author@example.com')
+        self.subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.deleted = Subject.objects.create(name='physics',field=['رياضيات'],coefficient=4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        #another process still holds the deleted subject in its catalogue
+        subjects = {self.subject.id:self.subject,self.deleted.id:self.deleted}
+        catalogue = mock.patch('main.catalogue.subject_catalogue.get',side_effect=subjects.get)
+        catalogue.start()
+        self.addCleanup(catalogue.stop)
+        Subject.objects.filter(id=self.deleted.id).delete()
+
+    def resource_data(self,subject):
+        return {
+            'name':'resource','description':'description','subject':subject.id,'type':'EXAM',
+            'labels':'bac','link':'https://example.com/resource',
+        }
+
+    def test_add_with_a_deleted_subject(self):
+        response = self.client.post('/resources/add/',self.resource_data(self.deleted),format='json')
+        self.assertEqual(response.status_code,400)
+        self.assertIn('subject',response.json())
+        response = self.client.post('/resources/question/add/',{'subject':self.deleted.id,'content':'question'},format='json')
+        self.assertEqual(response.status_code,400)
+        self.assertIn('subject',response.json())
+        self.assertFalse(Resource.objects.exists() or Question.objects.exists())
+
+        #an existing subject is validated without reading it
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/resources/question/add/',{'subject':self.subject.id,'content':'question'},format='json')
+        self.assertEqual(response.status_code,200)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('SELECT') and 'FROM "main_subject"' in query['sql']])
+
+    def test_move_to_a_deleted_subject(self):
+        resource = Resource.objects.create(author=self.user,subject=self.subject,**{
+            key:value for key,value in self.resource_data(self.subject).items() if key != 'subject'
+        })
+        response = self.client.put(f'/resources/update/{resource.id}/',self.resource_data(self.deleted),format='json')
+        self.assertEqual(response.status_code,400)
+        resource.refresh_from_db()
+        self.assertEqual(resource.subject_id,self.subject.id)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplyThreadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.question = Question.objects.create(subject=self.subject,content='question')
+        self.first = Reply.objects.create(question=self.question,content='first')
+        self.child = Reply.objects.create(question=self.question,parent=self.first,content='child')
+        self.grandchild = Reply.objects.create(question=self.question,parent=self.child,content='grandchild')
+        self.second = Reply.objects.create(question=self.question,content='second')
+
+    def tree(self,replies):
+        return [(reply['id'],self.tree(reply['replies'])) for reply in replies]
+
+    def test_build_reply_tree(self):
+        roots,children = build_reply_tree([self.child,self.grandchild,self.second])
+        #the parent of child isn't part of the rows, it becomes a root
+        self.assertEqual(roots,[self.child,self.second])
+        self.assertEqual(children,{self.child.id:[self.grandchild],self.grandchild.id:[],self.second.id:[]})
+
+    def test_thread(self):
+        response = self.client.get(f'/resources/reply/question/{self.question.id}/')
+        self.assertEqual(self.tree(response.json()),[
+            (self.first.id,[(self.child.id,[(self.grandchild.id,[])])]),
+            (self.second.id,[]),
+        ])
+        other = Question.objects.create(subject=self.subject,content='no replies')
+        self.assertEqual(self.client.get(f'/resources/reply/question/{other.id}/').json(),[])
+
+    def test_constant_queries(self):
+        #the replies, their authors and their images, whatever the size and depth of the thread
+        with self.assertNumQueries(2):
+            self.client.get(f'/resources/reply/question/{self.question.id}/')
+        parent = self.grandchild
+        for i in range(10):
+            parent = Reply.objects.create(question=self.question,parent=parent,content=f'reply {i}')
+            ImageReply.objects.create(reply=parent,img=f'images/{i}.jpg')
+        cache.clear()
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/resources/reply/question/{self.question.id}/')
+        self.assertEqual(len(response.json()),2)
+
+    def test_subtree(self):
+        url = f'/resources/reply/{self.first.id}/'
+        self.assertEqual(self.tree([self.client.get(url).json()]),[
+            (self.first.id,[(self.child.id,[(self.grandchild.id,[])])]),
+        ])
+        self.assertEqual(self.tree([self.client.get(url,{'depth':1}).json()]),[(self.first.id,[(self.child.id,[])])])
+        self.assertEqual(self.client.get(url,{'count':'true'}).json(),{'id':self.first.id,'descendants_count':2})
+        for depth in ('-1','deep'):
+            self.assertEqual(self.client.get(url,{'depth':depth}).status_code,400)
+
+
+@override_settings(IMAGE_UPLOAD_MAX_FILES=4,IMAGE_UPLOAD_MAX_BYTES=100_000,IMAGE_UPLOAD_MAX_PIXELS=10_000)
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        temporary_media(self)
+        self.user = User.objects.create(username='author',email='author@example.com')
+        subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.question = Question.objects.create(subject=subject,content='question',author=self.user)
+        self.reply = Reply.objects.create(question=self.question,content='reply',author=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self,files,kind='question'):
+        owner = self.question if kind == 'question' else self.reply
+        return self.client.post(f'/resources/{kind}/images/{owner.id}/upload/',{'images':files},format='multipart')
+
+    def test_upload(self):
+        with CaptureQueriesContext(connection) as queries, mock.patch.object(uploads,'check_image',wraps=uploads.check_image) as check:
+            response = self.upload([image_file('a.png'),image_file('b.jpg',size=(20,10),image_format='JPEG')],'reply')
+        self.assertEqual(response.status_code,201)
+        #streamed to disk, even small files
+        self.assertTrue(all(isinstance(call.args[0],TemporaryUploadedFile) for call in check.call_args_list))
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "main_imagereply"')]
+        self.assertEqual(len(inserts),1)
+        images = ImageReply.objects.filter(reply=self.reply).order_by('id')
+        self.assertEqual(response.json()['images'],[image.id for image in images])
+        self.assertEqual([image.status for image in images],[ImageStatus.PENDING]*2)
+        self.assertEqual(sorted(ImageBlob.objects.values_list('refcount',flat=True)),[1,1])
+
+    def test_all_or_nothing(self):
+        response = self.upload([
+            image_file('good.png'),
+            SimpleUploadedFile('notes.png',b'not an image',content_type='image/png'),
+            image_file('huge.png',size=(200,200)),
+            image_file('old.bmp',image_format='BMP'),
+        ])
+        self.assertEqual(response.status_code,400)
+        self.assertEqual(set(response.json()['files']),{'notes.png','huge.png','old.bmp'})
+        self.assertFalse(ImageQuestion.objects.exists())
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_limits(self):
+        response = self.upload([image_file(f'{i}.png') for i in range(5)])
+        self.assertEqual(response.status_code,413)
+        response = self.upload([image_file('large.jpg',size=(100,100),image_format='JPEG') for i in range(4)],'reply')
+        self.assertEqual(response.status_code,201)
+        with override_settings(IMAGE_UPLOAD_MAX_BYTES=100):
+            self.assertEqual(self.upload([image_file()]).status_code,413)
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1000)
+    def test_body_larger_than_its_length(self):
+        #Content-Length isn't enforced on the body of an ASGI request, the bytes received are counted
+        def request(size):
+            request = AsyncRequestFactory().post('/',{'images':[SimpleUploadedFile('a.png',b'0'*size)]})
+            request.META['CONTENT_LENGTH'] = '100'
+            return request
+        self.assertEqual(len(uploads.read_images(request(1000))),1)
+        with mock.patch.object(TemporaryUploadedFile,'close',autospec=True,side_effect=TemporaryUploadedFile.close) as close:
+            with self.assertRaises(uploads.UploadTooLarge):
+                uploads.read_images(request(1001))
+        #the file written so far is dropped
+        self.assertEqual(close.call_count,1)
+        self.assertFalse(ImageQuestion.objects.exists())
+
+    def test_delete(self):
+        self.upload([image_file('a.png'),image_file('b.png',size=(9,9)),image_file('c.png',size=(10,10))])
+        other = Question.objects.create(subject=self.question.subject,content='other',author=self.user)
+        self.client.post(f'/resources/question/images/{other.id}/upload/',{'images':[image_file('d.png',size=(11,11))]},format='multipart')
+        first,second,third,foreign = ImageQuestion.objects.order_by('id')
+        names = {image.id:image.img.name for image in (first,second,third,foreign)}
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks, \
+             mock.patch.object(uploads,'release',wraps=uploads.release) as release, \
+             mock.patch('main.signals.release') as signal_release:
+            response = self.client.delete(
+                f'/resources/question/images/{self.question.id}/delete/',
+                {'images_ids':[first.id,second.id,foreign.id]},format='json'
+            )
+        self.assertEqual(response.status_code,204)
+        #one DELETE scoped to the question, returning the files of the deleted rows, which are not read before
+        deletes = [query for query in queries if query['sql'].startswith('DELETE FROM "main_imagequestion"')]
+        self.assertEqual(len(deletes),1)
+        self.assertIn(f'"question_id" = {self.question.id}',deletes[0]['sql'])
+        self.assertIn('RETURNING',deletes[0]['sql'])
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT') and 'main_imagequestion' in query['sql']])
+        #the files are released once for all the images
+        self.assertEqual(len(release.call_args_list),1)
+        self.assertEqual(set(release.call_args.args[0]),{names[first.id],names[second.id]})
+        signal_release.assert_not_called()
+        #the image of the other question is left alone
+        self.assertEqual(set(ImageQuestion.objects.values_list('id',flat=True)),{third.id,foreign.id})
+        #the files are only removed after the commit
+        self.assertTrue(default_storage.exists(names[first.id]))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(default_storage.exists(names[first.id]))
+        self.assertFalse(default_storage.exists(names[second.id]))
+        self.assertTrue(default_storage.exists(names[foreign.id]))
+
+        #the images deleted with their question
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/resources/question/delete/{self.question.id}/')
+        self.assertFalse(default_storage.exists(names[third.id]))
+        self.assertEqual(list(ImageBlob.objects.values_list('name',flat=True)),[names[foreign.id]])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+        self.other_subject = Subject.objects.create(name='physics',field=['رياضيات'],coefficient=4)
+        self.resource = Resource.objects.create(
+            name='المعادلة التفاضلية',description='ملخص الدرس',subject=self.subject,type='SUMMARY',
+            labels='bac',link='https://example.com/summary'
+        )
+        self.question = Question.objects.create(subject=self.subject,content='كيف نحل معادلة تفاضلية من الدرجة الثانية')
+        self.reply = Reply.objects.create(question=self.question,content='نستعمل المعادلة المميزة')
+        Question.objects.create(subject=self.other_subject,content='سؤال عن الحركة')
+
+    def find(self,query,**params):
+        response = self.client.get('/resources/search/',{'q':query,**params})
+        self.assertEqual(response.status_code,200)
+        return [(result['kind'],result['data']['id']) for result in response.json()['results']]
+
+    def index_rows(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT kind, obj_id FROM search_index ORDER BY rowid')
+            return [(kind,int(obj_id)) for kind,obj_id in cursor.fetchall()]
+
+    def test_normalize(self):
+        self.assertEqual(search.normalize('الْمُعَادَلَة'),search.normalize('معادله'))
+        self.assertEqual(search.normalize('أحمد'),'احمد')
+        self.assertEqual(search.normalize('وَالكتاب'),'كتاب')
+        self.assertEqual(search.normalize('مستشفى'),'مستشفي')
+        self.assertEqual(search.normalize('Bac'),'bac')
+
+    @skipUnless(search.is_available(),'the FTS5 index only exists on SQLite')
+    def test_ranked_search(self):
+        #spelling variants match, a match in a resource name ranks first, the last word is a prefix
+        self.assertEqual(self.find('تفاضليه')[0],('resource',self.resource.id))
+        self.assertEqual(
+            set(self.find('المعادلة')),
+            {('resource',self.resource.id),('question',self.question.id),('reply',self.reply.id)}
+        )
+        self.assertEqual(self.find('المميز'),[('reply',self.reply.id)])
+        self.assertEqual(set(self.find('معادلة',kind='question,reply',subject=self.subject.id)),
+                         {('question',self.question.id),('reply',self.reply.id)})
+        self.assertEqual(self.find('الحركة',subject=self.subject.id),[])
+        self.assertEqual(self.client.get('/resources/search/',{'q':'x','kind':'user'}).status_code,400)
+
+    @skipUnless(search.is_available(),'the FTS5 index only exists on SQLite')
+    def test_index_follows_writes(self):
+        self.question.content = 'سؤال عن التكامل'
+        self.question.save()
+        self.assertEqual(self.find('التكامل'),[('question',self.question.id)])
+        self.assertNotIn(('question',self.question.id),self.find('تفاضلية'))
+        #one row per document, under its own rowid
+        rows = self.index_rows()
+        self.assertEqual(len(rows),len(set(rows)))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM search_index WHERE kind = %s AND obj_id = %s',['question',self.question.id])
+            self.assertEqual(cursor.fetchall(),[(search.document_rowid('question',self.question.id),)])
+
+        #the replies deleted with their question leave the index too
+        self.question.delete()
+        self.assertNotIn(('reply',self.reply.id),self.index_rows())
+        self.assertEqual(self.find('المعادلة'),[('resource',self.resource.id)])
+        self.assertEqual(search.rebuild_index(),len(self.index_rows()))
+
+    def test_fallback_search(self):
+        #without FTS5 the words only match their exact spelling, unranked
+        with mock.patch.object(search,'is_available',return_value=False):
+            self.assertEqual(self.find('تفاضلية'),[('resource',self.resource.id),('question',self.question.id)])
+            self.assertEqual(self.find('تفاضليه'),[])
+            self.assertEqual(self.find('الدرس',type='SUMMARY'),[('resource',self.resource.id)])
+
+    def test_fallback_pages(self):
+        #only the ids of the requested page are read, the kinds before it are counted
+        def page(offset,limit):
+            with CaptureQueriesContext(connection) as queries:
+                result = search.fallback_search('معادلة',search.KINDS,None,None,None,offset,limit)
+            return result,[query['sql'].split()[1] for query in queries.captured_queries]
+        self.assertEqual(page(1,1),((3,[('question',self.question.id)]),['COUNT(*)','COUNT(*)','"main_question"."id"','COUNT(*)']))
+        self.assertEqual(page(0,5)[0],(3,[('resource',self.resource.id),('question',self.question.id),('reply',self.reply.id)]))
+        self.assertEqual(page(3,5)[0],(3,[]))
+
+    @skipUnless(search.is_available(),'the FTS5 index only exists on SQLite')
+    def test_migration_indexes_existing_content(self):
+        rows = sorted(self.index_rows())
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM search_index')
+        import_module('resources.migrations.0001_search_index').index_documents(django_apps,mock.Mock(connection=connection))
+        self.assertEqual(sorted(self.index_rows()),rows)
+        self.assertEqual(self.find('المميز'),[('reply',self.reply.id)])
+
+
+def temporary_buffer(test):
+    #reports buffered in a directory removed after the test
+    directory = tempfile.mkdtemp()
+    buffer_override = override_settings(REPORTS_MODE=reporting.BUFFERED,REPORTS_BUFFER_PATH=os.path.join(directory,'reports.log'))
+    buffer_override.enable()
+    test.addCleanup(shutil.rmtree,directory,ignore_errors=True)
+    test.addCleanup(buffer_override.disable)
+    return directory
+
+
+def reportable_content():
+    subject = Subject.objects.create(name='math',field=['رياضيات'],coefficient=5)
+    resource = Resource.objects.create(
+        name='resource',description='description',subject=subject,
+        type='EXAM',labels='label',link='https://example.com/resource'
+    )
+    question = Question.objects.create(subject=subject,content='question')
+    return resource,question
+
+
+class ReportBufferTests(TestCase):
+    def setUp(self):
+        self.directory = temporary_buffer(self)
+        self.resource,self.question = reportable_content()
+
+    def test_buffer_and_flush(self):
+        for i in range(3):
+            self.assertTrue(reporting.report('resource',self.resource.id))
+        self.assertTrue(reporting.report('question',self.question.id))
+        #the existence of the content is checked when the batch is applied, queuing runs no query
+        with self.assertNumQueries(0):
+            self.assertTrue(reporting.report('reply',0))
+        with open(reporting.buffer_path()) as buffer:
+            self.assertEqual(buffer.read().splitlines(),[f'resource {self.resource.id}']*3+[f'question {self.question.id}','reply 0'])
+        #nothing is applied before the flush
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,0)
+
+        #the reports of a content are coalesced into one UPDATE per model, the missing reply updates nothing
+        with CaptureQueriesContext(connection) as queries:
+            summary = reporting.flush_reports()
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]),3)
+        self.assertEqual(summary,{
+            'resource':{'reported':1,'deleted':0},'question':{'reported':1,'deleted':0},'reply':{'reported':0,'deleted':0}
+        })
+        self.resource.refresh_from_db()
+        self.question.refresh_from_db()
+        self.assertEqual((self.resource.reports,self.question.reports),(3,1))
+        self.assertEqual(sorted(os.listdir(self.directory)),['reports.log.flush.lock','reports.log.lock'])
+        self.assertEqual(reporting.claim_buffer(),[])
+        self.assertEqual(reporting.flush_reports(),{})
+
+    def test_threshold(self):
+        for i in range(REPORTS_THRESHOLD+1):
+            reporting.report('resource',self.resource.id)
+        self.assertEqual(reporting.flush_reports(),{'resource':{'reported':1,'deleted':1}})
+        self.assertFalse(Resource.objects.filter(id=self.resource.id).exists())
+
+    def test_interrupted_before_commit(self):
+        reporting.report('resource',self.resource.id)
+        with mock.patch.object(reporting,'read_batch',side_effect=OSError):
+            with self.assertRaises(OSError):
+                reporting.flush_reports()
+        #reports made meanwhile go to a new batch, the claimed one is applied by the next flush
+        reporting.report('resource',self.resource.id)
+        self.assertEqual(len(reporting.claim_buffer()),2)
+        reporting.flush_reports()
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,2)
+
+    def test_interrupted_after_commit(self):
+        reporting.report('resource',self.resource.id)
+        with mock.patch.object(reporting.os,'remove',side_effect=OSError):
+            with self.assertRaises(OSError):
+                reporting.flush_reports()
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,1)
+        [batch_path] = reporting.claim_buffer()
+        self.assertTrue(AppliedReportBatch.objects.filter(batch_id=reporting.batch_id(batch_path)).exists())
+
+        #the journal knows the batch left behind, it is removed without being applied again
+        self.assertEqual(reporting.flush_reports(),{})
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,1)
+        self.assertEqual(reporting.claim_buffer(),[])
+
+    def test_batch_applied_once(self):
+        self.assertEqual(reporting.apply_reports({('resource',self.resource.id):2},'batch'),{'resource':{'reported':1,'deleted':0}})
+        self.assertIsNone(reporting.apply_reports({('resource',self.resource.id):2},'batch'))
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,2)
+
+    def test_flush_left_by_former_version(self):
+        with open(reporting.buffer_path()+'.flushing','w') as flushing:
+            flushing.write(f'resource {self.resource.id}\nresource\n')
+        reporting.flush_reports()
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,1)
+        self.assertFalse(os.path.exists(reporting.buffer_path()+'.flushing'))
+
+
+class ConcurrentFlushTests(TransactionTestCase):
+    REPORTS = 40
+    FLUSHERS = 4
+
+    def setUp(self):
+        temporary_buffer(self)
+        self.resource,self.question = reportable_content()
+        #raise the bar so that no report removes the resource
+        Resource.objects.filter(id=self.resource.id).update(reports=-self.REPORTS)
+
+    def report_and_flush(self,number):
+        #the reports are written like report() does, flush_reports is the only one using the database
+        try:
+            for i in range(self.REPORTS//self.FLUSHERS):
+                with reporting._BufferLock():
+                    with open(reporting.buffer_path(),'a') as buffer:
+                        buffer.write(f'resource {self.resource.id}\n')
+            return reporting.flush_reports()
+        finally:
+            connection.close()
+
+    def test_concurrent_flushes(self):
+        with ThreadPoolExecutor(max_workers=self.FLUSHERS) as executor:
+            list(executor.map(self.report_and_flush,range(self.FLUSHERS)))
+        reporting.flush_reports()
+        self.resource.refresh_from_db()
+        self.assertEqual(self.resource.reports,0)
+        self.assertEqual(reporting.claim_buffer(),[])
+
+
+@override_settings(REPORT_THROTTLE_RATES={'resource_report':'2/h','question_report':'1/2h','reply_report':'1/2h'})
+class ReportThrottleTests(TestCase):
+    def setUp(self):
+        caches['throttle'].clear()
+        self.resource,self.question = reportable_content()
+
+    def report(self,resource=None,ip='10.0.0.1'):
+        return self.client.post(f'/resources/report/{(resource or self.resource).id}/',REMOTE_ADDR=ip)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('1/day'),(1,86400))
+        self.assertEqual(parse_rate('3/2h'),(3,7200))
+        self.assertEqual(parse_rate('10/30m'),(10,1800))
+        with self.assertRaises(ValueError):
+            parse_rate('often')
+
+    def test_limit(self):
+        self.assertEqual(self.report().status_code,200)
+        self.assertEqual(self.report().status_code,200)
+        response = self.report()
+        self.assertEqual(response.status_code,429)
+        self.assertEqual(response.json()['error'],'Rate limit exceeded')
+        self.assertIn(int(response['Retry-After']),(3599,3600))
+        #per client and reported object
+        self.assertEqual(self.report(ip='10.0.0.2').status_code,200)
+        other = Resource.objects.create(
+            name='other',description='description',subject=self.resource.subject,
+            type='EXAM',labels='label',link='https://example.com/other'
+        )
+        self.assertEqual(self.report(other).status_code,200)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_sliding_window(self):
+        caches['throttle'].clear()
+        with mock.patch('time.time') as clock:
+            for now,status_code,retry_after in [
+                (0,200,None),(1800,200,None),(1801,429,'1799'),
+                #the first report is an hour old, its slot is free again
+                (3601,200,None),(3602,429,'1798'),
+            ]:
+                clock.return_value = 1_000_000+now
+                response = self.report()
+                self.assertEqual((response.status_code,response.get('Retry-After')),(status_code,retry_after),now)
+
+    def test_cache_tables_created_by_migrate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE throttle_cache')
+        create_cache_tables()
+        self.assertEqual(self.report().status_code,200)
+        self.assertEqual(self.report().status_code,200)
+        self.assertEqual(self.report().status_code,429)
+
+
+class CacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.resource,self.question = reportable_content()
+        self.subject = self.resource.subject
+        self.other_subject = Subject.objects.create(name='physics',field=['رياضيات'],coefficient=4)
+        self.client = APIClient()
+
+    def resources(self,subject=None):
+        response = self.client.get(f'/resources/subject/{(subject or self.subject).id}/')
+        return [resource['id'] for resource in response.json()]
+
+    def questions(self):
+        response = self.client.get(f'/resources/question/subject/{self.subject.id}/')
+        return {question['id']:question for question in response.json()['results']}
+
+    def test_resource_writes(self):
+        self.assertEqual(self.resources(),[self.resource.id])
+        other = Resource.objects.create(
+            name='other',description='description',subject=self.subject,
+            type='NOTES',labels='label',link='https://example.com/other'
+        )
+        self.assertEqual(self.resources(),[other.id,self.resource.id])
+        self.assertEqual(self.resources(self.other_subject),[])
+        #moving a resource clears the lists of both subjects
+        other.subject = self.other_subject
+        other.save()
+        self.assertEqual(self.resources(),[self.resource.id])
+        self.assertEqual(self.resources(self.other_subject),[other.id])
+        other.delete()
+        self.assertEqual(self.resources(self.other_subject),[])
+
+    def test_reply_activity(self):
+        self.assertEqual(self.questions()[self.question.id]['reply_count'],0)
+        reply = Reply.objects.create(question=self.question,content='reply')
+        self.assertEqual(self.questions()[self.question.id]['reply_count'],1)
+        thread = self.client.get(f'/resources/reply/question/{self.question.id}/').json()
+        #editing a reply leaves the question lists alone, the thread is cleared
+        with mock.patch('main.signals.invalidate',wraps=invalidate) as invalidated:
+            reply.content = 'edited'
+            reply.save()
+        self.assertEqual([call.args for call in invalidated.call_args_list],[('replies_question',self.question.id)])
+        self.assertNotEqual(self.client.get(f'/resources/reply/question/{self.question.id}/').json(),thread)
+        reply.delete()
+        self.assertEqual(self.questions()[self.question.id]['reply_count'],0)
+
+    def test_reports_are_not_invalidated(self):
+        self.assertEqual(self.questions()[self.question.id]['reports'],0)
+        Question.add_report(self.question.id)
+        #the count shows up once the list expires
+        self.assertEqual(self.questions()[self.question.id]['reports'],0)
+        cache.clear()
+        self.assertEqual(self.questions()[self.question.id]['reports'],1)
+        #removed content leaves the lists at once
+        Question.objects.filter(id=self.question.id).update(reports=REPORTS_THRESHOLD)
+        Question.add_report(self.question.id)
+        self.assertNotIn(self.question.id,self.questions())
+
+    def test_reconciled_counters(self):
+        Reply.objects.create(question=self.question,content='reply')
+        Question.objects.filter(id=self.question.id).update(reply_count=7)
+        cache.clear()
+        self.assertEqual(self.questions()[self.question.id]['reply_count'],7)
+        call_command('reconcile_counters',stdout=io.StringIO())
+        self.assertEqual(self.questions()[self.question.id]['reply_count'],1)
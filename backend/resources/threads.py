@@ -0,0 +1,36 @@
+from main.models import Reply
+
+
+def build_reply_tree(replies):
+    """
+    Helper function to assemble the parent/child tree of already fetched replies in memory
+    replies whose parent is not part of the given rows are considered roots
+    returns (roots,children) where children maps a reply id to the list of its direct replies
+    """
+    children = {reply.id:[] for reply in replies}
+    roots = []
+    for reply in replies:
+        if reply.parent_id in children:
+            children[reply.parent_id].append(reply)
+        else:
+            roots.append(reply)
+    return roots,children
+
+
+def thread_queryset(question_id:int):
+    return Reply.objects.filter(question=question_id).select_related('author').prefetch_related('images').order_by('id')
+
+
+def load_thread(question_id:int):
+    """
+    Load every reply of a question (with its images and author) in a constant number of queries
+    returns (roots,children), see build_reply_tree
+    """
+    return build_reply_tree(list(thread_queryset(question_id)))
+
+
+async def aload_thread(question_id:int):
+    """
+    load_thread through the async ORM
+    """
+    return build_reply_tree([reply async for reply in thread_queryset(question_id)])
@@ -1,126 +1,85 @@
+import re
+import time
+from django.conf import settings
+from django.core.cache import caches
 from rest_framework.throttling import BaseThrottle
-from django.core.cache import cache
-from django.utils import timezone
-from datetime import timedelta
 
-class ResourceReportThrottle(BaseThrottle):
-    def __init__(self):
-        super().__init__()
-    
-    def allow_request(self, request, view):
-      #  print("here")
-        # Get IP address
-        ip = self.get_ident(request)
-        
-        # Get resource_id from URL kwargs
-        resource_id = request.resolver_match.kwargs.get('resource_id')
-        
-        if not ip or not resource_id:
-            return True  # Allow if we can't identify properly
-        
-        # Create unique cache key
-        cache_key = f'throttle_resource_report_{ip}_{resource_id}'
-        
-        # Check if request was made recently
-        last_request = cache.get(cache_key)
-        now = timezone.now()
-        
-        if last_request:
-            # Calculate time since last request
-            time_diff = now - last_request
-            
-            # If less than 24 hours (1 day), deny request
-            if time_diff < timedelta(hours=24):
-                return False
-        
-        # Allow request and store timestamp
-        cache.set(cache_key, now, timeout=86400)  # 24 hours in seconds
-        return True
-    
-    def wait(self):
-        """Return how long to wait before next request (optional)"""
-        return 86400  # 24 hours in seconds
-    
+
+RATE_PERIODS = {'s':1,'m':60,'h':3600,'d':86400}
 
 
+def parse_rate(rate:str):
+    """
+    Helper function to read a rate such as "1/day", "3/2h" or "10/30m"
+    returns (number of requests,window in seconds)
+    """
+    match = re.fullmatch(r'(\d+)/(\d*)([smhd])\w*',rate)
+    if not match:
+        raise ValueError(f'invalid throttle rate "{rate}"')
+    num_requests,multiplier,period = match.groups()
+    return int(num_requests),int(multiplier or 1)*RATE_PERIODS[period]
 
 
+class ReportThrottle(BaseThrottle):
+    """
+    Sliding window throttle per (client ip,reported object)
+
+    Each of the allowed requests of the window is a slot in the cache that is claimed
+    with an atomic add() and expires exactly one window after it was claimed, so there is
+    no get/set race and the limit slides with the requests instead of resetting at fixed times.
+    The store is the settings.THROTTLE_CACHE cache (files by default, see THROTTLE_CACHE_BACKEND)
+    so that the limits are shared by every worker process. add() is only atomic with the
+    database cache, the file cache may let two simultaneous requests claim the same slot.
+    """
+    scope = None       #key of the rate in settings.REPORT_THROTTLE_RATES
+    url_kwarg = None   #url parameter holding the id of the reported object
 
-class QuestionReportThrottle(BaseThrottle):
     def __init__(self):
         super().__init__()
-    
+        self.num_requests,self.duration = parse_rate(settings.REPORT_THROTTLE_RATES[self.scope])
+        self.cache = caches[settings.THROTTLE_CACHE]
+        self.retry_after = None
+
+    def get_cache_key(self,request):
+        ident = self.get_ident(request)
+        obj_id = request.resolver_match.kwargs.get(self.url_kwarg)
+        if not ident or not obj_id:
+            return None
+        return f'throttle_{self.scope}_{ident}_{obj_id}'
+
     def allow_request(self, request, view):
-      #  print("here")
-        # Get IP address
-        ip = self.get_ident(request)
-        
-        # Get resource_id from URL kwargs
-        question_id = request.resolver_match.kwargs.get('question_id')
-        
-        if not ip or not question_id:
-            return True  # Allow if we can't identify properly
-        
-        # Create unique cache key
-        cache_key = f'throttle_question_report_{ip}_{question_id}'
-        
-        # Check if request was made recently
-        last_request = cache.get(cache_key)
-        now = timezone.now()
-        
-        if last_request:
-            # Calculate time since last request
-            time_diff = now - last_request
-            
-            # If less than 2 hours , deny request
-            if time_diff < timedelta(hours=2):
-                return False
-        
-        # Allow request and store timestamp
-        cache.set(cache_key, now, timeout=7200)  # 2 hours in seconds
-        return True
-    
-    def wait(self):
-        """Return how long to wait before next request (optional)"""
-        return 7200  # 2 hours in seconds
-    
+        cache_key = self.get_cache_key(request)
+        if cache_key is None:
+            return True   #allow if we can't identify properly
 
+        now = time.time()
+        expirations = []
+        for slot in range(self.num_requests):
+            slot_key = f'{cache_key}_{slot}'
+            if self.cache.add(slot_key,now+self.duration,timeout=self.duration):
+                return True
+            expirations.append(self.cache.get(slot_key))
 
+        #the next request is allowed as soon as the oldest slot expires
+        expirations = [expiration for expiration in expirations if expiration is not None]
+        self.retry_after = max(min(expirations)-now,0) if expirations else 0
+        return False
 
-class ReplyReportThrottle(BaseThrottle):
-    def __init__(self):
-        super().__init__()
-    
-    def allow_request(self, request, view):
-      #  print("here")
-        # Get IP address
-        ip = self.get_ident(request)
-        
-        # Get resource_id from URL kwargs
-        reply_id = request.resolver_match.kwargs.get('reply_id')
-        
-        if not ip or not reply_id:
-            return True  # Allow if we can't identify properly
-        
-        # Create unique cache key
-        cache_key = f'throttle_question_report_{ip}_{reply_id}'
-        
-        # Check if request was made recently
-        last_request = cache.get(cache_key)
-        now = timezone.now()
-        
-        if last_request:
-            # Calculate time since last request
-            time_diff = now - last_request
-            
-            # If less than 2 hours , deny request
-            if time_diff < timedelta(hours=2):
-                return False
-        
-        # Allow request and store timestamp
-        cache.set(cache_key, now, timeout=7200)  # 2 hours in seconds
-        return True
-    
     def wait(self):
-        """Return how long to wait before next request (optional)"""
-        return 7200  # 2 hours in seconds
\ No newline at end of file
+        """Return how many seconds are left before the next request is allowed"""
+        return self.retry_after
+
+
+class ResourceReportThrottle(ReportThrottle):
+    scope = 'resource_report'
+    url_kwarg = 'resource_id'
+
+
+class QuestionReportThrottle(ReportThrottle):
+    scope = 'question_report'
+    url_kwarg = 'question_id'
+
+
+class ReplyReportThrottle(ReportThrottle):
+    scope = 'reply_report'
+    url_kwarg = 'reply_id'
@@ -0,0 +1,185 @@
+"""
+Bulk upload and deletion of question and reply images.
+
+Every file of an upload request is streamed to a temporary file chunk by chunk, whatever
+its size, instead of being kept in memory. A request larger than IMAGE_UPLOAD_MAX_BYTES
+is refused before its body is read. Content-Length can be missing or understate the body,
+the bytes of the files are counted as they arrive too: the parsing stops as soon as they go
+over IMAGE_UPLOAD_MAX_BYTES, and at the file after the IMAGE_UPLOAD_MAX_FILES-th. Each file is checked from its header only: Pillow reads the
+format and the dimensions without decoding the pixels. Then either every image is saved,
+with a single bulk_create, or none is.
+bulk_create sends no signal, save_images() does what main.signals does for a single
+image: clear the cached lists and queue the processing. The file references are taken by
+the storage, they are released if the images can't be saved.
+delete_images() removes the images scoped to their question or reply with one DELETE returning
+their files, and releases the files once, after the commit they are removed in the background.
+"""
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload,TemporaryFileUploadHandler
+from django.db import connections,transaction
+from django.db.models.sql import DeleteQuery
+from PIL import Image,UnidentifiedImageError
+from rest_framework import status
+from rest_framework.exceptions import APIException,ValidationError
+from main.image_processing import queue_images
+from main.models import ImageQuestion,ImageReply
+from main.signals import question_images_changed,reply_images_changed
+from main.storage import release
+
+
+#relation: (image model, function clearing what shows the images of a question or reply)
+RELATIONS = {
+    'question' : (ImageQuestion,question_images_changed),
+    'reply' : (ImageReply,reply_images_changed),
+}
+
+
+TOO_LARGE = 'the images sent at once can weigh at most {} bytes'
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The upload is too large.'
+    default_code = 'upload_too_large'
+
+
+class BulkImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Writes every file to a temporary file and stops the upload after IMAGE_UPLOAD_MAX_FILES files
+    or IMAGE_UPLOAD_MAX_BYTES bytes
+    """
+    def __init__(self,request=None):
+        super().__init__(request)
+        self.files = 0
+        self.received = 0
+        self.too_many = False
+        self.too_large = False
+
+    def new_file(self,*args,**kwargs):
+        self.files += 1
+        if self.files > settings.IMAGE_UPLOAD_MAX_FILES:
+            self.too_many = True
+            raise StopUpload(connection_reset=True)
+        super().new_file(*args,**kwargs)
+
+    def receive_data_chunk(self,raw_data,start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.too_large = True
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data,start)
+
+
+def read_images(request,field='images'):
+    """
+    The image files of an upload request, streamed to temporary files
+    raises UploadTooLarge when the request goes over the limits
+    """
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise UploadTooLarge(TOO_LARGE.format(settings.IMAGE_UPLOAD_MAX_BYTES))
+    handler = BulkImageUploadHandler(request)
+    request.upload_handlers = [handler]   #before request.FILES parses the body
+    files = request.FILES.getlist(field)
+    if handler.too_large:
+        raise UploadTooLarge(TOO_LARGE.format(settings.IMAGE_UPLOAD_MAX_BYTES))
+    if handler.too_many:
+        raise UploadTooLarge(f'at most {settings.IMAGE_UPLOAD_MAX_FILES} images can be sent at once')
+    return files
+
+
+def check_image(file):
+    """
+    Check an uploaded image from its header, the pixels are not decoded
+    raises ValueError with the reason it's refused
+    """
+    try:
+        with Image.open(file) as image:
+            image_format,(width,height) = image.format,image.size
+    except (UnidentifiedImageError,Image.DecompressionBombError,OSError):
+        raise ValueError('not a valid image')
+    finally:
+        file.seek(0)
+    if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+        raise ValueError(f'{image_format} images are not accepted')
+    if width*height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise ValueError(f'the image is {width}x{height}, at most {settings.IMAGE_UPLOAD_MAX_PIXELS} pixels are accepted')
+
+
+def save_images(relation:str,owner_id:int,files):
+    """
+    Add the files as images of the question or reply owner_id, all of them or none
+    relation is "question" or "reply"
+    returns the ids of the new images, raises ValidationError naming the refused files
+    """
+    model,images_changed = RELATIONS[relation]
+    if not files:
+        raise ValidationError({'images':'no image was sent'})
+    errors = {}
+    for file in files:
+        try:
+            check_image(file)
+        except ValueError as error:
+            errors[file.name] = str(error)
+    if errors:
+        raise ValidationError({'error':'no image was added, some files were refused','files':errors})
+
+    #the files are stored first, taking their references, the storage is not transactional
+    #and identical ones are only written once
+    field = model._meta.get_field('img')
+    images = []
+    try:
+        for file in files:
+            image = model(**{f'{relation}_id':owner_id})
+            image.img = field.storage.save(field.generate_filename(image,file.name),file,max_length=field.max_length)
+            images.append(image)
+
+        with transaction.atomic(savepoint=False):
+            model.objects.bulk_create(images)
+            images_changed(owner_id)
+            queue_images(model,[image.id for image in images])
+    except Exception:
+        release([image.img.name for image in images],field.storage)
+        raise
+    return [image.id for image in images]
+
+
+def delete_returning(queryset,field_names):
+    """
+    Delete the rows of a single table queryset with one DELETE ... RETURNING, without the collector
+    returns the values of field_names of the deleted rows, no signal is sent
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    sql,params = queryset.query.chain(DeleteQuery).get_compiler(queryset.db).as_sql()
+    fields = [model._meta.get_field(name) for name in field_names]
+    returning = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} RETURNING {returning}',params)
+        rows = cursor.fetchall()
+    converters = [getattr(field,'from_db_value',None) for field in fields]
+    return [
+        [convert(value,None,connection) if convert else value for convert,value in zip(converters,row)]
+        for row in rows
+    ]
+
+
+def delete_images(relation:str,owner_id:int,image_ids):
+    """
+    Delete the images of the question or reply owner_id among image_ids, ids of other images are ignored
+    returns the number of deleted images
+    """
+    model,images_changed = RELATIONS[relation]
+    images = model.objects.filter(id__in=image_ids,**{f'{relation}_id':owner_id})
+    with transaction.atomic(savepoint=False):
+        #the DELETE locks the rows and returns the files of the ones it deleted, a concurrent deletion
+        #or processing of the same images waits for it and the files are released once
+        deleted = delete_returning(images,['id','img','variants'])
+        if not deleted:
+            return 0
+        release([name for image_id,img,variants in deleted for name in model(img=img,variants=variants).file_names()])
+        images_changed(owner_id)
+    return len(deleted)
@@ -6,10 +6,14 @@ urlpatterns = [
     path('<int:resource_id>/',view=views.get_resource),
     path('author/<int:author_id>/',view=views.get_resources_by_author),
     path('subject/<int:subject_id>/',view=views.get_resources_by_subject),
+    path('tag/',view=views.get_resources_by_tag),
+    path('tags/',view=views.get_tag_counts),
+    path('facets/',view=views.get_resource_facets),
     path('add/',view=views.add_resource),
     path('update/<int:resource_id>/',view=views.update_resource),
     path('delete/<int:resource_id>/',view=views.delete_resource),
     path('report/<int:resource_id>/',view=views.report_resource),
+    path('search/',view=views.search_content),
     #question
     path('question/<int:question_id>/',view=views.get_question),
     path('question/add/',view=views.add_question),
@@ -4,40 +4,133 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from main.models import Resource,Question,Reply,ImageQuestion,ImageReply
-from main.models import ResourceType
-from .serializers import ResourceSerializer,QuestionSerializer,ReplySerializer,ImageQuestionSerializer,ImageReplySerializer
+from main.models import ResourceType,ResourceFacet,SubjectField
+from main.facets import count_facets
+from .serializers import ResourceSerializer,QuestionSerializer,QuestionListSerializer,ReplySerializer,ImageQuestionSerializer,ImageReplySerializer
 from django.shortcuts import get_object_or_404
+from django.http import Http404
 import json
 from main.models import Field
 from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from .pagination import paginate_by_cursor,get_page_size
+from .threads import load_thread,build_reply_tree
+from .reporting import report
+from main.cache import cached_response
+from .uploads import read_images,save_images,delete_images
+from . import search
+from django.db.models import Count,F
+from main.db_routing import replica_reads
+
+
+FEED_TYPES = [ResourceType.EXAM,ResourceType.SUMMARY,ResourceType.NOTES,ResourceType.TEXT_BOOKS,ResourceType.VIDEO]
+NEWEST_FIRST = ('-created_at','-id')
+
+
+def read_feed_parameters(request):
+    """
+    Helper function to read and check the query parameters of the resource feed
+    returns (queryset,resource_type,cursor,limit), resource_type is None when the first page of each type is asked
+    """
+    resource_type = request.GET.get('type',None)
+    cursor = request.GET.get('cursor',None)
+    limit = get_page_size(request)
+    field = request.GET.get('field',None)
+    queryset = Resource.objects.all()
+    if field is not None:
+        if field not in Field.values:
+            raise ValidationError({'field':'this field is not registered within our system'})
+        queryset = queryset.filter(subject__field_links__field=field)
+
+    if resource_type is not None:
+        if resource_type not in ResourceType.values:
+            raise ValidationError({'type':'this resource type is not registered within our system'})
+    elif cursor:
+        raise ValidationError({'cursor':'a cursor can only be used along with a type'})
+    return queryset,resource_type,cursor,limit
+
 
 #get all resources
+@replica_reads
 @api_view(['GET'])
+@cached_response('resources_all')
 def get_all_resources(request):
     """
-    Endpoint: GET /resources/all/
-    Description: Get all resources organized by type
+    Endpoint: GET /resources/all/?type={type}&field={field}&cursor={cursor}&limit={limit}
+    Description: Get resources organized by type, newest first, one cursor-paginated page per type
     Authentication: Not required
-    Response: Dictionary with resources grouped by type (EXAM, SUMMARY, NOTES, TEXT_BOOKS, VIDEO)
-    """
-    resources = Resource.objects.all().order_by('-created_at')
-    #split them by type
-    resources_by_type = {
-        ResourceType.EXAM : [],
-        ResourceType.SUMMARY : [],
-        ResourceType.NOTES : [],
-        ResourceType.TEXT_BOOKS : [],
-        ResourceType.VIDEO : []
-    }
-    for resource in resources:
-        serializer = ResourceSerializer(resource)
-        resources_by_type[resource.type].append(serializer.data)
+    Query Parameters: type (string, optional) - only page through this type (EXAM, SUMMARY, NOTES, TEXT_BOOKS, VIDEO)
+                      field (string, optional) - only resources of the subjects of this field
+                      cursor (string, optional) - next_cursor returned by the previous page, requires type
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"EXAM": {"results": [...], "next_cursor": "string|null"}, "SUMMARY": {...}, ...}
+              or {"results": [...], "next_cursor": "string|null"} when type is given
+    """
+    queryset,resource_type,cursor,limit = read_feed_parameters(request)
+    if resource_type is not None:
+        resources,next_cursor = paginate_by_cursor(queryset.filter(type=resource_type),cursor,limit)
+        serializer = ResourceSerializer(resources,many=True)
+        return Response({'results':serializer.data,'next_cursor':next_cursor},status=status.HTTP_200_OK)
+
+    #first page of each type
+    resources_by_type = {}
+    for resource_type in FEED_TYPES:
+        resources,next_cursor = paginate_by_cursor(queryset.filter(type=resource_type),None,limit)
+        serializer = ResourceSerializer(resources,many=True)
+        resources_by_type[resource_type] = {'results':serializer.data,'next_cursor':next_cursor}
 
     return Response(resources_by_type,status=status.HTTP_200_OK)
 
 
+#browse resources with their counts per type, subject and field
+@replica_reads
+@api_view(['GET'])
+def get_resource_facets(request):
+    """
+    Endpoint: GET /resources/facets/?type={type}&subject={subject_id}&field={field}&cursor={cursor}&limit={limit}
+    Description: Resource counts per type, subject and field, along with the matching resources newest first
+    Authentication: Not required
+    Query Parameters: type (string, optional) - resource type
+                      subject (integer, optional) - Subject ID
+                      field (string, optional) - only resources of the subjects of this field
+                      cursor (string, optional) - next_cursor returned by the previous page
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"facets": {"type": {"EXAM": 3, ...}, "subject": {"1": 2, ...}, "field": {"رياضيات": 4, ...}},
+               "results": [...], "next_cursor": "string|null"}
+    """
+    resources = Resource.objects.all()
+    resource_type = request.GET.get('type',None)
+    subject_id = request.GET.get('subject',None)
+    field = request.GET.get('field',None)
+    if resource_type is not None:
+        if resource_type not in ResourceType.values:
+            raise ValidationError({'type':'this resource type is not registered within our system'})
+        resources = resources.filter(type=resource_type)
+    if subject_id is not None:
+        try:
+            resources = resources.filter(subject=int(subject_id))
+        except ValueError:
+            raise ValidationError({'subject':'subject must be an integer'})
+    if field is not None:
+        if field not in Field.values:
+            raise ValidationError({'field':'this field is not registered within our system'})
+        resources = resources.filter(subject__field_links__field=field)
+
+    if resource_type is None and subject_id is None and field is None:
+        #whole catalogue, read the maintained summary table
+        facets = {dimension:{} for dimension in ResourceFacet.Dimension.values}
+        for dimension,key,count in ResourceFacet.objects.filter(count__gt=0).values_list('dimension','key','count'):
+            facets[dimension][key] = count
+    else:
+        facets = count_facets(resources,SubjectField)
+
+    resources,next_cursor = paginate_by_cursor(resources,request.GET.get('cursor',None),get_page_size(request))
+    serializer = ResourceSerializer(resources,many=True)
+    return Response({'facets':facets,'results':serializer.data,'next_cursor':next_cursor},status=status.HTTP_200_OK)
+
+
 #get a resource by id
+@replica_reads
 @api_view(['GET'])
 def get_resource(request,resource_id:int):
     """
@@ -53,6 +146,7 @@ def get_resource(request,resource_id:int):
 
 
 #get all resources by author
+@replica_reads
 @api_view(['GET'])
 def get_resources_by_author(request,author_id:int):
     """
@@ -60,28 +154,96 @@ def get_resources_by_author(request,author_id:int):
     Description: Get all resources by a specific author
     Authentication: Not required
     Parameters: author_id (integer) - User ID
-    Response: Array of resource objects
+    Response: Array of resource objects, newest first
     """
-    resources = Resource.objects.filter(author=author_id)
+    resources = Resource.objects.filter(author=author_id).order_by(*NEWEST_FIRST)
     serializer = ResourceSerializer(resources,many=True)
     return Response(serializer.data,status=status.HTTP_200_OK)
 
 
 #get all resources by subject
+@replica_reads
 @api_view(['GET'])
+@cached_response('resources_subject',scope_kwarg='subject_id')
 def get_resources_by_subject(request,subject_id:int):
     """
     Endpoint: GET /resources/subject/{subject_id}/
     Description: Get all resources for a specific subject
     Authentication: Not required
     Parameters: subject_id (integer) - Subject ID
-    Response: Array of resource objects
+    Response: Array of resource objects, newest first
     """
-    resources = Resource.objects.filter(subject=subject_id)
+    resources = Resource.objects.filter(subject=subject_id).order_by(*NEWEST_FIRST)
     serializer = ResourceSerializer(resources,many=True)
     return Response(serializer.data,status=status.HTTP_200_OK)
 
 
+def tagged_resources(names):
+    #resources holding every one of the tags
+    resources = Resource.objects.all()
+    for name in names:
+        resources = resources.filter(tags__name=name)
+    return resources
+
+
+#get resources by tag
+@replica_reads
+@api_view(['GET'])
+def get_resources_by_tag(request):
+    """
+    Endpoint: GET /resources/tag/?tag={name}&cursor={cursor}&limit={limit}
+    Description: Get the resources having every given tag, newest first
+    Authentication: Not required
+    Query Parameters: tag (string) - tag name, can be repeated to require several tags
+                      cursor (string, optional) - next_cursor returned by the previous page
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"results": [...], "next_cursor": "string|null"}
+    """
+    names = [' '.join(name.split()) for name in request.GET.getlist('tag')]
+    names = [name for name in names if name]
+    if not names:
+        raise ValidationError({'tag':'at least one tag is required'})
+    resources,next_cursor = paginate_by_cursor(tagged_resources(names),request.GET.get('cursor',None),get_page_size(request))
+    serializer = ResourceSerializer(resources,many=True)
+    return Response({'results':serializer.data,'next_cursor':next_cursor},status=status.HTTP_200_OK)
+
+
+#count resources per tag
+@replica_reads
+@api_view(['GET'])
+def get_tag_counts(request):
+    """
+    Endpoint: GET /resources/tags/?subject={subject_id}&type={type}&limit={limit}
+    Description: Number of resources of each tag, most used first
+    Authentication: Not required
+    Query Parameters: subject (integer, optional) - only count resources of this subject
+                      type (string, optional) - only count resources of this type
+                      limit (integer, optional) - number of tags, default 20, max 100
+    Response: [{"name": "string", "count": 3}, ...]
+    """
+    links = Resource.tags.through.objects.all()
+    subject_id = request.GET.get('subject',None)
+    resource_type = request.GET.get('type',None)
+    if subject_id is not None:
+        try:
+            links = links.filter(resource__subject=int(subject_id))
+        except ValueError:
+            raise ValidationError({'subject':'subject must be an integer'})
+    if resource_type is not None:
+        if resource_type not in ResourceType.values:
+            raise ValidationError({'type':'this resource type is not registered within our system'})
+        links = links.filter(resource__type=resource_type)
+
+    #one grouped query over the resource/tag links
+    counts = (
+        links.values('tag__name')
+        .annotate(count=Count('resource'))
+        .order_by('-count','tag__name')[:get_page_size(request)]
+    )
+    tags = [{'name':row['tag__name'],'count':row['count']} for row in counts]
+    return Response(tags,status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_resource(request):
@@ -145,6 +307,21 @@ def delete_resource(request,resource_id:int):
 #ensure throttling for this end point
 from .throttling import ResourceReportThrottle
 from rest_framework.decorators import throttle_classes
+import math
+
+
+def rate_limit_exceeded(throttle,detail:str):
+    """
+    Helper function to build the 429 response of a report throttle, with the real remaining wait
+    """
+    response = Response({
+        'error': 'Rate limit exceeded',
+        'detail': detail
+    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    wait = throttle.wait()
+    if wait is not None:
+        response['Retry-After'] = str(math.ceil(wait))
+    return response
 
 
 #@throttle_classes([ResourceReportThrottle])
@@ -160,13 +337,9 @@ def report_resource(request,resource_id:int):
     #apply the throttle (since the end point is not authenticated we need to call it manually)
     throttle = ResourceReportThrottle()
     if not throttle.allow_request(request, None):
-        return Response({
-            'error': 'Rate limit exceeded',
-            'detail': 'You can only report this resource once per day'
-        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-    resource = get_object_or_404(Resource,id=resource_id)
-    resource.add_report()
-    resource.save()
+        return rate_limit_exceeded(throttle,'You can only report this resource once per day')
+    if report('resource',resource_id) is None:
+        raise Http404
     return Response({'detail': 'Resource reported successfully'},status=status.HTTP_200_OK)
 
 
@@ -191,6 +364,7 @@ def add_question(request):
         return Response(question_ser.errors,status=status.HTTP_400_BAD_REQUEST)
 
 
+@replica_reads
 @api_view(['GET'])
 def get_question(request,question_id:int):
     """
@@ -258,44 +432,60 @@ def report_question(request,question_id:int):
     """
     throttle = QuestionReportThrottle()
     if not throttle.allow_request(request,None):
-        return Response({
-            'error': 'Rate limit exceeded',
-            'detail': 'You can only report this question once per 2 h'
-        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-    question = get_object_or_404(Question,id=question_id)
-    question.add_report()
-    #question.save()
+        return rate_limit_exceeded(throttle,'You can only report this question once per 2 h')
+    if report('question',question_id) is None:
+        raise Http404
     return Response({'detail': 'Question reported successfully'},status=status.HTTP_200_OK)
 
 
+def question_list(questions):
+    #the images and author_username of QuestionListSerializer
+    return questions.prefetch_related('images').annotate(author_username=F('author__username'))
+
+
+def question_page(request,questions):
+    """
+    Helper function to build a page of a question list in two queries whatever its size:
+    the questions with their author and activity counters, then their images
+    """
+    questions,next_cursor = paginate_by_cursor(question_list(questions),request.GET.get('cursor',None),get_page_size(request),'date_posted')
+    serializer = QuestionListSerializer(questions,many=True)
+    return Response({'results':serializer.data,'next_cursor':next_cursor},status=status.HTTP_200_OK)
+
+
 #get all questions by subject
+@replica_reads
 @api_view(['GET'])
+@cached_response('questions_subject',scope_kwarg='subject_id')
 def get_question_by_subject(request,subject_id:int):
     """
-    Endpoint: GET /resources/question/subject/{subject_id}/
-    Description: Get all questions for a specific subject
+    Endpoint: GET /resources/question/subject/{subject_id}/?cursor={cursor}&limit={limit}
+    Description: Get the questions of a specific subject, newest first
     Authentication: Not required
     Parameters: subject_id (integer) - Subject ID
-    Response: Array of question objects
+    Query Parameters: cursor (string, optional) - next_cursor returned by the previous page
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"results": [...], "next_cursor": "string|null"}, each question with its images,
+              author_username, reply_count and last_activity
     """
-    questions = Question.objects.filter(subject=subject_id)
-    serializer = QuestionSerializer(questions,many=True)
-    return Response(serializer.data,status=status.HTTP_200_OK)
+    return question_page(request,Question.objects.filter(subject=subject_id))
 
 
 #get all questions by author
+@replica_reads
 @api_view(['GET'])
 def get_questions_by_author(request,author_id:int):
     """
-    Endpoint: GET /resources/question/author/{author_id}/
-    Description: Get all questions by a specific author
+    Endpoint: GET /resources/question/author/{author_id}/?cursor={cursor}&limit={limit}
+    Description: Get the questions of a specific author, newest first
     Authentication: Not required
     Parameters: author_id (integer) - User ID
-    Response: Array of question objects
+    Query Parameters: cursor (string, optional) - next_cursor returned by the previous page
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"results": [...], "next_cursor": "string|null"}, each question with its images,
+              author_username, reply_count and last_activity
     """
-    questions = Question.objects.filter(author=author_id)
-    serializer = QuestionSerializer(questions,many=True)
-    return Response(serializer.data,status=status.HTTP_200_OK)
+    return question_page(request,Question.objects.filter(author=author_id))
 
 
 @api_view(['POST'])
@@ -318,17 +508,41 @@ def add_reply(request):
         return Response(reply_ser.errors,status=status.HTTP_400_BAD_REQUEST)
 
 
+REPLY_PATHS_MISSING = 'the replies of this reply are not indexed yet, run "manage.py backfill_reply_paths"'
+
+
+@replica_reads
 @api_view(['GET'])
 def get_reply(request,reply_id:int):
     """
     Endpoint: GET /resources/reply/{reply_id}/
-    Description: Get a specific reply by ID
+    Description: Get a specific reply by ID with its subtree
     Authentication: Not required
     Parameters: reply_id (integer) - Reply ID
+    Query Parameters: depth (integer, optional) - only include replies up to this many levels below
+                      count (boolean, optional) - only return the number of descendants
     Response: Reply object with nested children
+              or {"id": 1, "descendants_count": 3} when count is given
+              409 while the reply paths haven't been backfilled
     """
     reply = get_object_or_404(Reply,id=reply_id)
-    serializer = ReplySerializer(reply)
+    if not reply.path:
+        return Response({'error':REPLY_PATHS_MISSING},status=status.HTTP_409_CONFLICT)
+    if request.GET.get('count','').lower() in ('1','true'):
+        count = reply.get_subtree(include_self=False).count()
+        return Response({'id':reply.id,'descendants_count':count},status=status.HTTP_200_OK)
+
+    max_depth = request.GET.get('depth',None)
+    if max_depth is not None:
+        try:
+            max_depth = int(max_depth)
+        except ValueError:
+            raise ValidationError({'depth':'depth must be an integer'})
+        if max_depth < 0:
+            raise ValidationError({'depth':'depth must be a positive integer'})
+    replies = list(reply.get_subtree(max_depth=max_depth).prefetch_related('images').order_by('path'))
+    roots,children = build_reply_tree(replies)
+    serializer = ReplySerializer(roots[0],context={'reply_children':children})
     return Response(serializer.data,status=status.HTTP_200_OK)
 
 
@@ -349,6 +563,11 @@ def update_reply(request,reply_id:int):
     serializer = ReplySerializer(reply,data=request.data,partial=True)
     if serializer.is_valid():
         serializer.save()
+        #the response nests the whole subtree, load it at once
+        #(a reply without its path yet loads its replies level by level)
+        if reply.path:
+            replies = list(reply.get_subtree().prefetch_related('images').order_by('path'))
+            serializer.context['reply_children'] = build_reply_tree(replies)[1]
         return Response(serializer.data,status=status.HTTP_200_OK)  
     return Response(serializer.errors,status=status.HTTP_400_BAD_REQUEST)
 
@@ -382,61 +601,45 @@ def report_reply(request,reply_id:int):
     """
     throttle = ReplyReportThrottle()
     if not throttle.allow_request(request,None):
-        return Response({
-            'error': 'Rate limit exceeded',
-            'detail': 'You can only report this reply once per 2 h'
-        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
-    reply = get_object_or_404(Reply,id=reply_id)
-    reply.add_report()
+        return rate_limit_exceeded(throttle,'You can only report this reply once per 2 h')
+    if report('reply',reply_id) is None:
+        raise Http404
     return Response({'detail': 'Reply reported successfully'},status=status.HTTP_200_OK)
 
 
+@replica_reads
 @api_view(['GET'])
+@cached_response('replies_question',scope_kwarg='question_id')
 def get_replies_by_question(request,question_id:int):
     """
     Endpoint: GET /resources/reply/question/{question_id}/
-    Description: Get all replies for a specific question
+    Description: Get the reply thread of a specific question
     Authentication: Not required
     Parameters: question_id (integer) - Question ID
-    Response: Array of reply objects
+    Response: Array of top-level reply objects, each with its nested replies
     """
-    replies = Reply.objects.filter(question=question_id)
-    replies_ser = ReplySerializer(replies,many=True)
+    roots,children = load_thread(question_id)
+    replies_ser = ReplySerializer(roots,many=True,context={'reply_children':children})
     return Response(replies_ser.data,status=status.HTTP_200_OK)
 
 
 #handling images
-def create_images(rel,rel_id,images,SERIALIZER):
-    errors = False
-    for image in images:
-        image_ser = SERIALIZER(data={'img':image,f'{rel}':rel_id})
-        if image_ser.is_valid():
-            image_ser.save()
-        else:
-            print(image_ser.errors)
-            errors = True
-    return errors
-
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_images_to_qst(request,qst_id):
     """
     Endpoint: POST /resources/question/images/{qst_id}/upload/
-    Description: Upload images to a question (only by author or staff)
+    Description: Upload images to a question (only by author or staff), all of them are added or none
     Authentication: Required
     Parameters: qst_id (integer) - Question ID
     Request Body: FormData with 'images' field containing multiple image files
-    Response: {"details": "the images have been added successfully"}
+    Response: {"details": "the images have been added successfully", "images": [ids]}
     """
     question = get_object_or_404(Question,id=qst_id)
     if question.author != request.user and not request.user.is_staff:
         return Response({'error': 'You are not the author of this reply'},status=status.HTTP_403_FORBIDDEN)
-    images = request.FILES.getlist('images')
-
-    if create_images('question',qst_id,images,ImageQuestionSerializer):
-        return Response({'error': 'There were some issues adding some images'},status=status.HTTP_400_BAD_REQUEST)
-    return Response({'details':'the images have been added successfully'},status=status.HTTP_201_CREATED)
+    images = save_images('question',qst_id,read_images(request))
+    return Response({'details':'the images have been added successfully','images':images},status=status.HTTP_201_CREATED)
 
 
 @api_view(['POST'])
@@ -444,22 +647,20 @@ def add_images_to_qst(request,qst_id):
 def add_images_to_reply(request,reply_id):
     """
     Endpoint: POST /resources/reply/images/{reply_id}/upload/
-    Description: Upload images to a reply (only by author or staff)
+    Description: Upload images to a reply (only by author or staff), all of them are added or none
     Authentication: Required
     Parameters: reply_id (integer) - Reply ID
     Request Body: FormData with 'images' field containing multiple image files
-    Response: {"details": "the images have been added successfully"}
+    Response: {"details": "the images have been added successfully", "images": [ids]}
     """
     reply = get_object_or_404(Reply,id=reply_id)
     if reply.author != request.user and not request.user.is_staff:
         return Response({'error': 'You are not the author of this reply'},status=status.HTTP_403_FORBIDDEN)
-    images = request.FILES.getlist('images')
-
-    if create_images('reply',reply_id,images,ImageReplySerializer):
-        return Response({'error': 'There were some issues adding some images'},status=status.HTTP_400_BAD_REQUEST)
-    return Response({'details':'the images have been added successfully'},status=status.HTTP_201_CREATED)
+    images = save_images('reply',reply_id,read_images(request))
+    return Response({'details':'the images have been added successfully','images':images},status=status.HTTP_201_CREATED)
 
 
+@replica_reads
 @api_view(['GET'])
 def get_qst_images(request,qst_id):
     """
@@ -474,6 +675,7 @@ def get_qst_images(request,qst_id):
     return Response(images_ser.data)
 
 
+@replica_reads
 @api_view(['GET'])
 def get_reply_images(request,reply_id):
     """
@@ -493,7 +695,7 @@ def get_reply_images(request,reply_id):
 def delete_qst_images(request,qst_id):
     """
     Endpoint: DELETE /resources/question/images/{qst_id}/delete/
-    Description: Delete images from a question (only by author or staff)
+    Description: Delete images from a question (only by author or staff), ids of other questions' images are ignored
     Authentication: Required
     Parameters: qst_id (integer) - Question ID
     Request Body: {"images_ids": [1,2,3]}
@@ -511,11 +713,8 @@ def delete_qst_images(request,qst_id):
     except:
         raise ValidationError('your images_ids did not respect the format List[int]')
 
-    images_to_delete = ImageQuestion.objects.filter(id__in=images_ids)
-
-    for image in images_to_delete:
-        image.img.delete(save=False)
-        image.delete()
+    #one DELETE, the files are removed in the background once no other image uses them
+    delete_images('question',qst_id,images_ids)
     return Response({'details':'the images have been deleted successfully'},status=status.HTTP_204_NO_CONTENT)
 
 
@@ -524,7 +723,7 @@ def delete_qst_images(request,qst_id):
 def delete_reply_images(request,reply_id):
     """
     Endpoint: DELETE /resources/reply/images/{reply_id}/delete/
-    Description: Delete images from a reply (only by author or staff)
+    Description: Delete images from a reply (only by author or staff), ids of other replies' images are ignored
     Authentication: Required
     Parameters: reply_id (integer) - Reply ID
     Request Body: {"images_ids": [1,2,3]}
@@ -542,9 +741,69 @@ def delete_reply_images(request,reply_id):
     except:
         raise ValidationError('your images_ids did not respect the format List[int]')
     
-    images_to_delete = ImageReply.objects.filter(id__in=images_ids)
+    #one DELETE, the files are removed in the background once no other image uses them
+    delete_images('reply',reply_id,images_ids)
+    return Response({'details':'the images have been deleted successfully'},status=status.HTTP_204_NO_CONTENT)
 
-    for image in images_to_delete:
-        image.img.delete(save=False)
-        image.delete()
-    return Response({'details':'the images have been deleted successfully'},status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+
+#search
+@replica_reads
+@api_view(['GET'])
+def search_content(request):
+    """
+    Endpoint: GET /resources/search/?q={query}&kind={kinds}&subject={subject_id}&type={type}&field={field}&page={page}&limit={limit}
+    Description: Ranked full-text search over resources, questions and replies
+    Authentication: Not required
+    Query Parameters: q (string) - words to look for, the last one can be incomplete
+                      kind (string, optional) - comma separated kinds to search: resource, question, reply
+                      subject (integer, optional) - Subject ID
+                      type (string, optional) - resource type, only resources are returned
+                      field (string, optional) - only content of the subjects of this field
+                      page (integer, optional) - default 1
+                      limit (integer, optional) - page size, default 20, max 100
+    Response: {"count": 42, "page": 1, "results": [{"kind": "resource", "data": {...}}, ...]}
+    """
+    query = request.GET.get('q','').strip()
+    if not query:
+        raise ValidationError({'q':'a search query is required'})
+    kinds = request.GET.get('kind',None)
+    kinds = kinds.split(',') if kinds else search.KINDS
+    if any(kind not in search.KINDS for kind in kinds):
+        raise ValidationError({'kind':f'kind must be one of {", ".join(search.KINDS)}'})
+    subject_id = request.GET.get('subject',None)
+    resource_type = request.GET.get('type',None)
+    field = request.GET.get('field',None)
+    try:
+        subject_id = int(subject_id) if subject_id is not None else None
+        page = int(request.GET.get('page',1))
+    except ValueError:
+        raise ValidationError('subject and page must be integers')
+    if page < 1:
+        raise ValidationError({'page':'page must be a positive integer'})
+    if resource_type is not None and resource_type not in ResourceType.values:
+        raise ValidationError({'type':'this resource type is not registered within our system'})
+    if field is not None and field not in Field.values:
+        raise ValidationError({'field':'this field is not registered within our system'})
+    limit = get_page_size(request)
+
+    total,hits = search.search(query,kinds,subject_id,resource_type,field,offset=(page-1)*limit,limit=limit)
+
+    #load the hits of each kind at once
+    ids = {kind:[obj_id for hit_kind,obj_id in hits if hit_kind == kind] for kind in search.KINDS}
+    serialized = {}
+    if ids[search.RESOURCE]:
+        resources = Resource.objects.filter(id__in=ids[search.RESOURCE])
+        for data in ResourceSerializer(resources,many=True).data:
+            serialized[(search.RESOURCE,data['id'])] = data
+    if ids[search.QUESTION]:
+        questions = Question.objects.filter(id__in=ids[search.QUESTION]).prefetch_related('images')
+        for data in QuestionSerializer(questions,many=True).data:
+            serialized[(search.QUESTION,data['id'])] = data
+    if ids[search.REPLY]:
+        replies = Reply.objects.filter(id__in=ids[search.REPLY]).prefetch_related('images')
+        #replies are returned without their children
+        for data in ReplySerializer(replies,many=True,context={'reply_children':{}}).data:
+            serialized[(search.REPLY,data['id'])] = data
+
+    results = [{'kind':kind,'data':serialized[(kind,obj_id)]} for kind,obj_id in hits if (kind,obj_id) in serialized]
+    return Response({'count':total,'page':page,'results':results},status=status.HTTP_200_OK)
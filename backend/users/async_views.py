@@ -0,0 +1,20 @@
+"""
+Async variants of the public read endpoints of users.views, routed by bac_hub.urls_async.
+"""
+from django.shortcuts import aget_object_or_404
+from authentication.serializers import ProfileSerializer
+from main.asyncapi import async_api_view
+from main.db_routing import replica_reads
+from main.models import Profile
+
+
+@replica_reads
+@async_api_view
+async def get_profile(request,profile_id:int):
+    """
+    Endpoint: GET /users/profile/{profile_id}/
+    Description: Async variant of users.views.get_profile, same parameters and response
+    Authentication: Not required
+    """
+    profile = await aget_object_or_404(Profile.objects.select_related('user'),id=profile_id)
+    return ProfileSerializer(profile).data
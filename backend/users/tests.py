@@ -1,3 +1,20 @@
 from django.test import TestCase
+from main.tests import QueryBudgetMixin
+from main.models import Profile
 
 # Create your tests here.
+
+
+class UsersQueryBudgetTests(QueryBudgetMixin,TestCase):
+    urls_module = 'users.urls'
+
+    def budget_requests(self):
+        user = self.data['users'][0]
+        profile = Profile.objects.get(user=user)
+        return [
+            ('GET','profile/me/view/','/users/profile/me/view/',2,{'user':user}),
+            ('PUT','profile/me/update/','/users/profile/me/update/',3,{'user':user,'data':{'city':'Oran'}}),
+            ('GET','profile/all/','/users/profile/all/',1,{}),
+            ('GET','profile/<int:profile_id>/',f'/users/profile/{profile.id}/',1,{}),
+            ('GET','profile/current_user/','/users/profile/current_user/',1,{'user':user}),
+        ]
@@ -7,6 +7,7 @@ from rest_framework.decorators import permission_classes
 from authentication.serializers import ProfileSerializer
 from main.models import Profile
 from django.shortcuts import get_object_or_404
+from main.db_routing import replica_reads
 
 
 
@@ -49,6 +50,7 @@ def update_my_profile(request):
 
 
     
+@replica_reads
 @api_view(['GET'])
 def get_all_profiles(request):
     """
@@ -57,12 +59,13 @@ def get_all_profiles(request):
     Authentication: Not required
     Response: Array of profile objects
     """
-    profiles = Profile.objects.all()
+    profiles = Profile.objects.select_related('user')
     serializer = ProfileSerializer(profiles,many=True)
     return Response(serializer.data,status=status.HTTP_200_OK)
 
 
 
+@replica_reads
 @api_view(['GET'])
 def get_profile(request,profile_id:int):
     """
@@ -72,7 +75,7 @@ def get_profile(request,profile_id:int):
     Parameters: profile_id (integer) - Profile ID
     Response: Profile object
     """
-    profile = get_object_or_404(Profile,id=profile_id)
+    profile = get_object_or_404(Profile.objects.select_related('user'),id=profile_id)
     serializer = ProfileSerializer(profile)
     return Response(serializer.data,status=status.HTTP_200_OK)
 